@@ -11,6 +11,10 @@ This script is used to perform statistical analysis on data retrieved from scrip
     @param <filename.csv>: at the beginning of the script change the file name to
             associate the running of the script with the desired CSV file. It includes
             processing both for PCB device data and Sentec device data
+    @param <flag_columnar_store>: if 1 the tables are read from the columnar session
+            store (see the module <Session_store>) instead of the CSV files.
+    @param <flag_headless>: if 1 the figures are not displayed: they are written to the
+            directory Figures (see the module <Figure_rendering>), for unattended runs.
     @param <subject_id>: subject that has to be considered in the exponential fitting 
             part of the script.
 ------------------------------------------------------------------------------------------
@@ -31,6 +35,9 @@ from sklearn import metrics
 from scipy import stats
 import math
 import scipy
+from Session_store import read_table, start_index
+from Cohort_statistics import cohort_mean, cohort_sum, cohort_std
+from Figure_rendering import use_headless_backend, show_figures
 
 # Importing dataframe
 print("-------------------------------------------------------------------------")
@@ -38,6 +45,11 @@ print("------------------------------- New run ---------------------------------
 print("-------------------------------------------------------------------------")
 
 subject_id = 0
+flag_columnar_store = 0  # 1 to use the columnar session store
+flag_headless = 0  # 1 to save the figures without displaying them
+
+if(flag_headless):
+    use_headless_backend()
 
 '''
 ---------------------------------------------------------------------------------
@@ -48,8 +60,12 @@ Dataframes to be considered are separately for Lobe and forearm.
 Merge dataset is used for statistical analysis in a related script
 ---------------------------------------------------------------------------------
 '''
-df_pcb = pd.read_csv('CO2_df_30_median_L.csv', sep=";")
-df_sentec = pd.read_csv('Sentec_df_30_median_L.csv', sep=";")
+if(flag_columnar_store):
+    df_pcb = read_table('CO2_df_30_median_L')
+    df_sentec = read_table('Sentec_df_30_median_L')
+else:
+    df_pcb = pd.read_csv('CO2_df_30_median_L.csv', sep=";")
+    df_sentec = pd.read_csv('Sentec_df_30_median_L.csv', sep=";")
 
 # Importing CPET CSV; first row has not to be considered as header
 df_cpet = pd.read_csv('CPET_L_T.csv', sep=";", header=None)
@@ -124,14 +140,14 @@ plt.axvline(x=end_cpet, color='coral')
 
 plt.legend(['CPET', 'Start rebreathing',
            'End rebreathing'], loc="upper left")
-plt.show()
+show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis')
 
 #################################################################################
 #                           PCB device and Sentec                               #
 #################################################################################
 
 # Rebreathing index identification
-index_start_rebreathing = df_pcb[df_pcb["28_01L"] == "START"].index.values
+index_start_rebreathing = start_index(df_pcb, "28_01L")
 print("\nIndex start rebreathing: ")
 print(index_start_rebreathing)
 
@@ -150,9 +166,9 @@ print("\n\nBaseline array Sentec: ")
 print(baseline_arr_sentec)
 
 # START row removal
-df_pcb = df_pcb.drop(index_start_rebreathing, axis=0)
+df_pcb = df_pcb.drop(index_start_rebreathing, axis=0, errors='ignore')
 df_pcb = df_pcb.reset_index()
-df_sentec = df_sentec.drop(index_start_rebreathing, axis=0)
+df_sentec = df_sentec.drop(index_start_rebreathing, axis=0, errors='ignore')
 df_sentec = df_sentec.reset_index()
 #print("\n\nDataframe PCB without START row:")
 # print(df_pcb)
@@ -261,45 +277,14 @@ print("\nSentec Delta values from baseline: ")
 print(delta_sentec)
 print("------------------------------------------------------------------------------------")
 '''
-# Generation of a unique array for aggregated analysis
-arr_sum_device = []
-arr_sum_sentec = []
-arr_sum_device_delta = []
-arr_sum_sentec_delta = []
-arr_sum_device_normalized = []
-arr_sum_sentec_normalized = []
-partial_total_device = 0
-partial_total_sentec = 0
-partial_total_device_delta = 0
-partial_total_sentec_delta = 0
-partial_total_device_normalized = 0
-partial_total_sentec_normalized = 0
-
-for j in range(0, rows, 1):
-    for i in range(0, columns, 1):
-        partial_total_device += round(float(Data_matrix[i][j]), 2)
-        partial_total_sentec += round(float(Data_matrix_sentec[i][j]), 2)
-        partial_total_device_delta += round(float(delta_matrix_pcb[i][j]), 2)
-        partial_total_sentec_delta += round(
-            float(delta_matrix_sentec[i][j]), 2)
-        partial_total_device_normalized += round(
-            float(delta_matrix_pcb_normalized[i][j]), 2)
-        partial_total_sentec_normalized += round(
-            float(delta_matrix_sentec_normalized[i][j]), 2)
-
-    # print(Data_matrix[i][j])
-    arr_sum_device.append(round(partial_total_device/columns, 2))
-    arr_sum_sentec.append(round(partial_total_sentec/columns, 2))
-    arr_sum_device_delta.append(round(partial_total_device_delta/columns, 2))
-    arr_sum_sentec_delta.append(round(partial_total_sentec_delta/columns, 2))
-    arr_sum_device_normalized.append(round(partial_total_device_normalized, 2))
-    arr_sum_sentec_normalized.append(round(partial_total_sentec_normalized, 2))
-    partial_total_device = 0
-    partial_total_sentec = 0
-    partial_total_device_delta = 0
-    partial_total_sentec_delta = 0
-    partial_total_device_normalized = 0
-    partial_total_sentec_normalized = 0
+# Generation of a unique array for aggregated analysis (per-timepoint cohort
+# statistics, see the module <Cohort_statistics>)
+arr_sum_device = cohort_mean(Data_matrix)
+arr_sum_sentec = cohort_mean(Data_matrix_sentec)
+arr_sum_device_delta = cohort_mean(delta_matrix_pcb)
+arr_sum_sentec_delta = cohort_mean(delta_matrix_sentec)
+arr_sum_device_normalized = cohort_sum(delta_matrix_pcb_normalized)
+arr_sum_sentec_normalized = cohort_sum(delta_matrix_sentec_normalized)
 
 '''
 print("\n\nArray of the sum:")
@@ -548,24 +533,10 @@ plt.legend(['Median values', 'Start rebreathing',
            'End rebreathing'], loc="upper left")
 
 # Standard deviation computation
-arr_row = []
-std_arr = []
-count = 0
-for j in range(0, rows, 1):
-    for i in range(0, columns, 1):
-        arr_row.append(round(float(Data_matrix[i][j]), 2))
-    std_arr.append(round(stat.stdev(arr_row), 2))
-    count += 1
-    # print("Standard Deviation of sample %s is % s " % (count, std_arr[j]))
-    arr_row = []
-    # print(arr_row)
+std_arr = cohort_std(Data_matrix)
 
 # Mean standard deviation
-total_std = 0
-average_std = 0
-for i in range(0, len(std_arr), 1):
-    total_std += std_arr[i]
-average_std = round(float(total_std/len(std_arr)), 2)
+average_std = round(float(np.mean(std_arr)), 2)
 print("\n\nAverage std: %s" % average_std)
 
 # Plot with standard deviation
@@ -1304,4 +1275,4 @@ plt.grid(axis='y')
 plt.legend(['Raw PCB device data - DELTA', 'Fitted curve', 'Start rebreathing', 'Physiological delay',
            'Sensors delay'], loc="lower right")
 
-plt.show()
+show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis')
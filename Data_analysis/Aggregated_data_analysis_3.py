@@ -18,6 +18,13 @@ Forearm data and functions for various things (listed at the beginning of the sc
             data (0) are considered.
     @param <flag_30seconds>: to differentiate between 30s median computation (1) and 10s
             median computation (0).
+    @param <flag_columnar_store>: if 1 the tables are read from (and written to) the
+            columnar session store (see the module <Session_store>) instead of the CSV
+            files. CSV files are still written for compatibility.
+    @param <flag_zero_phase>: if 1 the PCB device data are filtered forward and backward
+            (zero phase), otherwise with the causal filter (see the module <Filtering>).
+    @param <flag_headless>: if 1 the figures are not displayed: they are written to the
+            directory Figures (see the module <Figure_rendering>), for unattended runs.
 ------------------------------------------------------------------------------------------
 '''
 
@@ -36,7 +43,12 @@ from sklearn import metrics
 from scipy import stats
 import math
 import scipy
-from scipy.signal import butter, lfilter, freqz
+from Session_store import read_table, write_table, start_index
+from Subject_matrix import SubjectMatrix
+from Figure_rendering import plot_data, use_headless_backend, show_figures
+from Filtering import lowpass_filter
+from Cpet import CpetTable, cohort_alignment
+from Bland_altman import device_agreement, plot_agreement
 import statsmodels.api as sm
 
 # Importing dataframe
@@ -47,6 +59,12 @@ print("-------------------------------------------------------------------------
 subject_id = 5
 flag_lobo = 0  # 0 if forearm
 flag_30seconds = 1  # 0 if 10 seconds
+flag_columnar_store = 0  # 1 to use the columnar session store
+flag_zero_phase = 0  # 1 for zero phase filtering
+flag_headless = 0  # 1 to save the figures without displaying them
+
+if(flag_headless):
+    use_headless_backend()
 
 '''
 ---------------------------------------------------------------------------------
@@ -57,8 +75,12 @@ Dataframes to be considered are separately for Lobe and forearm.
 Merge dataset is used for statistical analysis in a related script
 ---------------------------------------------------------------------------------
 '''
-df_pcb = pd.read_csv('CO2_df_30_median_P.csv', sep=";")
-df_sentec = pd.read_csv('Sentec_df_30_median_P.csv', sep=";")
+if(flag_columnar_store):
+    df_pcb = read_table('CO2_df_30_median_P')
+    df_sentec = read_table('Sentec_df_30_median_P')
+else:
+    df_pcb = pd.read_csv('CO2_df_30_median_P.csv', sep=";")
+    df_sentec = pd.read_csv('Sentec_df_30_median_P.csv', sep=";")
 
 # Importing CPET CSV; first row has not to be considered as header
 df_cpet = pd.read_csv('CPET_P_T.csv', sep=";", header=None)
@@ -72,140 +94,35 @@ Here there is the list and implementation of functions used throught the script
 
 '''
 
-################ PLOT DATA #################
-# \brief: Function that is used to plot data.
-# \parameters:
-#   @param <figure_id>: figure number to be opened
-#   @param <x>: x-axis array
-#   @param <y>: y-axis array
-#   @param <title>: string containing the plot's title
-#   @param <xlabel>: string containing the x-axis label
-#   @param <xlabel>: string containing the y-axis label
-#   @param <legend>: array of strings containing the legend
-#   @param <legend_location>: legend location
-#   @param <style>: line style. If put to NONE, by default it will be black and continuous
-#   @param <color>: color of the plot
-#   @param <linewidth>: thickness of the plot
-#   @param <gridx>: array to setup the x-axis grid
-#   @param <ygrid>: boolean, TRUE or FALSE
-#   @param <start_rebr>: rebreathing starting index
-#   @param <end_rebr>: rebreathing ending index
-# \return NONE
-#############################################
-
-
-def plot_data(figure_id, x, y, title, xlabel, ylabel, legend, legend_location, style, color, linewidth, gridx, ygrid, start_rebr, end_rebr):
-    plt.figure(figure_id)
-    y1 = y
-    x1 = x
-    plt.title(title)
-    if(style == NONE):
-        plt.plot(x1, y1, color, linewidth=linewidth)
-    else:
-        plt.plot(x1, y1, style, color=color, linewidth=linewidth)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    if(ygrid == TRUE):
-        plt.grid(axis='y')
-    # ---------If seconds are needed------------
-    # plt.axvline(x=(index_start_rebreathing-offset-1)
-    #            * 30 + time_stamp + 30, color='gold')
-    # plt.axvline(x=(index_start_rebreathing-offset+3)
-    #           * 30 + time_stamp + 30, color='coral')
-    # ---------If minutes are needed------------
-    plt.axvline(x=start_rebr, color='gold')
-    plt.axvline(x=end_rebr, color='coral')
-    if(gridx != NONE):
-        plt.xticks(gridx)
-
-    plt.legend(legend, loc=legend_location)
-
-
-################ Butterworth Low-Pass #################
-# \brief: Function that calls a Butterworth low pass filter.
-# \parameters:
-#   @param <figure_id>: figure number to be opened
-#   @param <x>: x-axis array
-#   @param <y>: y-axis array
-#   @param <title>: string containing the plot's title
-#   @param <xlabel>: string containing the x-axis label
-#   @param <xlabel>: string containing the y-axis label
-#   @param <legend>: array of strings containing the legend
-#   @param <legend_location>: legend location
-#   @param <style>: line style. If put to NONE, by default it will be black and continuous
-#   @param <color>: color of the plot
-#   @param <linewidth>: thickness of the plot
-#   @param <gridx>: array to setup the x-axis grid
-#   @param <ygrid>: boolean, TRUE or FALSE
-#   @param <start_rebr>: rebreathing starting index
-#   @param <end_rebr>: rebreathing ending index
-# \return butterworth filter
-######################################################
-def butter_lowpass(cutoff, fs, order=5):
-    return butter(order, cutoff, fs=fs, btype='low', analog=False)
-
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = lfilter(b, a, data)
-    return y
-
 #################################################################################
 #                                       CPET                                    #
 #################################################################################
 
 
-# CPET columns indexes
-columns_cpet = []
-for i in range(0, len(df_cpet.columns), 1):
-    columns_cpet.append(i)
-
-df_cpet.columns = columns_cpet
+# All the subjects parsed at once: breaths without markers, breaths before START and END
+# (see the module <Cpet>)
+cpet_table = CpetTable.from_dataframe(df_cpet)
 print("\n\nCPET Dataframe:")
 print(df_cpet)
 
 # CPET plots for selected subject (0 is S01)
-subject_cpet = df_cpet.iloc[subject_id]
-
-# Dropping NANs
-subject_cpet = subject_cpet.dropna()
-
-# Dropping subject label
-subject_cpet = subject_cpet.drop(0)
-print("\n\nSelected subject's CPET:")
-print(subject_cpet)
-print(type(subject_cpet))
-
-array_subject_cpet = subject_cpet.values
-
-for i in range(0, len(array_subject_cpet), 1):
-    if(array_subject_cpet[i] == 'START'):
-        start_cpet = i
-    if(array_subject_cpet[i] == 'END'):
-        end_cpet = i
+array_subject_cpet = cpet_table.breaths(subject_id)
+start_cpet = cpet_table.start[subject_id]
+end_cpet = cpet_table.end[subject_id]
 
 print("\n\nIndex start CPET:")
 print(start_cpet)
 print("\n\nIndex end CPET:")
 print(end_cpet)
-
-# +1 because of first row dropping at the beginning
-drop_cpet = [start_cpet+1, end_cpet+1]
-
-subject_cpet = subject_cpet.drop(drop_cpet)
-array_subject_cpet = subject_cpet.values
-array_subject_cpet = array_subject_cpet.astype(float)
 print(array_subject_cpet)
-breaths = []
-for i in range(0, len(array_subject_cpet), 1):
-    breaths.append(i)
+breaths = np.arange(len(array_subject_cpet))
 
 plot_data(28, breaths, array_subject_cpet, "End-tidal CO2 partial pressure",
           'Breaths count', 'EtCO2 [mmHg]',
           ['CPET', 'Start rebreathing',
            'End rebreathing'], "upper left", NONE, 'k', '1',  NONE, TRUE, start_cpet, end_cpet)
 
-plt.show()
+show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
 
 #################################################################################
 #                           PCB device and Sentec                               #
@@ -213,121 +130,59 @@ plt.show()
 
 # Rebreathing index identification
 if(flag_lobo):
-    index_start_rebreathing = df_pcb[df_pcb["28_01L"] == "START"].index.values
+    index_start_rebreathing = start_index(df_pcb, "28_01L")
     print("\nIndex start rebreathing: ")
     print(index_start_rebreathing)
 
-    # Baseline array extraction
-    baseline_arr_PCB = []
-    baseline_arr_sentec = []
-    for i in range(0, len(df_pcb.columns), 1):
-        baseline_arr_PCB.append(
-            round(float(df_pcb.iloc[index_start_rebreathing-1, i].values), 2))
-        baseline_arr_sentec.append(
-            round(float(df_sentec.iloc[index_start_rebreathing-1, i].values), 2))
+    # Subject matrices: baseline array extraction, START row removal and removal of
+    # the rows with NaN (see the module <Subject_matrix>)
+    pcb_matrix = SubjectMatrix.from_dataframe(df_pcb, index_start_rebreathing)
+    sentec_matrix = SubjectMatrix.from_dataframe(
+        df_sentec, index_start_rebreathing)
+    baseline_arr_PCB = pcb_matrix.baseline
+    baseline_arr_sentec = sentec_matrix.baseline
 
     print("\n\nBaseline array PCB: ")
     print(baseline_arr_PCB)
     print("\n\nBaseline array Sentec: ")
     print(baseline_arr_sentec)
 
-    # START row removal
-    df_pcb = df_pcb.drop(index_start_rebreathing, axis=0)
-    df_pcb = df_pcb.reset_index()
-    df_sentec = df_sentec.drop(index_start_rebreathing, axis=0)
-    df_sentec = df_sentec.reset_index()
-    #print("\n\nDataframe PCB without START row:")
-    # print(df_pcb)
-
-    # Removing Rows with NaN
-    df_pcb = df_pcb.dropna()
-    df_sentec = df_sentec.dropna()
-    offset = df_pcb.iloc[0, 0]
-    offset = int(offset)
+    offset = pcb_matrix.offset
     print("\n\nOffset is: %s" % offset)
 
-    df_pcb.pop('index')
-    df_sentec.pop('index')
-    df_pcb = df_pcb.reset_index(drop=TRUE)
-    df_sentec = df_sentec.reset_index(drop=TRUE)
-    #print("\n\nDataframe PCB without NaN rows:")
-    # print(df_pcb)
-    # print(type(df["28_01"][0]))
-
     '''
     ---------------------------------------------------------------------------------
     DATA MERGE
 
-    In the following section dataframes are merged
+    In the following section dataframes are merged: each matrix has one row for each
+    subject and one column for each timepoint
     ---------------------------------------------------------------------------------
     '''
-    # Summing values row by row
-    Data_matrix = []
-    Data_matrix_sentec = []
-    Data_matrix_no_offset = []
-    Data_matrix_no_offset_sentec = []
-    rows = len(df_pcb.index)
-    columns = len(df_pcb.columns)
-    # print(columns)
-
-    for i in range(0, len(df_pcb.columns), 1):
-        append = df_pcb.iloc[:, i].values
-        Data_matrix.append(append)
-        Data_matrix_sentec.append(df_sentec.iloc[:, i].values)
+    Data_matrix = pcb_matrix.values
+    Data_matrix_sentec = sentec_matrix.values
+    rows = pcb_matrix.samples
+    columns = pcb_matrix.subjects
     print("\n\nData matrix PCB: ")
     print(Data_matrix)
     # print("\n\nData matrix Sentec: ")
     # print(Data_matrix_sentec)
 
-    # Generation of arrays corresponding to columns, subtraction of the baseline and deltas computation
+    # Subtraction of the baseline and deltas computation
     Data_matrix_no_offset = Data_matrix
     Data_matrix_no_offset_sentec = Data_matrix_sentec
-    delta_matrix_pcb = []
-    delta_matrix_pcb_normalized = []
-    delta_matrix_sentec = []
-    delta_matrix_sentec_normalized = []
     print("\n\n")
     print(Data_matrix_no_offset[0])
     print("\n\nColumns of data matrix: ")
     print(len(Data_matrix_no_offset))  # numbers of columns
-    delta_PCB = []
-    delta_sentec = []
-    support_PCB = []
-    support_PCB_normalized = []
-    support_sentec = []
-    support_sentec_normalized = []
-    for i in range(0, len(Data_matrix_no_offset), 1):
-        # support.append(Data_matrix_no_offset[i].astype(float))
-
-        # conversion of data_matrix column into array of float
-        support_PCB = Data_matrix_no_offset[i].astype(float)
-
-        # baseline subrtaction from array
-        support_PCB = support_PCB - baseline_arr_PCB[i]
-
-        # Data normalization
-        support_PCB_normalized = (support_PCB/baseline_arr_PCB[i]) * 100
-        support_PCB_normalized = np.round(support_PCB_normalized, 2)
-        delta_matrix_pcb.append(support_PCB)
-        delta_matrix_pcb_normalized.append(support_PCB_normalized)
-        # print(max(support_PCB[(int(index_start_rebreathing)-offset-1):-1]))
-        # Array of delta values from start rebreathing to maximum
-        delta_PCB.append(
-            round(max(support_PCB[(int(index_start_rebreathing)-offset-1):-1]), 2))
-        support_sentec = Data_matrix_no_offset_sentec[i].astype(float)
-
-        # baseline subrtaction from array
-        support_sentec = support_sentec - baseline_arr_sentec[i]
-        support_sentec = np.round(support_sentec, 2)
-        support_sentec_normalized = (
-            support_sentec/baseline_arr_sentec[i]) * 100
-        support_sentec_normalized = np.round(support_sentec_normalized, 2)
-        delta_matrix_sentec.append(support_sentec)
-        delta_matrix_sentec_normalized.append(support_sentec_normalized)
-        # print(support_sentec)
-        # print(max(support_sentec[(int(index_start_rebreathing)-offset-1):-1]))
-        delta_sentec.append(
-            round(max(support_sentec[(int(index_start_rebreathing)-offset-1):-1]), 2))
+    delta_matrix_pcb = pcb_matrix.delta()
+    delta_matrix_pcb_normalized = pcb_matrix.normalized(decimals=2)
+    delta_matrix_sentec = sentec_matrix.delta(decimals=2)
+    delta_matrix_sentec_normalized = sentec_matrix.normalized(
+        decimals=2, delta_decimals=2)
+
+    # Array of delta values from start rebreathing to maximum
+    delta_PCB = pcb_matrix.peak_delta()
+    delta_sentec = sentec_matrix.peak_delta(delta_decimals=2)
     '''
     print("\n\n------------------------------------------------------------------------------------")
     print("\n\nMatrix of delta PCB:")
@@ -351,17 +206,13 @@ if(flag_lobo):
     order = 2
     fs = 1.0       # sample rate, Hz
     cutoff = 0.2  # desired cutoff frequency of the filter, Hz
-    filtered_co2 = butter_lowpass_filter(
-        Data_matrix_no_offset[subject_id].astype(float), cutoff, fs, order)
-
-    filtered_co2_cut = []
-    # Elimination of the first bias
-    for i in range(5, len(filtered_co2), 1):
-        filtered_co2_cut.append(filtered_co2[i])
+    # All the subjects at once; the initial conditions remove the start-up transient
+    filtered_matrix = lowpass_filter(Data_matrix_no_offset.astype(float), cutoff, fs,
+                                     order, zero_phase=flag_zero_phase)
+    filtered_co2 = filtered_matrix[subject_id]
 
     y_pcb = Data_matrix_no_offset[subject_id].astype(float)
     x_pcb = range(0, len(Data_matrix_no_offset[subject_id]), 1)
-    x_pcb_cut = range(0, len(filtered_co2_cut), 1)
     plt.figure()
     plt.plot(x_pcb, y_pcb, 'k')
     plt.title("Pre-filtering signal")
@@ -369,29 +220,24 @@ if(flag_lobo):
     plt.axvline(x=index_start_rebreathing-1-offset, color='gold')
     plt.axvline(x=index_start_rebreathing+3-offset, color='coral')
     plt.figure()
-    plt.plot(x_pcb_cut, filtered_co2_cut, 'k')
+    plt.plot(x_pcb, filtered_co2, 'k')
     plt.title("Filtered signal")
     plt.grid(axis='y')
     plt.axvline(x=index_start_rebreathing-1-offset, color='gold')
     plt.axvline(x=index_start_rebreathing+3-offset, color='coral')
 
     # Maximal value extraction for each subject
+    # The PCB search starts 5 samples after the start of the rebreathing, as before the
+    # filter initial conditions (the filtered data without the first 5 samples, the
+    # start-up transient, were indexed with the positions of the raw data)
     max_sentec = []
     max_pcb = []
     for i in range(0, len(Data_matrix_no_offset), 1):
-        filtered_co2 = butter_lowpass_filter(
-            Data_matrix_no_offset[i].astype(float), cutoff, fs, order)
-
-        filtered_co2_cut = []
-        # Elimination of the first bias
-        for j in range(5, len(filtered_co2), 1):
-            filtered_co2_cut.append(filtered_co2[j])
-
         support_sentec = Data_matrix_no_offset_sentec[i].astype(float)
         max_sentec.append(
             round(max(support_sentec[(int(index_start_rebreathing)-offset):-1]), 2))
         max_pcb.append(
-            round(max(filtered_co2_cut[(int(index_start_rebreathing)-offset):-1]), 2))
+            round(max(filtered_matrix[i][(int(index_start_rebreathing)-offset+5):-1]), 2))
 
     print("\n\nArray of max SENTEC")
     print(max_sentec)
@@ -409,84 +255,34 @@ if(flag_lobo):
     plt.ylabel('PCB device - [ppm]')
 
     # Delta PCB and Sentec and Normalized PCB and Sentec dataframe export
-    # print(delta_matrix_pcb)
-    delta_matrix_pcb_T = np.transpose(delta_matrix_pcb)
-    delta_matrix_pcb_normalized_T = np.transpose(delta_matrix_pcb_normalized)
-    delta_matrix_sentec_T = np.transpose(delta_matrix_sentec)
-    delta_matrix_sentec_normalized_T = np.transpose(
+    df_delta_pcb = pcb_matrix.to_dataframe(delta_matrix_pcb)
+    df_delta_pcb_normalized = pcb_matrix.to_dataframe(
+        delta_matrix_pcb_normalized)
+    df_delta_sentec = sentec_matrix.to_dataframe(delta_matrix_sentec)
+    df_delta_sentec_normalized = sentec_matrix.to_dataframe(
         delta_matrix_sentec_normalized)
-    # print(delta_matrix_pcb_T)
-    df_delta_pcb = pd.DataFrame(delta_matrix_pcb_T, columns=['28_01L', '9_02L', '15_02L',	'22_02L', '8_03L',
-                                                             '15_03L', '22_03L',	'12_04L', '19_04L', '3_05L', '10_05L', '24_05L',
-                                                             '31_05L', '14_06L', '21_06L', '5_07L', '12_07L', '18_07L', '19_07L'
-                                                             ])
-
-    df_delta_pcb_normalized = pd.DataFrame(delta_matrix_pcb_normalized_T, columns=['28_01L', '9_02L', '15_02L',	'22_02L', '8_03L',
-                                                                                   '15_03L', '22_03L',	'12_04L', '19_04L', '3_05L', '10_05L', '24_05L',
-                                                                                   '31_05L', '14_06L', '21_06L', '5_07L', '12_07L', '18_07L', '19_07L'
-                                                                                   ])
-
-    df_delta_sentec = pd.DataFrame(delta_matrix_sentec_T, columns=['28_01L', '9_02L', '15_02L',	'22_02L', '8_03L',
-                                                                   '15_03L', '22_03L',	'12_04L', '19_04L', '3_05L', '10_05L', '24_05L',
-                                                                   '31_05L', '14_06L', '21_06L', '5_07L', '12_07L', '18_07L', '19_07L'
-                                                                   ])
-
-    df_delta_sentec_normalized = pd.DataFrame(delta_matrix_sentec_normalized_T, columns=['28_01L', '9_02L', '15_02L',	'22_02L', '8_03L',
-                                                                                         '15_03L', '22_03L',	'12_04L', '19_04L', '3_05L', '10_05L', '24_05L',
-                                                                                         '31_05L', '14_06L', '21_06L', '5_07L', '12_07L', '18_07L', '19_07L'
-                                                                                         ])
     print(df_delta_sentec)
-    df_delta_pcb.to_csv('PCB_df_delta.csv', sep=';', index=False)
-    df_delta_pcb_normalized.to_csv(
-        'PCB_df_normalized.csv', sep=';', index=False)
-    df_delta_sentec.to_csv('Sentec_df_delta.csv', sep=';', index=False)
-    df_delta_sentec_normalized.to_csv(
-        'Sentec_df_normalized.csv', sep=';', index=False)
+    if(flag_columnar_store):
+        write_table(df_delta_pcb, 'PCB_df_delta')
+        write_table(df_delta_pcb_normalized, 'PCB_df_normalized')
+        write_table(df_delta_sentec, 'Sentec_df_delta')
+        write_table(df_delta_sentec_normalized, 'Sentec_df_normalized')
+    else:
+        df_delta_pcb.to_csv('PCB_df_delta.csv', sep=';', index=False)
+        df_delta_pcb_normalized.to_csv(
+            'PCB_df_normalized.csv', sep=';', index=False)
+        df_delta_sentec.to_csv('Sentec_df_delta.csv', sep=';', index=False)
+        df_delta_sentec_normalized.to_csv(
+            'Sentec_df_normalized.csv', sep=';', index=False)
 
     # Generation of a unique array for aggregated analysis
-    arr_sum_device = []
-    arr_sum_sentec = []
-    arr_sum_device_delta = []
-    arr_sum_sentec_delta = []
-    arr_sum_device_normalized = []
-    arr_sum_sentec_normalized = []
-    partial_total_device = 0
-    partial_total_sentec = 0
-    partial_total_device_delta = 0
-    partial_total_sentec_delta = 0
-    partial_total_device_normalized = 0
-    partial_total_sentec_normalized = 0
-
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            partial_total_device += round(float(Data_matrix[i][j]), 2)
-            partial_total_sentec += round(float(Data_matrix_sentec[i][j]), 2)
-            partial_total_device_delta += round(
-                float(delta_matrix_pcb[i][j]), 2)
-            partial_total_sentec_delta += round(
-                float(delta_matrix_sentec[i][j]), 2)
-            partial_total_device_normalized += round(
-                float(delta_matrix_pcb_normalized[i][j]), 2)
-            partial_total_sentec_normalized += round(
-                float(delta_matrix_sentec_normalized[i][j]), 2)
-
-        # print(Data_matrix[i][j])
-        arr_sum_device.append(round(partial_total_device/columns, 2))
-        arr_sum_sentec.append(round(partial_total_sentec/columns, 2))
-        arr_sum_device_delta.append(
-            round(partial_total_device_delta/columns, 2))
-        arr_sum_sentec_delta.append(
-            round(partial_total_sentec_delta/columns, 2))
-        arr_sum_device_normalized.append(
-            round(partial_total_device_normalized, 2))
-        arr_sum_sentec_normalized.append(
-            round(partial_total_sentec_normalized, 2))
-        partial_total_device = 0
-        partial_total_sentec = 0
-        partial_total_device_delta = 0
-        partial_total_sentec_delta = 0
-        partial_total_device_normalized = 0
-        partial_total_sentec_normalized = 0
+    arr_sum_device = pcb_matrix.mean()
+    arr_sum_sentec = sentec_matrix.mean()
+    arr_sum_device_delta = pcb_matrix.mean(delta_matrix_pcb)
+    arr_sum_sentec_delta = sentec_matrix.mean(delta_matrix_sentec)
+    arr_sum_device_normalized = pcb_matrix.total(delta_matrix_pcb_normalized)
+    arr_sum_sentec_normalized = sentec_matrix.total(
+        delta_matrix_sentec_normalized)
 
     '''
     print("\n\nArray of the sum:")
@@ -631,61 +427,22 @@ if(flag_lobo):
               ['Median values', 'Start rebreathing',
                'End rebreathing'], "upper left", '.-', "red", '1',  NONE, TRUE,
               index_start_rebreathing-offset-1, index_start_rebreathing-offset+4-1)
-    plt.show()
+    show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
 
     df_blandalt = pd.DataFrame({'PCB': delta_matrix_pcb_normalized[subject_id],
                                 'Sentec': delta_matrix_sentec_normalized[subject_id]})
 
-    PCB_ass = [5.3, 5.3, 5, 6, 5.3, 4.3, 2, 6.3,
-               2.3, 6, 6, 4.3, 5.3, 10, 5, 3.3, 6.3]
-    PCB_picc = [5, 6.3, 5.3, 3.3, 14, 11, 6,
-                6.3, 5.3, 6.3, 6, 9, 7, 8, 11, 7, 10]
-    PCB_sat = [8, 9, 11, 4, 14, 14, 8, 12,
-               5.3, 6.3, 6.3, 14, 7, 14, 14, 14, 10]
-    sentec_ass = [1.3, 1.3, 5.3, 6, 4.3, 2.3, 8.3,
-                  5.3, 7, 4, 10, 6, 10, 1.3, 4.3, 10, 6.3]
-    sentec_picc = [3.3, 3.3, 4.3, 3.3, 3.3,
-                   3.3, 3.3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3]
-    sentec_sat = [10.3, 14, 9.3, 6.3, 14, 10,
-                  9, 6, 14, 6, 9, 8, 8.3, 9, 14, 7.3, 14]
-
-    df_blandalt_ass = pd.DataFrame({'PCB': PCB_ass,
-                                    'Sentec': sentec_ass})
-
-    df_blandalt_picc = pd.DataFrame({'PCB': PCB_picc,
-                                     'Sentec': sentec_picc})
-
-    df_blandalt_sat = pd.DataFrame({'PCB': PCB_sat,
-                                    'Sentec': sentec_sat})
-
     f, ax = plt.subplots(1, figsize=(8, 5))
     sm.graphics.mean_diff_plot(df_blandalt.PCB, df_blandalt.Sentec, ax=ax)
 
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Baseline")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_ass.PCB, df_blandalt_ass.Sentec, ax=ax)
-
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Peak")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_picc.PCB, df_blandalt_picc.Sentec, ax=ax)
-
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Saturation")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_sat.PCB, df_blandalt_sat.Sentec, ax=ax)
-
-    plt.figure(32)
-    plt.title("Sentec - PCB device correlation analysis")
-    plt.xlabel('Sentec time [min]')
-    plt.ylabel('PCB time [min]')
-    plt.plot(sentec_ass, PCB_ass, 'o', color="blue")
-    plt.plot(sentec_picc, PCB_picc, 'o', color="red")
-    plt.plot(sentec_sat, PCB_sat, 'o', color="green")
-    plt.legend(["Baseline", "Peak", "Saturation"], loc='best')
-    plt.grid(axis='both')
-    plt.show()
+    # Baseline, peak and saturation of every subject from the normalized deltas, bias
+    # and limits of agreement with bootstrap intervals (see the module <Bland_altman>)
+    df_agreement, phases = device_agreement(pcb_matrix, sentec_matrix,
+                                            30 if flag_30seconds else 10, site="L", seed=0)
+    print("\n\nBland-Altman analysis PCB - Sentec:")
+    print(df_agreement)
+    plot_agreement(phases)
+    show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
 
     # Plot with median values (no standard deviation)
     y1 = arr_sum_sentec
@@ -737,24 +494,10 @@ if(flag_lobo):
               index_start_rebreathing_decimal, index_end_rebreathing_decimal)
 
     # Standard deviation computation
-    arr_row = []
-    std_arr = []
-    count = 0
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            arr_row.append(round(float(Data_matrix[i][j]), 2))
-        std_arr.append(round(stat.stdev(arr_row), 2))
-        count += 1
-        # print("Standard Deviation of sample %s is % s " % (count, std_arr[j]))
-        arr_row = []
-        # print(arr_row)
+    std_arr = pcb_matrix.std()
 
     # Mean standard deviation
-    total_std = 0
-    average_std = 0
-    for i in range(0, len(std_arr), 1):
-        total_std += std_arr[i]
-    average_std = round(float(total_std/len(std_arr)), 2)
+    average_std = round(float(np.mean(std_arr)), 2)
     print("\n\nAverage std: %s" % average_std)
 
     # Plot with standard deviation
@@ -831,55 +574,17 @@ if(flag_lobo):
                 )
     ---------------------------------------------------------------------------------
     '''
-    # Device variables
-    partial_data_for_boxplot = []
-    partial_data_for_boxplot_delta = []
-    partial_data_for_boxplot_normalized = []
-    data_for_boxplot = []
-    data_for_boxplot_delta = []
-    data_for_boxplot_normalized = []
+    # Device variables (2-D arrays: one box for each column, i.e. for each timepoint)
+    data_for_boxplot = pcb_matrix.boxplot_data()
+    data_for_boxplot_delta = pcb_matrix.boxplot_data(delta_matrix_pcb)
+    data_for_boxplot_normalized = pcb_matrix.boxplot_data(
+        delta_matrix_pcb_normalized)
 
     # Sentec Variables
-    S_partial_data_for_boxplot = []
-    S_partial_data_for_boxplot_delta = []
-    S_partial_data_for_boxplot_normalized = []
-    S_data_for_boxplot = []
-    S_data_for_boxplot_delta = []
-    S_data_for_boxplot_normalized = []
-
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            partial_data_for_boxplot.append(round(float(Data_matrix[i][j]), 2))
-            partial_data_for_boxplot_delta.append(
-                round(float(delta_matrix_pcb[i][j]), 2))
-            partial_data_for_boxplot_normalized.append(
-                round(float(delta_matrix_pcb_normalized[i][j]), 2))
-            S_partial_data_for_boxplot.append(
-                round(float(Data_matrix_sentec[i][j]), 2))
-            S_partial_data_for_boxplot_delta.append(
-                round(float(delta_matrix_sentec[i][j]), 2))
-            S_partial_data_for_boxplot_normalized.append(
-                round(float(delta_matrix_sentec_normalized[i][j]), 2))
-
-        data_for_boxplot.append(partial_data_for_boxplot)
-        data_for_boxplot_delta.append(partial_data_for_boxplot_delta)
-        data_for_boxplot_normalized.append(partial_data_for_boxplot_normalized)
-        # print(partial_data_for_boxplot_delta)
-        partial_data_for_boxplot = []
-        partial_data_for_boxplot_delta = []
-        partial_data_for_boxplot_normalized = []
-
-        S_data_for_boxplot.append(S_partial_data_for_boxplot)
-        S_data_for_boxplot_delta.append(S_partial_data_for_boxplot_delta)
-        S_data_for_boxplot_normalized.append(
-            S_partial_data_for_boxplot_normalized)
-        # print(S_partial_data_for_boxplot_delta)
-        S_partial_data_for_boxplot = []
-        S_partial_data_for_boxplot_delta = []
-        S_partial_data_for_boxplot_normalized = []
-
-    #print("\n\nData for boxplot (dataframe's rows extracted):")
-    # print(data_for_boxplot)
+    S_data_for_boxplot = sentec_matrix.boxplot_data()
+    S_data_for_boxplot_delta = sentec_matrix.boxplot_data(delta_matrix_sentec)
+    S_data_for_boxplot_normalized = sentec_matrix.boxplot_data(
+        delta_matrix_sentec_normalized)
 
     plt.figure(8)
     plt.title("PCB Device Lobe boxplot")
@@ -1510,121 +1215,59 @@ if(flag_lobo):
 
 
 if(flag_lobo == 0):
-    index_start_rebreathing = df_pcb[df_pcb["28_01P"] == "START"].index.values
+    index_start_rebreathing = start_index(df_pcb, "28_01P")
     print("\nIndex start rebreathing: ")
     print(index_start_rebreathing)
 
-    # Baseline array extraction
-    baseline_arr_PCB = []
-    baseline_arr_sentec = []
-    for i in range(0, len(df_pcb.columns), 1):
-        baseline_arr_PCB.append(
-            round(float(df_pcb.iloc[index_start_rebreathing-1, i].values), 2))
-        baseline_arr_sentec.append(
-            round(float(df_sentec.iloc[index_start_rebreathing-1, i].values), 2))
+    # Subject matrices: baseline array extraction, START row removal and removal of
+    # the rows with NaN (see the module <Subject_matrix>)
+    pcb_matrix = SubjectMatrix.from_dataframe(df_pcb, index_start_rebreathing)
+    sentec_matrix = SubjectMatrix.from_dataframe(
+        df_sentec, index_start_rebreathing)
+    baseline_arr_PCB = pcb_matrix.baseline
+    baseline_arr_sentec = sentec_matrix.baseline
 
     print("\n\nBaseline array PCB: ")
     print(baseline_arr_PCB)
     print("\n\nBaseline array Sentec: ")
     print(baseline_arr_sentec)
 
-    # START row removal
-    df_pcb = df_pcb.drop(index_start_rebreathing, axis=0)
-    df_pcb = df_pcb.reset_index()
-    df_sentec = df_sentec.drop(index_start_rebreathing, axis=0)
-    df_sentec = df_sentec.reset_index()
-    #print("\n\nDataframe PCB without START row:")
-    # print(df_pcb)
-
-    # Removing Rows with NaN
-    df_pcb = df_pcb.dropna()
-    df_sentec = df_sentec.dropna()
-    offset = df_pcb.iloc[0, 0]
-    offset = int(offset)
+    offset = pcb_matrix.offset
     print("\n\nOffset is: %s" % offset)
 
-    df_pcb.pop('index')
-    df_sentec.pop('index')
-    df_pcb = df_pcb.reset_index(drop=TRUE)
-    df_sentec = df_sentec.reset_index(drop=TRUE)
-    #print("\n\nDataframe PCB without NaN rows:")
-    # print(df_pcb)
-    # print(type(df["28_01"][0]))
-
     '''
     ---------------------------------------------------------------------------------
     DATA MERGE
 
-    In the following section dataframes are merged
+    In the following section dataframes are merged: each matrix has one row for each
+    subject and one column for each timepoint
     ---------------------------------------------------------------------------------
     '''
-    # Summing values row by row
-    Data_matrix = []
-    Data_matrix_sentec = []
-    Data_matrix_no_offset = []
-    Data_matrix_no_offset_sentec = []
-    rows = len(df_pcb.index)
-    columns = len(df_pcb.columns)
-    # print(columns)
-
-    for i in range(0, len(df_pcb.columns), 1):
-        append = df_pcb.iloc[:, i].values
-        Data_matrix.append(append)
-        Data_matrix_sentec.append(df_sentec.iloc[:, i].values)
+    Data_matrix = pcb_matrix.values
+    Data_matrix_sentec = sentec_matrix.values
+    rows = pcb_matrix.samples
+    columns = pcb_matrix.subjects
     print("\n\nData matrix PCB: ")
     print(Data_matrix)
     # print("\n\nData matrix Sentec: ")
     # print(Data_matrix_sentec)
 
-    # Generation of arrays corresponding to columns, subtraction of the baseline and deltas computation
+    # Subtraction of the baseline and deltas computation
     Data_matrix_no_offset = Data_matrix
     Data_matrix_no_offset_sentec = Data_matrix_sentec
-    delta_matrix_pcb = []
-    delta_matrix_pcb_normalized = []
-    delta_matrix_sentec = []
-    delta_matrix_sentec_normalized = []
     print("\n\n")
     print(Data_matrix_no_offset[0])
     print("\n\nColumns of data matrix: ")
     print(len(Data_matrix_no_offset))  # numbers of columns
-    delta_PCB = []
-    delta_sentec = []
-    support_PCB = []
-    support_PCB_normalized = []
-    support_sentec = []
-    support_sentec_normalized = []
-    for i in range(0, len(Data_matrix_no_offset), 1):
-        # support.append(Data_matrix_no_offset[i].astype(float))
-
-        # conversion of data_matrix column into array of float
-        support_PCB = Data_matrix_no_offset[i].astype(float)
-
-        # baseline subrtaction from array
-        support_PCB = support_PCB - baseline_arr_PCB[i]
-
-        # Data normalization
-        support_PCB_normalized = (support_PCB/baseline_arr_PCB[i]) * 100
-        support_PCB_normalized = np.round(support_PCB_normalized, 2)
-        delta_matrix_pcb.append(support_PCB)
-        delta_matrix_pcb_normalized.append(support_PCB_normalized)
-        # print(max(support_PCB[(int(index_start_rebreathing)-offset-1):-1]))
-        # Array of delta values from start rebreathing to maximum
-        delta_PCB.append(
-            round(max(support_PCB[(int(index_start_rebreathing)-offset-1):-1]), 2))
-        support_sentec = Data_matrix_no_offset_sentec[i].astype(float)
-
-        # baseline subrtaction from array
-        support_sentec = support_sentec - baseline_arr_sentec[i]
-        support_sentec = np.round(support_sentec, 2)
-        support_sentec_normalized = (
-            support_sentec/baseline_arr_sentec[i]) * 100
-        support_sentec_normalized = np.round(support_sentec_normalized, 2)
-        delta_matrix_sentec.append(support_sentec)
-        delta_matrix_sentec_normalized.append(support_sentec_normalized)
-        # print(support_sentec)
-        # print(max(support_sentec[(int(index_start_rebreathing)-offset-1):-1]))
-        delta_sentec.append(
-            round(max(support_sentec[(int(index_start_rebreathing)-offset-1):-1]), 2))
+    delta_matrix_pcb = pcb_matrix.delta()
+    delta_matrix_pcb_normalized = pcb_matrix.normalized(decimals=2)
+    delta_matrix_sentec = sentec_matrix.delta(decimals=2)
+    delta_matrix_sentec_normalized = sentec_matrix.normalized(
+        decimals=2, delta_decimals=2)
+
+    # Array of delta values from start rebreathing to maximum
+    delta_PCB = pcb_matrix.peak_delta()
+    delta_sentec = sentec_matrix.peak_delta(delta_decimals=2)
     '''
     print("\n\n------------------------------------------------------------------------------------")
     print("\n\nMatrix of delta PCB:")
@@ -1648,17 +1291,13 @@ if(flag_lobo == 0):
     order = 2
     fs = 1.0       # sample rate, Hz
     cutoff = 0.2  # desired cutoff frequency of the filter, Hz
-    filtered_co2 = butter_lowpass_filter(
-        Data_matrix_no_offset[subject_id].astype(float), cutoff, fs, order)
-
-    filtered_co2_cut = []
-    # Elimination of the first bias
-    for i in range(5, len(filtered_co2), 1):
-        filtered_co2_cut.append(filtered_co2[i])
+    # All the subjects at once; the initial conditions remove the start-up transient
+    filtered_matrix = lowpass_filter(Data_matrix_no_offset.astype(float), cutoff, fs,
+                                     order, zero_phase=flag_zero_phase)
+    filtered_co2 = filtered_matrix[subject_id]
 
     y_pcb = Data_matrix_no_offset[subject_id].astype(float)
     x_pcb = range(0, len(Data_matrix_no_offset[subject_id]), 1)
-    x_pcb_cut = range(0, len(filtered_co2_cut), 1)
     plt.figure()
     plt.plot(x_pcb, y_pcb, 'k')
     plt.title("Pre-filtering signal")
@@ -1666,29 +1305,24 @@ if(flag_lobo == 0):
     plt.axvline(x=index_start_rebreathing-1-offset, color='gold')
     plt.axvline(x=index_start_rebreathing+3-offset, color='coral')
     plt.figure()
-    plt.plot(x_pcb_cut, filtered_co2_cut, 'k')
+    plt.plot(x_pcb, filtered_co2, 'k')
     plt.title("Filtered signal")
     plt.grid(axis='y')
     plt.axvline(x=index_start_rebreathing-1-offset, color='gold')
     plt.axvline(x=index_start_rebreathing+3-offset, color='coral')
 
     # Maximal value extraction for each subject
+    # The PCB search starts 5 samples after the start of the rebreathing, as before the
+    # filter initial conditions (the filtered data without the first 5 samples, the
+    # start-up transient, were indexed with the positions of the raw data)
     max_sentec = []
     max_pcb = []
     for i in range(0, len(Data_matrix_no_offset), 1):
-        filtered_co2 = butter_lowpass_filter(
-            Data_matrix_no_offset[i].astype(float), cutoff, fs, order)
-
-        filtered_co2_cut = []
-        # Elimination of the first bias
-        for j in range(5, len(filtered_co2), 1):
-            filtered_co2_cut.append(filtered_co2[j])
-
         support_sentec = Data_matrix_no_offset_sentec[i].astype(float)
         max_sentec.append(
             round(max(support_sentec[(int(index_start_rebreathing)-offset):-1]), 2))
         max_pcb.append(
-            round(max(filtered_co2_cut[(int(index_start_rebreathing)-offset):-1]), 2))
+            round(max(filtered_matrix[i][(int(index_start_rebreathing)-offset+5):-1]), 2))
 
     print("\n\nArray of max SENTEC")
     print(max_sentec)
@@ -1706,82 +1340,32 @@ if(flag_lobo == 0):
     plt.ylabel('PCB device - [ppm]')
 
     # Delta PCB and Sentec and Normalized PCB and Sentec dataframe export
-    # print(delta_matrix_pcb)
-    delta_matrix_pcb_T = np.transpose(delta_matrix_pcb)
-    delta_matrix_pcb_normalized_T = np.transpose(delta_matrix_pcb_normalized)
-    delta_matrix_sentec_T = np.transpose(delta_matrix_sentec)
-    delta_matrix_sentec_normalized_T = np.transpose(
+    df_delta_pcb = pcb_matrix.to_dataframe(delta_matrix_pcb)
+    df_delta_pcb_normalized = pcb_matrix.to_dataframe(
+        delta_matrix_pcb_normalized)
+    df_delta_sentec = sentec_matrix.to_dataframe(delta_matrix_sentec)
+    df_delta_sentec_normalized = sentec_matrix.to_dataframe(
         delta_matrix_sentec_normalized)
-    # print(delta_matrix_pcb_T)
-    df_delta_pcb = pd.DataFrame(delta_matrix_pcb_T, columns=['28_01P', '9_02P', '15_02P',	'22_02P', '8_03P',
-                                                             '15_03P', '22_03P',	'12_04P', '19_04P', '3_05P', '10_05P', '24_05P',
-                                                             '31_05P', '14_06P', '21_06P', '5_07P', '12_07P', '18_07P', '19_07P'
-                                                             ])
-
-    df_delta_pcb_normalized = pd.DataFrame(delta_matrix_pcb_normalized_T, columns=['28_01P', '9_02P', '15_02P',	'22_02P', '8_03P',
-                                                                                   '15_03P', '22_03P',	'12_04P', '19_04P', '3_05P', '10_05P', '24_05P',
-                                                                                   '31_05P', '14_06P', '21_06P', '5_07P', '12_07P', '18_07P', '19_07P'
-                                                                                   ])
-
-    df_delta_sentec = pd.DataFrame(delta_matrix_sentec_T, columns=['28_01P', '9_02P', '15_02P',	'22_02P', '8_03P',
-                                                                   '15_03P', '22_03P',	'12_04P', '19_04P', '3_05P', '10_05P', '24_05P',
-                                                                   '31_05P', '14_06P', '21_06P', '5_07P', '12_07P', '18_07P', '19_07P'
-                                                                   ])
-
-    df_delta_sentec_normalized = pd.DataFrame(delta_matrix_sentec_normalized_T, columns=['28_01P', '9_02P', '15_02P',	'22_02P', '8_03P',
-                                                                                         '15_03P', '22_03P',	'12_04P', '19_04P', '3_05P', '10_05P', '24_05P',
-                                                                                         '31_05P', '14_06P', '21_06P', '5_07P', '12_07P', '18_07P', '19_07P'
-                                                                                         ])
-    df_delta_pcb.to_csv('PCB_df_delta.csv', sep=';', index=False)
-    df_delta_pcb_normalized.to_csv(
-        'PCB_df_normalized.csv', sep=';', index=False)
-    df_delta_sentec.to_csv('Sentec_df_delta.csv', sep=';', index=False)
-    df_delta_sentec_normalized.to_csv(
-        'Sentec_df_normalized.csv', sep=';', index=False)
+    if(flag_columnar_store):
+        write_table(df_delta_pcb, 'PCB_df_delta')
+        write_table(df_delta_pcb_normalized, 'PCB_df_normalized')
+        write_table(df_delta_sentec, 'Sentec_df_delta')
+        write_table(df_delta_sentec_normalized, 'Sentec_df_normalized')
+    else:
+        df_delta_pcb.to_csv('PCB_df_delta.csv', sep=';', index=False)
+        df_delta_pcb_normalized.to_csv(
+            'PCB_df_normalized.csv', sep=';', index=False)
+        df_delta_sentec.to_csv('Sentec_df_delta.csv', sep=';', index=False)
+        df_delta_sentec_normalized.to_csv(
+            'Sentec_df_normalized.csv', sep=';', index=False)
     # Generation of a unique array for aggregated analysis
-    arr_sum_device = []
-    arr_sum_sentec = []
-    arr_sum_device_delta = []
-    arr_sum_sentec_delta = []
-    arr_sum_device_normalized = []
-    arr_sum_sentec_normalized = []
-    partial_total_device = 0
-    partial_total_sentec = 0
-    partial_total_device_delta = 0
-    partial_total_sentec_delta = 0
-    partial_total_device_normalized = 0
-    partial_total_sentec_normalized = 0
-
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            partial_total_device += round(float(Data_matrix[i][j]), 2)
-            partial_total_sentec += round(float(Data_matrix_sentec[i][j]), 2)
-            partial_total_device_delta += round(
-                float(delta_matrix_pcb[i][j]), 2)
-            partial_total_sentec_delta += round(
-                float(delta_matrix_sentec[i][j]), 2)
-            partial_total_device_normalized += round(
-                float(delta_matrix_pcb_normalized[i][j]), 2)
-            partial_total_sentec_normalized += round(
-                float(delta_matrix_sentec_normalized[i][j]), 2)
-
-        # print(Data_matrix[i][j])
-        arr_sum_device.append(round(partial_total_device/columns, 2))
-        arr_sum_sentec.append(round(partial_total_sentec/columns, 2))
-        arr_sum_device_delta.append(
-            round(partial_total_device_delta/columns, 2))
-        arr_sum_sentec_delta.append(
-            round(partial_total_sentec_delta/columns, 2))
-        arr_sum_device_normalized.append(
-            round(partial_total_device_normalized, 2))
-        arr_sum_sentec_normalized.append(
-            round(partial_total_sentec_normalized, 2))
-        partial_total_device = 0
-        partial_total_sentec = 0
-        partial_total_device_delta = 0
-        partial_total_sentec_delta = 0
-        partial_total_device_normalized = 0
-        partial_total_sentec_normalized = 0
+    arr_sum_device = pcb_matrix.mean()
+    arr_sum_sentec = sentec_matrix.mean()
+    arr_sum_device_delta = pcb_matrix.mean(delta_matrix_pcb)
+    arr_sum_sentec_delta = sentec_matrix.mean(delta_matrix_sentec)
+    arr_sum_device_normalized = pcb_matrix.total(delta_matrix_pcb_normalized)
+    arr_sum_sentec_normalized = sentec_matrix.total(
+        delta_matrix_sentec_normalized)
 
     '''
     print("\n\nArray of the sum:")
@@ -1926,50 +1510,17 @@ if(flag_lobo == 0):
               ['Median values', 'Start rebreathing',
                'End rebreathing'], "upper left", '.-', "red", '1',  NONE, TRUE,
               index_start_rebreathing-offset-1, index_start_rebreathing-offset+4-1)
-    plt.show()
-
-    PCB_ass = [4, 8, 5, 4.3, 3, 4, 10, 4.3, 5, 4, 7, 3, 3, 3.3]
-    PCB_picc = [4, 4.3, 6.3, 7.3, 4, 10.3, 6.3, 6.3, 6, 5.3, 8, 12, 6.3, 9]
-    PCB_sat = [4, 4.3, 6.3, 7.3, 4.3, 14, 6.3, 6.3, 6, 14, 8, 12, 6.3, 11]
-    sentec_ass = [10, 3, 7.3, 7, 10, 3, 6, 7.3, 4, 8.3, 10, 10, 5, 10]
-    sentec_picc = [4, 4, 4, 4.3, 4.3, 4, 3, 3.3, 3.3, 3.3, 4, 3.3, 3.3, 4]
-    sentec_sat = [14, 14, 14, 14, 14, 9.3, 7.3, 7, 6, 14, 8, 9, 14, 8]
+    show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
 
-    df_blandalt_ass = pd.DataFrame({'PCB': PCB_ass,
-                                    'Sentec': sentec_ass})
+    # Baseline, peak and saturation of every subject from the normalized deltas, bias
+    # and limits of agreement with bootstrap intervals (see the module <Bland_altman>)
+    df_agreement, phases = device_agreement(pcb_matrix, sentec_matrix,
+                                            30 if flag_30seconds else 10, site="P", seed=0)
+    print("\n\nBland-Altman analysis PCB - Sentec:")
+    print(df_agreement)
+    plot_agreement(phases)
 
-    df_blandalt_picc = pd.DataFrame({'PCB': PCB_picc,
-                                     'Sentec': sentec_picc})
-
-    df_blandalt_sat = pd.DataFrame({'PCB': PCB_sat,
-                                    'Sentec': sentec_sat})
-
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Baseline")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_ass.PCB, df_blandalt_ass.Sentec, ax=ax)
-
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Peak")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_picc.PCB, df_blandalt_picc.Sentec, ax=ax)
-
-    f, ax = plt.subplots(1, figsize=(8, 5))
-    ax.set_title("BLDALT - Saturation")
-    sm.graphics.mean_diff_plot(
-        df_blandalt_sat.PCB, df_blandalt_sat.Sentec, ax=ax)
-
-    plt.figure(32)
-    plt.title("Sentec - PCB device correlation analysis")
-    plt.xlabel('Sentec time [min]')
-    plt.ylabel('PCB time [min]')
-    plt.plot(sentec_ass, PCB_ass, 'o', color="blue")
-    plt.plot(sentec_picc, PCB_picc, 'o', color="red")
-    plt.plot(sentec_sat, PCB_sat, 'o', color="green")
-    plt.legend(["Baseline", "Peak", "Saturation"], loc='best')
-    plt.grid(axis='both')
-
-    plt.show()
+    show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
 
     df_blandalt = pd.DataFrame({'PCB': delta_matrix_pcb_normalized[subject_id],
                                 'Sentec': delta_matrix_sentec_normalized[subject_id]})
@@ -2111,24 +1662,10 @@ if(flag_lobo == 0):
                 'End rebreathing'], loc="upper left")
 
     # Standard deviation computation
-    arr_row = []
-    std_arr = []
-    count = 0
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            arr_row.append(round(float(Data_matrix[i][j]), 2))
-        std_arr.append(round(stat.stdev(arr_row), 2))
-        count += 1
-        # print("Standard Deviation of sample %s is % s " % (count, std_arr[j]))
-        arr_row = []
-        # print(arr_row)
+    std_arr = pcb_matrix.std()
 
     # Mean standard deviation
-    total_std = 0
-    average_std = 0
-    for i in range(0, len(std_arr), 1):
-        total_std += std_arr[i]
-    average_std = round(float(total_std/len(std_arr)), 2)
+    average_std = round(float(np.mean(std_arr)), 2)
     print("\n\nAverage std: %s" % average_std)
 
     # Plot with standard deviation
@@ -2205,55 +1742,17 @@ if(flag_lobo == 0):
                 )
     ---------------------------------------------------------------------------------
     '''
-    # Device variables
-    partial_data_for_boxplot = []
-    partial_data_for_boxplot_delta = []
-    partial_data_for_boxplot_normalized = []
-    data_for_boxplot = []
-    data_for_boxplot_delta = []
-    data_for_boxplot_normalized = []
+    # Device variables (2-D arrays: one box for each column, i.e. for each timepoint)
+    data_for_boxplot = pcb_matrix.boxplot_data()
+    data_for_boxplot_delta = pcb_matrix.boxplot_data(delta_matrix_pcb)
+    data_for_boxplot_normalized = pcb_matrix.boxplot_data(
+        delta_matrix_pcb_normalized)
 
     # Sentec Variables
-    S_partial_data_for_boxplot = []
-    S_partial_data_for_boxplot_delta = []
-    S_partial_data_for_boxplot_normalized = []
-    S_data_for_boxplot = []
-    S_data_for_boxplot_delta = []
-    S_data_for_boxplot_normalized = []
-
-    for j in range(0, rows, 1):
-        for i in range(0, columns, 1):
-            partial_data_for_boxplot.append(round(float(Data_matrix[i][j]), 2))
-            partial_data_for_boxplot_delta.append(
-                round(float(delta_matrix_pcb[i][j]), 2))
-            partial_data_for_boxplot_normalized.append(
-                round(float(delta_matrix_pcb_normalized[i][j]), 2))
-            S_partial_data_for_boxplot.append(
-                round(float(Data_matrix_sentec[i][j]), 2))
-            S_partial_data_for_boxplot_delta.append(
-                round(float(delta_matrix_sentec[i][j]), 2))
-            S_partial_data_for_boxplot_normalized.append(
-                round(float(delta_matrix_sentec_normalized[i][j]), 2))
-
-        data_for_boxplot.append(partial_data_for_boxplot)
-        data_for_boxplot_delta.append(partial_data_for_boxplot_delta)
-        data_for_boxplot_normalized.append(partial_data_for_boxplot_normalized)
-        # print(partial_data_for_boxplot_delta)
-        partial_data_for_boxplot = []
-        partial_data_for_boxplot_delta = []
-        partial_data_for_boxplot_normalized = []
-
-        S_data_for_boxplot.append(S_partial_data_for_boxplot)
-        S_data_for_boxplot_delta.append(S_partial_data_for_boxplot_delta)
-        S_data_for_boxplot_normalized.append(
-            S_partial_data_for_boxplot_normalized)
-        # print(S_partial_data_for_boxplot_delta)
-        S_partial_data_for_boxplot = []
-        S_partial_data_for_boxplot_delta = []
-        S_partial_data_for_boxplot_normalized = []
-
-    #print("\n\nData for boxplot (dataframe's rows extracted):")
-    # print(data_for_boxplot)
+    S_data_for_boxplot = sentec_matrix.boxplot_data()
+    S_data_for_boxplot_delta = sentec_matrix.boxplot_data(delta_matrix_sentec)
+    S_data_for_boxplot_normalized = sentec_matrix.boxplot_data(
+        delta_matrix_sentec_normalized)
 
     plt.figure(8)
     plt.title("PCB Device Forearm boxplot")
@@ -2873,3 +2372,30 @@ if(flag_lobo == 0):
                     'Sensors delay'], loc="lower right")
 
     # plt.show()
+
+#################################################################################
+#                       CPET, PCB device and Sentec                             #
+#################################################################################
+
+# EtCO2 interpolated on the time grid of the PCB device (see the module <Cpet>): one row
+# for each subject and window, the three devices compared point by point
+seconds = 30 if flag_30seconds else 10
+df_alignment = cohort_alignment(cpet_table, pcb_matrix, sentec_matrix, seconds)
+print("\n\nCPET, PCB and Sentec aligned data:")
+print(df_alignment.dropna())
+
+subject_alignment = df_alignment[df_alignment["subject"] == pcb_matrix.labels[subject_id]]
+fig29 = plt.figure(29)
+plt.title("Sentec PtCO2 and CPET EtCO2 - " + pcb_matrix.labels[subject_id])
+plt.plot(subject_alignment["time"], subject_alignment["sentec"], '.-', color="red",
+         linewidth='1')
+plt.plot(subject_alignment["time"], subject_alignment["etco2"], '.-', color="black",
+         linewidth='1')
+plt.axvline(x=0, color='gold')
+plt.axvline(x=120, color='coral')
+plt.xlabel('Time from start rebreathing [s]')
+plt.ylabel('CO2 partial pressure [mmHg]')
+plt.grid(axis='y')
+plt.legend(['Sentec', 'CPET', 'Start rebreathing', 'End rebreathing'], loc="upper left")
+
+show_figures(flag_headless, 'Figures', 'Aggregated_data_analysis_3')
@@ -0,0 +1,232 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON SCRIPT FOR BATCH SESSION INGESTION
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This script processes a whole directory (or glob) of raw session CSV files, the same
+files read one at a time by <Dataframe_Creation> (e.g. 28_01L.csv, 18_07L.csv), and
+assembles the merged wide tables used by <Statistical_analysis> and by the
+<Aggregated_data_analysis> scripts. Sessions are processed in a pool of processes, one
+worker per file.
+
+The file name (without extension) is used as column label: day_month followed by the
+site (L for lobe, P for forearm). Columns are sorted by date and, for the same date, lobe
+before forearm, so that lobe and forearm data alternate as expected by the statistical
+analysis. Columns are aligned on the "START" row; missing values are left empty.
+
+Output files, for each window size <n>:
+    - CO2_df_<n>_median_merged.csv, Sentec_df_<n>_median_merged.csv: all the sessions
+    - CO2_df_<n>_median_L.csv, Sentec_df_<n>_median_L.csv: lobe sessions only
+    - CO2_df_<n>_median_P.csv, Sentec_df_<n>_median_P.csv: forearm sessions only
+
+\Parameters: (command line)
+    @param <sources>: directories, files or glob patterns of raw session CSV files.
+    @param <--sample-numbers>: window sizes to be exported. Default values are 10 30.
+    @param <--statistic>: statistic to be exported. Default value is median.
+    @param <--workers>: number of worker processes. Default is the number of CPUs.
+    @param <--output-dir>: directory where the merged tables are written.
+    @param <--store>: feather or parquet, to write the merged tables also in the
+            columnar session store (see the module <Session_store>).
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+from Window_statistics import multi_resolution_statistics
+from Session_store import write_table
+
+# Same column names given in <Dataframe_Creation>
+SESSION_COLUMNS = ("Timestamp_CO2", "CO2Sange", "Timestamp_deltaCO2",
+                   "DeltaCO2", "Sentec", "Rebreathing_mark")
+SITES = ("L", "P")
+
+
+################ LOAD SESSION #################
+# \brief: Function that reads a raw session CSV and extracts the CO2 and Sentec data
+#   and the rebreathing marks.
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+# \return (CO2 array, Sentec array, start rebreathing index, end rebreathing index)
+###############################################
+def load_session(filename):
+    df = pd.read_csv(filename, sep=";")
+    df.columns = SESSION_COLUMNS
+    start_rebreathing = df[df["Rebreathing_mark"] == "R1"].index.values
+    end_rebreathing = df[df["Rebreathing_mark"] == "R2"].index.values
+    if(len(start_rebreathing) == 0):
+        raise ValueError("%s: R1 rebreathing mark not found" % filename)
+
+    end = int(end_rebreathing[0]) if len(end_rebreathing) > 0 else None
+    return (df.iloc[:, 1].values.astype(float), df.iloc[:, 4].values.astype(float),
+            int(start_rebreathing[0]), end)
+
+
+################ SESSION NAME #################
+# \brief: Function that returns the session label (file name without extension).
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+# \return session label, e.g. "28_01L"
+###############################################
+def session_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+################ SESSION SORT KEY #################
+# \brief: Function used to sort the sessions by date (day_month) and site (lobe first).
+#   Labels that do not follow the day_month<site> pattern are placed at the end.
+# \parameters:
+#   @param <name>: session label
+# \return sorting key
+###################################################
+def session_sort_key(name):
+    match = re.match(r"^(\d+)_(\d+)([A-Za-z]*)$", name)
+    if(match is None):
+        return (1, 0, 0, 0, name)
+    site = match.group(3).upper()
+    site_order = SITES.index(site) if site in SITES else len(SITES)
+    return (0, int(match.group(2)), int(match.group(1)), site_order, name)
+
+
+################ PROCESS SESSION #################
+# \brief: Worker function: reads one raw session and computes the windowed statistics
+#   for all the window sizes in a single pass.
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+#   @param <sample_numbers>: list of window sizes
+#   @param <statistic>: statistic to be exported (e.g. "median")
+# \return (session label, {n: (device (pre, post), sentec (pre, post))})
+##################################################
+def process_session(filename, sample_numbers, statistic="median"):
+    CO2_data, Sentec_data, start_rebreathing, end_rebreathing = load_session(
+        filename)
+    device = multi_resolution_statistics(
+        CO2_data, start_rebreathing, sample_numbers, (statistic,))
+    sentec = multi_resolution_statistics(
+        Sentec_data, start_rebreathing, sample_numbers, (statistic,))
+    return session_name(filename), {n: (device[n][statistic], sentec[n][statistic])
+                                    for n in device}
+
+
+################ MERGE SESSIONS #################
+# \brief: Function that builds a wide table with one column per session, aligned on
+#   the "START" row (same layout of the merged CSV files).
+# \parameters:
+#   @param <columns>: dictionary {session label: (pre array, post array)}
+# \return pandas DataFrame
+#################################################
+def merge_sessions(columns):
+    names = sorted(columns, key=session_sort_key)
+    if(len(names) == 0):
+        return pd.DataFrame()
+    rows_pre = max(len(columns[name][0]) for name in names)
+    rows_post = max(len(columns[name][1]) for name in names)
+
+    merged = {}
+    for name in names:
+        pre, post = columns[name]
+        column = np.full(rows_pre + 1 + rows_post, np.nan, dtype=object)
+        column[rows_pre-len(pre):rows_pre] = pre
+        column[rows_pre] = "START"
+        column[rows_pre+1:rows_pre+1+len(post)] = post
+        merged[name] = column
+    return pd.DataFrame(merged)
+
+
+################ EXPAND SOURCES #################
+# \brief: Function that expands directories and glob patterns into a list of CSV files.
+# \parameters:
+#   @param <sources>: list of directories, files or glob patterns
+# \return sorted list of file paths
+#################################################
+def expand_sources(sources):
+    files = set()
+    for source in sources:
+        if(os.path.isdir(source)):
+            files.update(glob.glob(os.path.join(source, "*.csv")))
+        else:
+            files.update(glob.glob(source))
+    return sorted(files)
+
+
+################ RUN BATCH #################
+# \brief: Function that processes all the sessions in a process pool and writes the
+#   merged tables for every window size.
+# \parameters:
+#   @param <files>: list of raw session CSV files
+#   @param <sample_numbers>: list of window sizes
+#   @param <statistic>: statistic to be exported (e.g. "median")
+#   @param <workers>: number of worker processes (None to use all the CPUs)
+#   @param <output_dir>: directory where the merged tables are written
+#   @param <store>: "feather" or "parquet" to write also the columnar store, None
+#           to write only the CSV files
+# \return dictionary {n: (PCB merged DataFrame, Sentec merged DataFrame)}
+############################################
+def run_batch(files, sample_numbers, statistic="median", workers=None, output_dir=".", store=None):
+    device_columns = {n: {} for n in sample_numbers}
+    sentec_columns = {n: {} for n in sample_numbers}
+    worker = partial(process_session, sample_numbers=sample_numbers,
+                     statistic=statistic)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(worker, filename): filename
+                   for filename in files}
+        for future in as_completed(futures):
+            try:
+                name, resolutions = future.result()
+            except (ValueError, OSError, pd.errors.ParserError) as error:
+                print("Skipped session: %s" % error)
+                continue
+            for n in resolutions:
+                device_columns[n][name] = resolutions[n][0]
+                sentec_columns[n][name] = resolutions[n][1]
+            print("Processed session %s" % name)
+
+    tables = {}
+    for n in sample_numbers:
+        df_pcb = merge_sessions(device_columns[n])
+        df_sentec = merge_sessions(sentec_columns[n])
+        tables[n] = (df_pcb, df_sentec)
+        for suffix, selection in [("merged", None)] + [(site, site) for site in SITES]:
+            columns = [name for name in df_pcb.columns
+                       if selection is None or name.upper().endswith(selection)]
+            if(len(columns) == 0):
+                continue
+            for device, df in (("CO2", df_pcb), ("Sentec", df_sentec)):
+                name = os.path.join(output_dir, '%s_df_%s_%s_%s' %
+                                    (device, n, statistic, suffix))
+                if(store is None):
+                    df[columns].to_csv(name + '.csv', sep=';', index=False)
+                else:
+                    write_table(df[columns], name, store)
+    return tables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Batch processing of raw session CSV files")
+    parser.add_argument("sources", nargs="+",
+                        help="directories, files or glob patterns of raw session CSV files")
+    parser.add_argument("--sample-numbers", nargs="+", type=int, default=[10, 30],
+                        help="window sizes to be exported (default: 10 30)")
+    parser.add_argument("--statistic", default="median",
+                        help="statistic to be exported (default: median)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: all the CPUs)")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory of the merged tables (default: current directory)")
+    parser.add_argument("--store", choices=("feather", "parquet"), default=None,
+                        help="write the merged tables also in the columnar session store")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    files = expand_sources(args.sources)
+    print("Sessions found: %s" % len(files))
+    run_batch(files, args.sample_numbers, args.statistic,
+              args.workers, args.output_dir, args.store)
@@ -0,0 +1,256 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR THE BLAND-ALTMAN ANALYSIS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module performs the Bland-Altman analysis between the PCB and the Sentec devices
+of <Aggregated_data_analysis_3> for all the subjects, instead of the times read on the
+plots and typed in the script. Three phases of the response are found in the delta
+matrices (one row per subject, see <Subject_matrix>) after the start of the rebreathing:
+    - baseline: last window before the rise (delta below <rise_level> of the peak)
+    - peak: window of the maximum delta
+    - saturation: last window of the plateau after the peak (delta above
+      <plateau_level> of the peak), or the last window if the delta does not decrease
+Time (seconds from the start of the rebreathing) and delta value of each phase are
+compared: bias (mean difference PCB - Sentec), standard deviation of the differences and
+limits of agreement (bias -/+ 1.96 SD), for all the phases at once. The confidence
+intervals of bias and limits are computed with a percentile bootstrap over the subjects
+(the same resampled subjects for all the phases). The plots (statsmodels mean_diff_plot)
+are drawn only on request (plot_agreement()).
+
+Output file (when run as a script): Bland_altman.csv, one row for each site, phase and
+quantity (time or value).
+
+\Parameters: (command line)
+    @param <--sample-number>: window size of the merged tables. Default value is 30.
+    @param <--normalized>: compare the normalized deltas (percentage of the baseline),
+            otherwise the deltas.
+    @param <--bootstrap>: number of bootstrap resamples. Default value is 2000.
+    @param <--seed>: seed of the bootstrap. Default value is 0.
+    @param <--columnar-store>: read the merged tables from the columnar session store
+            (see the module <Session_store>).
+    @param <--plot>: draw the Bland-Altman plots (saved to the directory Figures).
+    @param <--output>: output CSV file. Default is Bland_altman.csv.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from Cpet import matrix_times
+
+PHASES = ("baseline", "peak", "saturation")
+# Limits of agreement: bias -/+ LOA_FACTOR*SD
+LOA_FACTOR = 1.96
+AGREEMENT_COLUMNS = ("site", "phase", "quantity", "n", "bias", "bias_low", "bias_high",
+                     "sd", "lower_loa", "lower_loa_low", "lower_loa_high", "upper_loa",
+                     "upper_loa_low", "upper_loa_high")
+
+
+################ RESPONSE PHASES #################
+# \brief: Function that finds the phases of the response of all the subjects.
+# \parameters:
+#   @param <delta>: 2-D array (subjects, timepoints) of delta values
+#   @param <times>: 1-D array with the time of each timepoint (0 at the start)
+#   @param <start>: position of the start of the rebreathing in the rows
+#   @param <rise_level>: fraction of the peak that marks the rise
+#   @param <plateau_level>: fraction of the peak kept in the plateau
+# \return (times, values): 2-D arrays (subjects, PHASES), NaN for rows without data
+##################################################
+def response_phases(delta, times, start, rise_level=0.1, plateau_level=0.9):
+    post = np.asarray(delta, dtype=float)[:, int(start):]
+    post_times = np.asarray(times, dtype=float)[int(start):]
+    rows = np.arange(len(post))
+    valid = ~np.all(np.isnan(post), axis=1)
+    filled = np.where(np.isnan(post), -np.inf, post)
+    columns = np.arange(post.shape[1])
+
+    peak = np.argmax(filled, axis=1)
+    peak_value = filled[rows, peak]
+    with np.errstate(invalid="ignore"):
+        rising = (filled >= rise_level*peak_value[:, None]) & (columns <= peak[:, None])
+        rise = np.argmax(rising, axis=1)
+        baseline = np.maximum(rise - 1, 0)
+        dropped = (filled < plateau_level*peak_value[:, None]) & (columns > peak[:, None])
+    saturation = np.where(dropped.any(axis=1), np.argmax(dropped, axis=1) - 1,
+                          post.shape[1] - 1)
+
+    positions = np.stack((baseline, peak, saturation), axis=1)
+    phase_times = np.where(valid[:, None], post_times[positions], np.nan)
+    phase_values = np.where(valid[:, None], post[rows[:, None], positions], np.nan)
+    return phase_times, phase_values
+
+
+################ LIMITS OF AGREEMENT #################
+# \brief: Function that computes bias, SD and limits of agreement along the first axis
+#   (subjects), ignoring NaN.
+# \parameters:
+#   @param <differences>: array (..., subjects, columns) of differences
+# \return (bias, sd, lower limit, upper limit): arrays (..., columns)
+######################################################
+def limits_of_agreement(differences):
+    with warnings.catch_warnings():
+        # Columns with less than 2 subjects
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        bias = np.nanmean(differences, axis=-2)
+        sd = np.nanstd(differences, axis=-2, ddof=1)
+    return bias, sd, bias - LOA_FACTOR*sd, bias + LOA_FACTOR*sd
+
+
+################ BLAND ALTMAN #################
+# \brief: Function that performs the Bland-Altman analysis of many paired columns at
+#   once, with bootstrap confidence intervals.
+# \parameters:
+#   @param <a>, <b>: 2-D arrays (subjects, columns), paired measurements (NaN: missing)
+#   @param <resamples>: number of bootstrap resamples (0: no confidence intervals)
+#   @param <confidence>: confidence level of the intervals
+#   @param <seed>: seed of the random generator (or numpy Generator)
+# \return dictionary {statistic: 1-D array with one value per column}
+###############################################
+def bland_altman(a, b, resamples=2000, confidence=0.95, seed=None):
+    differences = np.atleast_2d(np.asarray(a, dtype=float) - np.asarray(b, dtype=float))
+    n = np.count_nonzero(~np.isnan(differences), axis=0)
+    bias, sd, lower, upper = limits_of_agreement(differences)
+    result = {"n": n, "bias": bias, "sd": sd, "lower_loa": lower, "upper_loa": upper}
+
+    names = ("bias", "lower_loa", "upper_loa")
+    if(resamples > 0 and len(differences) > 0):
+        rng = np.random.default_rng(seed)
+        resampled = differences[rng.integers(0, len(differences),
+                                             (resamples, len(differences)))]
+        boot_bias, _, boot_lower, boot_upper = limits_of_agreement(resampled)
+        tail = (1 - confidence)/2*100
+        for name, values in zip(names, (boot_bias, boot_lower, boot_upper)):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                low, high = np.nanpercentile(values, [tail, 100 - tail], axis=0)
+            result[name + "_low"], result[name + "_high"] = low, high
+    else:
+        for name in names:
+            result[name + "_low"] = result[name + "_high"] = np.full(len(n), np.nan)
+    return result
+
+
+################ DEVICE AGREEMENT #################
+# \brief: Function that compares the phases of the PCB and Sentec responses.
+# \parameters:
+#   @param <pcb_matrix>, <sentec_matrix>: SubjectMatrix of the two devices (same
+#           subjects, in the same order)
+#   @param <seconds>: window size of the merged tables (10 or 30)
+#   @param <normalized>: if True the normalized deltas are compared
+#   @param <site>: label of the site written in the table
+#   @param <resamples>, <confidence>, <seed>: see bland_altman()
+# \return (pandas DataFrame (AGREEMENT_COLUMNS), phases: dictionary {device: (times,
+#   values)} returned by response_phases())
+###################################################
+def device_agreement(pcb_matrix, sentec_matrix, seconds, normalized=True, site="",
+                     resamples=2000, confidence=0.95, seed=None):
+    if(pcb_matrix.subjects != sentec_matrix.subjects):
+        raise ValueError("different number of subjects: PCB %d, Sentec %d" % (
+            pcb_matrix.subjects, sentec_matrix.subjects))
+    phases = {}
+    for device, matrix in (("PCB", pcb_matrix), ("Sentec", sentec_matrix)):
+        delta = matrix.normalized() if normalized else matrix.delta()
+        phases[device] = response_phases(delta, matrix_times(matrix, seconds),
+                                         matrix.baseline_position)
+
+    # Times and values of all the phases as columns of the same analysis
+    pcb = np.concatenate(phases["PCB"], axis=1)
+    sentec = np.concatenate(phases["Sentec"], axis=1)
+    result = bland_altman(pcb, sentec, resamples, confidence, seed)
+    table = pd.DataFrame(result)
+    table.insert(0, "quantity", np.repeat(["time", "value"], len(PHASES)))
+    table.insert(0, "phase", PHASES*2)
+    table.insert(0, "site", site)
+    return table[list(AGREEMENT_COLUMNS)], phases
+
+
+################ PLOT AGREEMENT #################
+# \brief: Function that draws the Bland-Altman plots of the phases and the plot of the
+#   PCB times against the Sentec times (times in minutes).
+# \parameters:
+#   @param <phases>: dictionary returned by device_agreement()
+#   @param <quantity>: "time" or "value"
+#   @param <title>: prefix of the titles
+#   @param <figure_id>: number of the correlation figure
+# \return list of figures
+#################################################
+def plot_agreement(phases, quantity="time", title="BLDALT", figure_id=32):
+    import matplotlib.pyplot as plt
+    import statsmodels.api as sm
+
+    index = 0 if quantity == "time" else 1
+    scale = 60 if quantity == "time" else 1
+    pcb = phases["PCB"][index]/scale
+    sentec = phases["Sentec"][index]/scale
+    figures = []
+    for i, phase in enumerate(PHASES):
+        paired = ~np.isnan(pcb[:, i]) & ~np.isnan(sentec[:, i])
+        figure, ax = plt.subplots(1, figsize=(8, 5))
+        ax.set_title("%s - %s" % (title, phase.capitalize()))
+        sm.graphics.mean_diff_plot(pcb[paired, i], sentec[paired, i], ax=ax)
+        figures.append(figure)
+
+    figure = plt.figure(figure_id)
+    plt.title("Sentec - PCB device correlation analysis")
+    unit = "time [min]" if quantity == "time" else "value"
+    plt.xlabel('Sentec ' + unit)
+    plt.ylabel('PCB ' + unit)
+    for i, color in enumerate(("blue", "red", "green")):
+        plt.plot(sentec[:, i], pcb[:, i], 'o', color=color)
+    plt.legend([phase.capitalize() for phase in PHASES], loc='best')
+    plt.grid(axis='both')
+    figures.append(figure)
+    return figures
+
+
+if __name__ == "__main__":
+    from Session_store import read_table, start_index
+    from Subject_matrix import SubjectMatrix
+
+    parser = argparse.ArgumentParser(
+        description="Bland-Altman analysis between the PCB and the Sentec devices")
+    parser.add_argument("--sample-number", type=int, default=30,
+                        help="window size of the merged tables (default: 30)")
+    parser.add_argument("--normalized", action="store_true",
+                        help="compare the normalized deltas")
+    parser.add_argument("--bootstrap", type=int, default=2000,
+                        help="number of bootstrap resamples (default: 2000)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the bootstrap (default: 0)")
+    parser.add_argument("--columnar-store", action="store_true",
+                        help="read the merged tables from the columnar session store")
+    parser.add_argument("--plot", action="store_true",
+                        help="draw the plots (saved to the directory Figures)")
+    parser.add_argument("--output", default="Bland_altman.csv",
+                        help="output CSV file (default: Bland_altman.csv)")
+    args = parser.parse_args()
+
+    if(args.plot):
+        from Figure_rendering import use_headless_backend, show_figures
+        use_headless_backend()
+
+    print("------------------------------- New run ---------------------------------")
+    seeds = np.random.SeedSequence(args.seed).spawn(2)
+    tables = []
+    for site, seed in zip(("L", "P"), seeds):
+        matrices = []
+        for device in ("CO2", "Sentec"):
+            name = '%s_df_%s_median_%s' % (device, args.sample_number, site)
+            if(args.columnar_store):
+                df = read_table(name)
+            else:
+                df = pd.read_csv(name + '.csv', sep=";")
+            matrices.append(SubjectMatrix.from_dataframe(df, start_index(df, df.columns[0])))
+        table, phases = device_agreement(matrices[0], matrices[1], args.sample_number,
+                                         args.normalized, site, args.bootstrap,
+                                         seed=seed)
+        tables.append(table)
+        if(args.plot):
+            plot_agreement(phases, title="BLDALT %s" % site)
+            show_figures(1, 'Figures', 'Bland_altman_%s' % site)
+    df_agreement = pd.concat(tables, ignore_index=True)
+    print(df_agreement)
+    df_agreement.round(3).to_csv(args.output, sep=';', index=False)
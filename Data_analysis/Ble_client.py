@@ -0,0 +1,409 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON SCRIPT FOR THE BLE CLIENT
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This script receives the CO2 values sent over Bluetooth Low Energy by the firmware
+4_Codice_per_PCB_BLE: the devices advertise the name "CO2Monitor" and the service
+SERVICE_UUID, and notify the characteristic CO2_UUID (BLEIntCharacteristic, int32 little
+endian) with each value read from the sensor (calibration and measurement).
+
+Many devices are followed at the same time (one asyncio task each). The notifications of
+each device are collected by a NotificationBatcher and sent in chunks (arrays of times
+and values) to a bounded queue, read by a single task that writes one session file per
+device with SessionWriter (see <Live_ingestion>), in the layout read by
+<Dataframe_Creation>. When the queue is full (files written more slowly than the data
+arrive) the batchers wait: the notifications are kept in a buffer of at most
+<max_pending> values per device, and the oldest are dropped (and counted) after that.
+A device that can not be reached, or whose capture fails, is reported and does not stop
+the capture of the other devices.
+
+The radio is accessed through a transport object with the methods scan(), connect(),
+start_notify(), wait_disconnected() and disconnect():
+    - BleakTransport uses the bleak package (optional dependency)
+    - FakeGatt is an in-process stand-in of the GATT server of the devices, which
+      notifies the CO2 values given to it (e.g. the synthetic sessions of
+      <Cozir_emulator>), to run the client without hardware.
+
+\Parameters: (command line)
+    @param <addresses>: addresses of the devices. If none is given, the devices
+            advertising the CO2 service are searched.
+    @param <--fake>: number of devices emulated with FakeGatt (synthetic sessions)
+            instead of the radio. Default value is 0.
+    @param <--speed>: N times real time for the emulated devices. Default value is 1.
+    @param <--seed>: seed of the emulated sessions. Default value is 0.
+    @param <--scan-timeout>: seconds of scanning. Default value is 5.
+    @param <--output-dir>: directory where the session files are written.
+    @param <--batch-size>: values per chunk. Default value is 32.
+    @param <--batch-interval>: maximum seconds between two chunks. Default value is 1.
+    @param <--queue-size>: maximum number of chunks waiting to be written. Default
+            value is 64.
+    @param <--marks>: read the rebreathing marks from the standard input, one per line
+            as "<address> R1" or "<address> R2".
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import asyncio
+from collections import deque, namedtuple
+import time
+import numpy as np
+from Live_ingestion import SessionWriter, read_marks
+
+try:
+    import bleak
+except ImportError:
+    bleak = None
+
+LOCAL_NAME = "CO2Monitor"
+SERVICE_UUID = "9c3a81f8-13a2-47ca-b6c1-e246c6301560"
+CO2_UUID = "ff469246-6e68-468b-935b-f7e4c6604897"
+
+Chunk = namedtuple("Chunk", ("device", "times", "values", "dropped"))
+
+
+################ DECODE VALUE #################
+# \brief: Function that decodes the value of the CO2 characteristic (int32, little
+#   endian).
+###############################################
+def decode_value(data):
+    return int.from_bytes(bytes(data[:4]), "little", signed=True)
+
+
+################ ENCODE VALUE #################
+# \brief: Function that encodes a CO2 value as done by CO2LevelChar.writeValue().
+###############################################
+def encode_value(value):
+    return int(value).to_bytes(4, "little", signed=True)
+
+
+class NotificationBatcher:
+
+    ################ INIT #################
+    # \brief: Constructor of the batcher of the notifications of a device.
+    # \parameters:
+    #   @param <device>: address of the device
+    #   @param <queue>: asyncio.Queue where the chunks are put
+    #   @param <batch_size>: number of values after which a chunk is sent
+    #   @param <batch_interval>: maximum seconds between two chunks
+    #   @param <max_pending>: maximum number of values kept while the queue is full
+    #   @param <clock>: function returning the time in seconds
+    #######################################
+    def __init__(self, device, queue, batch_size=32, batch_interval=1.0, max_pending=4096,
+                 clock=time.monotonic):
+        self.device = device
+        self.queue = queue
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._clock = clock
+        self._times = deque(maxlen=max_pending)
+        self._values = deque(maxlen=max_pending)
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    ################ NOTIFY #################
+    # \brief: Callback of the notifications (called by the transport, does not wait).
+    # \parameters:
+    #   @param <data>: value of the characteristic
+    #########################################
+    def notify(self, data):
+        if(len(self._values) == self._values.maxlen):
+            self.dropped += 1
+        self._times.append(self._clock())
+        self._values.append(decode_value(data))
+        self.received += 1
+        if(len(self._values) >= self.batch_size):
+            self._ready.set()
+
+    ################ CLOSE #################
+    # \brief: Function that stops the batcher after the last chunk is sent.
+    ########################################
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    ################ RUN #################
+    # \brief: Function that sends the chunks to the queue until the batcher is closed.
+    ######################################
+    async def run(self):
+        dropped = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            if(len(self._values) > 0):
+                chunk = Chunk(self.device, np.array(self._times), np.array(self._values),
+                              self.dropped - dropped)
+                dropped = self.dropped
+                self._times.clear()
+                self._values.clear()
+                # Waits while the queue is full (back-pressure)
+                await self.queue.put(chunk)
+            if(self._closed and len(self._values) == 0):
+                return
+
+
+class BleakTransport:
+
+    ################ INIT #################
+    # \brief: Constructor of the transport on the radio (bleak package).
+    #######################################
+    def __init__(self):
+        if(bleak is None):
+            raise ImportError("The bleak package is needed to use the radio")
+        self._disconnected = {}
+
+    async def scan(self, timeout=5.0, name=LOCAL_NAME):
+        devices = await bleak.BleakScanner.discover(timeout=timeout,
+                                                    service_uuids=[SERVICE_UUID])
+        return [device.address for device in devices if name is None or device.name == name]
+
+    async def connect(self, address):
+        disconnected = asyncio.get_running_loop().create_future()
+
+        def on_disconnect(client):
+            if(not disconnected.done()):
+                disconnected.set_result(None)
+
+        client = bleak.BleakClient(address, disconnected_callback=on_disconnect)
+        await client.connect()
+        self._disconnected[client] = disconnected
+        return client
+
+    async def start_notify(self, client, uuid, callback):
+        await client.start_notify(uuid, lambda characteristic, data: callback(data))
+
+    async def wait_disconnected(self, client):
+        await self._disconnected[client]
+
+    async def disconnect(self, client):
+        self._disconnected.pop(client, None)
+        await client.disconnect()
+
+
+_Peripheral = namedtuple("_Peripheral", ("name", "values", "interval", "subscribers",
+                                         "connections"))
+FakeConnection = namedtuple("FakeConnection", ("address", "callbacks", "disconnected"))
+
+
+class FakeGatt:
+
+    ################ INIT #################
+    # \brief: Constructor of the in-process GATT server: same methods of BleakTransport,
+    #   without radio.
+    #######################################
+    def __init__(self):
+        self._peripherals = {}
+        self._tasks = {}
+
+    ################ ADD DEVICE #################
+    # \brief: Function that adds an emulated device.
+    # \parameters:
+    #   @param <address>: address of the device
+    #   @param <values>: iterable with the CO2 values to be notified
+    #   @param <interval>: seconds between two notifications
+    #   @param <name>: advertised name
+    #############################################
+    def add_device(self, address, values, interval=1.0, name=LOCAL_NAME):
+        self._peripherals[address] = _Peripheral(name, values, interval, [], [])
+
+    async def scan(self, timeout=0, name=LOCAL_NAME):
+        return [address for address, peripheral in self._peripherals.items()
+                if name is None or peripheral.name == name]
+
+    async def connect(self, address):
+        if(address not in self._peripherals):
+            raise ConnectionError("Device not found: %s" % address)
+        connection = FakeConnection(address, [],
+                                    asyncio.get_running_loop().create_future())
+        self._peripherals[address].connections.append(connection)
+        return connection
+
+    ################ START NOTIFY #################
+    # \brief: Function that subscribes to the CO2 characteristic. The device starts to
+    #   notify the values at the first subscription, and disconnects after the last one.
+    ###############################################
+    async def start_notify(self, connection, uuid, callback):
+        if(uuid != CO2_UUID):
+            raise ValueError("Characteristic not found: %s" % uuid)
+        peripheral = self._peripherals[connection.address]
+        connection.callbacks.append(callback)
+        peripheral.subscribers.append(callback)
+        if(connection.address not in self._tasks):
+            self._tasks[connection.address] = asyncio.ensure_future(self._notify(peripheral))
+
+    async def _notify(self, peripheral):
+        for value in peripheral.values:
+            data = encode_value(value)
+            for callback in list(peripheral.subscribers):
+                callback(data)
+            await asyncio.sleep(peripheral.interval)
+        for connection in peripheral.connections:
+            if(not connection.disconnected.done()):
+                connection.disconnected.set_result(None)
+
+    async def wait_disconnected(self, connection):
+        await connection.disconnected
+
+    async def disconnect(self, connection):
+        peripheral = self._peripherals[connection.address]
+        for callback in connection.callbacks:
+            peripheral.subscribers.remove(callback)
+        connection.callbacks.clear()
+        if(connection in peripheral.connections):
+            peripheral.connections.remove(connection)
+        if(not connection.disconnected.done()):
+            connection.disconnected.set_result(None)
+
+
+################ CAPTURE DEVICE #################
+# \brief: Function that receives the notifications of a device until it disconnects.
+#   The errors of the device are printed and returned, so that the capture of the other
+#   devices goes on.
+# \parameters:
+#   @param <transport>: BleakTransport or FakeGatt
+#   @param <address>: address of the device
+#   @param <batcher>: NotificationBatcher of the device
+# \return None, or the error message of the device
+#################################################
+async def capture_device(transport, address, batcher):
+    flusher = asyncio.ensure_future(batcher.run())
+    try:
+        connection = await transport.connect(address)
+    except Exception as error:
+        flusher.cancel()
+        print("%s: connection failed (%s)" % (address, error))
+        return str(error)
+    failure = None
+    try:
+        await transport.start_notify(connection, CO2_UUID, batcher.notify)
+        await transport.wait_disconnected(connection)
+    except Exception as error:
+        failure = str(error)
+        print("%s: capture stopped (%s)" % (address, error))
+    finally:
+        try:
+            await transport.disconnect(connection)
+        except Exception as error:
+            print("%s: disconnection failed (%s)" % (address, error))
+        # The values received before the error are still written
+        batcher.close()
+        await flusher
+    return failure
+
+
+################ WRITE CHUNKS #################
+# \brief: Function that writes the chunks of the queue to the session files, until a
+#   None is received.
+# \parameters:
+#   @param <queue>: asyncio.Queue of Chunk
+#   @param <writers>: dictionary {address: SessionWriter}
+###############################################
+async def write_chunks(queue, writers):
+    while True:
+        chunk = await queue.get()
+        if(chunk is None):
+            return
+        writers[chunk.device].add_values(chunk.times, chunk.values)
+
+
+################ CAPTURE SESSIONS #################
+# \brief: Function that captures the sessions of many devices at the same time.
+# \parameters:
+#   @param <transport>: BleakTransport or FakeGatt
+#   @param <addresses>: addresses of the devices. If None the devices are searched
+#   @param <output_dir>: directory of the session files
+#   @param <scan_timeout>: seconds of scanning
+#   @param <batch_size>, <batch_interval>, <max_pending>: see NotificationBatcher
+#   @param <queue_size>: maximum number of chunks waiting to be written
+#   @param <clock>: function returning the time in seconds
+#   @param <marks>: if True the rebreathing marks are read from the standard input
+# \return dictionary {session name: (number of rows, number of dropped values, None or
+#   the error message of the device)}
+###################################################
+async def capture_sessions(transport, addresses=None, output_dir=".", scan_timeout=5.0,
+                           batch_size=32, batch_interval=1.0, max_pending=4096,
+                           queue_size=64, clock=time.monotonic, marks=False):
+    if(addresses is None):
+        addresses = await transport.scan(scan_timeout)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    queue = asyncio.Queue(queue_size)
+    writers = {}
+    batchers = {}
+    for address in addresses:
+        name = "%s_%s" % (address.replace(":", ""), stamp)
+        writers[address] = SessionWriter(output_dir, name, clock=clock)
+        batchers[address] = NotificationBatcher(address, queue, batch_size, batch_interval,
+                                                max_pending, clock)
+    consumer = asyncio.ensure_future(write_chunks(queue, writers))
+    services = [asyncio.ensure_future(read_marks(writers))] if marks else []
+    try:
+        errors = await asyncio.gather(*[capture_device(transport, address,
+                                                       batchers[address])
+                                        for address in addresses])
+        await queue.put(None)
+        await consumer
+    finally:
+        consumer.cancel()
+        for service in services:
+            service.cancel()
+        for writer in writers.values():
+            writer.close()
+    return {writers[address].name: (writers[address].rows, batchers[address].dropped,
+                                    error)
+            for address, error in zip(addresses, errors)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture of the BLE notifications")
+    parser.add_argument("addresses", nargs="*",
+                        help="addresses of the devices (default: scan)")
+    parser.add_argument("--fake", type=int, default=0,
+                        help="number of emulated devices (default: 0, radio)")
+    parser.add_argument("--speed", type=float, default=1,
+                        help="N times real time for the emulated devices (default: 1)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the emulated sessions (default: 0)")
+    parser.add_argument("--scan-timeout", type=float, default=5,
+                        help="seconds of scanning (default: 5)")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory where the session files are written")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="values per chunk (default: 32)")
+    parser.add_argument("--batch-interval", type=float, default=1,
+                        help="maximum seconds between two chunks (default: 1)")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="maximum number of chunks waiting to be written (default: 64)")
+    parser.add_argument("--marks", action="store_true",
+                        help="read the rebreathing marks (<address> R1/R2) from stdin")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    if(args.fake > 0):
+        from Cozir_emulator import synthetic_session
+        transport = FakeGatt()
+        for i, seed in enumerate(np.random.SeedSequence(args.seed).spawn(args.fake)):
+            ambient, co2 = synthetic_session(np.random.default_rng(seed))
+            transport.add_device("FA:KE:00:00:%02X:%02X" % (i//256, i % 256), co2,
+                                 1/args.speed)
+    else:
+        transport = BleakTransport()
+    try:
+        sessions = asyncio.run(capture_sessions(transport, args.addresses or None,
+                                                args.output_dir, args.scan_timeout,
+                                                args.batch_size, args.batch_interval,
+                                                queue_size=args.queue_size,
+                                                marks=args.marks))
+    except KeyboardInterrupt:
+        sessions = {}
+    for name, (rows, dropped, error) in sessions.items():
+        if(error is None):
+            print("%s: %d rows, %d values dropped" % (name, rows, dropped))
+        else:
+            print("%s: %d rows, %d values dropped, failed: %s" % (name, rows, dropped,
+                                                                  error))
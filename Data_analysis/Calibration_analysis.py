@@ -0,0 +1,277 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR THE CALIBRATION ANALYSIS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module checks the calibration of the ambient CO2 done by the firmware in the
+CALIBRAZIONE state. The firmware keeps the last 10 values (CO2Ambientale[10]) and stops
+when the first and the last differ by at most 20 ppm (or when the button is pressed after
+one minute); the baseline of all the deltas is then
+
+    ppm_Ambientali_medio = int((CO2Ambientale[0] + CO2Ambientale[9])/2)
+
+i.e. the mean of two single samples. The calibration samples are read from the serial
+captures (Ambiente frames in the CALIBRAZIONE intervals, see <State_timeline>, or records
+of a binary capture, see <Telemetry_binary>) and the last window of each calibration is
+summarized with robust statistics:
+    - firmware value, spread |c0 - c9| and convergence as done by the firmware
+    - trimmed mean, median and MAD (scaled to the standard deviation) of the window
+    - drift: least squares slope of the window, in ppm per minute
+    - bias: firmware value minus trimmed mean
+A calibration is reliable when it converged with a complete window, the bias is within
+<tolerance> and the drift is below <max_drift>. All the calibrations are stacked in a
+NaN-padded matrix (one row each, aligned to the end of the calibration), so that the
+statistics are computed with array operations on all the sessions at once.
+
+Output file (when run as a script): Calibration_report.csv, one row for each calibration.
+Sessions with no reliable calibration can be skipped by <Exponential_fitting>
+(--calibration-report).
+
+\Parameters: (command line)
+    @param <captures>: serial captures (text, or binary with extension .bin), file
+            names or glob patterns.
+    @param <--window>: samples of the calibration window. Default value is 10.
+    @param <--trim>: proportion of samples cut from each end for the trimmed mean.
+            Default value is 0.1.
+    @param <--tolerance>: maximum bias in ppm. Default value is 10.
+    @param <--max-drift>: maximum drift in ppm per minute. Default value is 60.
+    @param <--output>: output CSV file. Default is Calibration_report.csv.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import glob
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from Batch_ingestion import session_name
+from Serial_protocol import decode_capture
+from State_timeline import index_capture
+from Telemetry_binary import CALIBRAZIONE, MISURA, decode_frames
+
+AMBIENT_SERIES = "Ambiente ppm"
+# Calibration of the firmware (Calibra())
+CALIBRATION_SAMPLES = 10
+CALIBRATION_THRESHOLD = 20
+# Scale of the MAD to the standard deviation of normal data
+MAD_SCALE = 1.4826
+CALIBRATION_COLUMNS = ("session", "calibration", "measured", "samples", "firmware",
+                       "spread", "converged", "trimmed_mean", "median", "mad", "drift",
+                       "bias", "reliable")
+
+
+################ TEXT CALIBRATIONS #################
+# \brief: Function that reads the calibration samples of a text capture.
+# \parameters:
+#   @param <capture>: text file with a serial capture
+# \return list of (samples array, True if the calibration is followed by MISURA)
+####################################################
+def text_calibrations(capture):
+    intervals = index_capture(capture)[0]
+    series = decode_capture(capture).get(AMBIENT_SERIES)
+    if(series is None):
+        return []
+    calibrations = []
+    for i, interval in enumerate(intervals):
+        if(interval["state"] != CALIBRAZIONE):
+            continue
+        inside = (series.offsets >= interval["start"]) & (series.offsets < interval["end"])
+        calibrations.append((series.values[inside],
+                             _measured(intervals["state"][i + 1:])))
+    return calibrations
+
+
+################ MEASURED #################
+# \brief: Function that tells if a measurement follows a calibration (MISURA before the
+#   next calibration).
+# \parameters:
+#   @param <states>: states of the intervals after the calibration
+###########################################
+def _measured(states):
+    following = np.flatnonzero(np.asarray(states) == CALIBRAZIONE)
+    if(len(following) > 0):
+        states = states[:following[0]]
+    return bool(np.any(np.asarray(states) == MISURA))
+
+
+################ BINARY CALIBRATIONS #################
+# \brief: Function that reads the calibration samples of a binary capture.
+# \parameters:
+#   @param <capture>: binary capture (see <Telemetry_binary>)
+# \return list of (samples array, True if the calibration is followed by MISURA)
+######################################################
+def binary_calibrations(capture):
+    with open(capture, "rb") as source:
+        records = decode_frames(source.read())[0]
+    states = records["state"]
+    change = np.flatnonzero(np.diff(states)) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.append(change, len(states))
+    calibrations = []
+    for start, end in zip(starts, ends):
+        if(states[start] == CALIBRAZIONE):
+            calibrations.append((records["co2"][start:end].astype(float),
+                                 _measured(states[starts[starts > start]])))
+    return calibrations
+
+
+################ STACK #################
+# \brief: Function that stacks sequences of different length in a NaN-padded matrix,
+#   aligned to the end of each sequence.
+# \parameters:
+#   @param <sequences>: list of 1-D arrays
+#   @param <width>: number of columns (the last <width> samples of each sequence)
+# \return 2-D array (len(sequences), width)
+########################################
+def stack(sequences, width):
+    lengths = np.minimum([len(sequence) for sequence in sequences], width).astype(int)
+    matrix = np.full((len(sequences), width), np.nan)
+    if(lengths.sum() == 0):
+        return matrix
+    rows = np.repeat(np.arange(len(sequences)), lengths)
+    columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    columns += width - lengths[rows]
+    matrix[rows, columns] = np.concatenate([np.asarray(sequence, dtype=float)[-length:]
+                                            if length > 0 else []
+                                            for sequence, length in zip(sequences, lengths)])
+    return matrix
+
+
+################ TRIMMED MEAN #################
+# \brief: Function that computes the trimmed mean of each row, ignoring NaN.
+# \parameters:
+#   @param <matrix>: 2-D array
+#   @param <proportion>: proportion of samples cut from each end of each row
+# \return 1-D array (NaN for rows without samples)
+###############################################
+def trimmed_mean(matrix, proportion=0.1):
+    ordered = np.sort(matrix, axis=1)  # NaN at the end of each row
+    n = np.count_nonzero(~np.isnan(matrix), axis=1)
+    cut = np.floor(proportion*n).astype(int)
+    cumulative = np.concatenate((np.zeros((len(matrix), 1)),
+                                 np.cumsum(np.nan_to_num(ordered), axis=1)), axis=1)
+    rows = np.arange(len(matrix))
+    kept = n - 2*cut
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(kept > 0, (cumulative[rows, n - cut] - cumulative[rows, cut])/kept,
+                        np.nan)
+
+
+################ DRIFT #################
+# \brief: Function that computes the least squares slope of each row, ignoring NaN.
+# \parameters:
+#   @param <matrix>: 2-D array, one sample per second
+# \return 1-D array, slope in units per minute (NaN for rows with less than 2 samples)
+########################################
+def drift(matrix):
+    valid = ~np.isnan(matrix)
+    n = valid.sum(axis=1)
+    t = np.where(valid, np.arange(matrix.shape[1]), 0.0)
+    x = np.nan_to_num(matrix)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = t.sum(axis=1)/n
+        x_mean = x.sum(axis=1)/n
+        dt = np.where(valid, t - t_mean[:, None], 0.0)
+        slope = (dt*(x - x_mean[:, None])).sum(axis=1)/(dt**2).sum(axis=1)
+    return np.where(n >= 2, slope*60, np.nan)
+
+
+################ ANALYZE CALIBRATIONS #################
+# \brief: Function that computes the statistics of many calibrations at once.
+# \parameters:
+#   @param <sequences>: list of 1-D arrays with the calibration samples (1 per second)
+#   @param <window>: samples of the calibration window
+#   @param <trim>: proportion cut from each end for the trimmed mean
+#   @param <tolerance>: maximum bias (firmware value - trimmed mean) in ppm
+#   @param <max_drift>: maximum drift in ppm per minute
+# \return pandas DataFrame with the columns of CALIBRATION_COLUMNS from "samples" on
+#######################################################
+def analyze_calibrations(sequences, window=CALIBRATION_SAMPLES, trim=0.1, tolerance=10,
+                         max_drift=60):
+    matrix = stack(sequences, window)
+    first, last = matrix[:, 0], matrix[:, -1]
+    spread = np.abs(first - last)
+    with np.errstate(invalid="ignore"):
+        converged = spread <= CALIBRATION_THRESHOLD
+    firmware = np.floor((first + last)/2)
+    with warnings.catch_warnings():
+        # Rows without samples
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        median = np.nanmedian(matrix, axis=1)
+        mad = np.nanmedian(np.abs(matrix - median[:, None]), axis=1)*MAD_SCALE
+    trimmed = trimmed_mean(matrix, trim)
+    slope = drift(matrix)
+    bias = firmware - trimmed
+    with np.errstate(invalid="ignore"):
+        reliable = converged & (np.abs(bias) <= tolerance) & (np.abs(slope) <= max_drift)
+    return pd.DataFrame({"samples": [len(sequence) for sequence in sequences],
+                         "firmware": firmware, "spread": spread, "converged": converged,
+                         "trimmed_mean": np.round(trimmed, 2), "median": median,
+                         "mad": np.round(mad, 2), "drift": np.round(slope, 2),
+                         "bias": np.round(bias, 2), "reliable": reliable})
+
+
+################ CALIBRATION REPORT #################
+# \brief: Function that analyzes the calibrations of many captures.
+# \parameters:
+#   @param <captures>: list of capture files (binary if the extension is .bin)
+#   @param <parameters>: parameters of analyze_calibrations()
+# \return pandas DataFrame (CALIBRATION_COLUMNS)
+#####################################################
+def calibration_report(captures, **parameters):
+    labels = []
+    sequences = []
+    for capture in captures:
+        if(os.path.splitext(capture)[1] == ".bin"):
+            calibrations = binary_calibrations(capture)
+        else:
+            calibrations = text_calibrations(capture)
+        for i, (samples, measured) in enumerate(calibrations):
+            labels.append((session_name(capture), i, measured))
+            sequences.append(samples)
+    report = analyze_calibrations(sequences, **parameters)
+    report.insert(0, "measured", [measured for _, _, measured in labels])
+    report.insert(0, "calibration", [i for _, i, _ in labels])
+    report.insert(0, "session", [session for session, _, _ in labels])
+    return report[list(CALIBRATION_COLUMNS)]
+
+
+################ UNRELIABLE SESSIONS #################
+# \brief: Function that returns the sessions whose baseline is not reliable: the last
+#   calibration before the measurement is not reliable (or there is none).
+# \parameters:
+#   @param <report>: DataFrame returned by calibration_report()
+# \return set of session labels
+######################################################
+def unreliable_sessions(report):
+    measured = report[report["measured"]].groupby("session").last()
+    sessions = set(report["session"])
+    return sessions - set(measured.index[measured["reliable"].astype(bool)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analysis of the ambient calibration")
+    parser.add_argument("captures", nargs="+",
+                        help="serial captures (binary if .bin), files or glob patterns")
+    parser.add_argument("--window", type=int, default=CALIBRATION_SAMPLES,
+                        help="samples of the calibration window (default: 10)")
+    parser.add_argument("--trim", type=float, default=0.1,
+                        help="proportion cut from each end (default: 0.1)")
+    parser.add_argument("--tolerance", type=float, default=10,
+                        help="maximum bias in ppm (default: 10)")
+    parser.add_argument("--max-drift", type=float, default=60,
+                        help="maximum drift in ppm per minute (default: 60)")
+    parser.add_argument("--output", default="Calibration_report.csv",
+                        help="output CSV file (default: Calibration_report.csv)")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    captures = sorted(set(path for pattern in args.captures for path in glob.glob(pattern)))
+    report = calibration_report(captures, window=args.window, trim=args.trim,
+                                tolerance=args.tolerance, max_drift=args.max_drift)
+    print(report)
+    unreliable = unreliable_sessions(report)
+    print("Sessions with an unreliable baseline: %s" % (", ".join(sorted(unreliable)) or "none"))
+    report.to_csv(args.output, sep=";", index=False)
@@ -0,0 +1,157 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR COHORT STATISTICS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module computes the per-timepoint statistics of a cohort of subjects (aggregated
+curves, standard deviation bars, boxplot summaries) used by <Statistical_analysis> and by
+the <Aggregated_data_analysis> scripts.
+
+Data are 2-D arrays with one row per subject and one column per timepoint (the
+Data_matrix and delta_matrix lists of the scripts, or the values of a SubjectMatrix, see
+<Subject_matrix>). All the statistics are computed on the columns with vectorized calls:
+the matrix is sorted once for the order statistics (median, quartiles, percentiles) and
+mean and standard deviation are computed on the same array. Missing values (NaN, e.g.
+sessions of different length) are ignored. Results are rounded only at the output.
+------------------------------------------------------------------------------------------
+'''
+
+import numpy as np
+
+# Statistics available in cohort_statistics(); std is the sample standard deviation
+# (same definition of statistics.stdev), q1 and q3 are the 25th and 75th percentiles
+STATISTICS = ("mean", "median", "std", "sum", "min", "max", "q1", "q3", "iqr", "count")
+
+
+################ SUBJECT ARRAY #################
+# \brief: Function that converts the data to a 2-D float array (subjects, timepoints).
+# \parameters:
+#   @param <data>: 2-D array or list of 1-D arrays (one for each subject, also with
+#           object dtype)
+# \return 2-D float array
+################################################
+def _subject_array(data):
+    data = np.asarray(data, dtype=float)
+    if(data.ndim == 1):
+        data = data[None, :]
+    if(data.ndim != 2):
+        raise ValueError("data must be a 2-D array (subjects, timepoints)")
+    return data
+
+
+################ SORTED QUANTILE #################
+# \brief: Function that computes a quantile of each column of a sorted matrix (NaN at the
+#   end of each column), with the linear interpolation used by np.percentile.
+# \parameters:
+#   @param <sorted_data>: 2-D array sorted along the first axis
+#   @param <counts>: number of valid values in each column
+#   @param <q>: quantile, between 0 and 1
+# \return 1-D array with one value per column
+##################################################
+def _sorted_quantile(sorted_data, counts, q):
+    position = q * np.maximum(counts - 1, 0)
+    low = np.floor(position).astype(int)
+    high = np.minimum(low + 1, np.maximum(counts - 1, 0))
+    weight = position - low
+    columns = np.arange(sorted_data.shape[1])
+    value = sorted_data[low, columns]*(1 - weight) + \
+        sorted_data[high, columns]*weight
+    # Exact values where no interpolation is needed (also for infinite values)
+    value = np.where(weight == 0, sorted_data[low, columns], value)
+    return np.where(counts > 0, value, np.nan)
+
+
+################ COHORT STATISTICS #################
+# \brief: Function that computes the statistics across subjects for each timepoint.
+# \parameters:
+#   @param <data>: 2-D array (subjects, timepoints) or list of 1-D arrays
+#   @param <statistics>: iterable with the names of the statistics (see STATISTICS)
+#   @param <percentiles>: iterable with further percentiles (0-100), returned with the
+#           keys "p<percentile>" (e.g. "p10", "p97.5")
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return dictionary {statistic: 1-D array with one value per timepoint}
+####################################################
+def cohort_statistics(data, statistics=("mean", "std"), percentiles=(), decimals=2):
+    data = _subject_array(data)
+    for name in statistics:
+        if(name not in STATISTICS):
+            raise ValueError("Unknown statistic: %s" % name)
+
+    valid = ~np.isnan(data)
+    counts = valid.sum(axis=0)
+    filled = np.where(valid, data, 0.0)
+    total = filled.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(counts > 0, total / counts, np.nan)
+
+    results = {}
+    order_statistics = {"median", "min", "max", "q1", "q3", "iqr"}
+    if(len(order_statistics.intersection(statistics)) > 0 or len(percentiles) > 0):
+        # NaN values are sorted at the end of each column
+        sorted_data = np.sort(data, axis=0)
+        quantiles = {"min": 0.0, "q1": 0.25, "median": 0.5, "q3": 0.75, "max": 1.0}
+        for name in statistics:
+            if(name in quantiles):
+                results[name] = _sorted_quantile(
+                    sorted_data, counts, quantiles[name])
+        if("iqr" in statistics):
+            results["iqr"] = _sorted_quantile(sorted_data, counts, 0.75) - \
+                _sorted_quantile(sorted_data, counts, 0.25)
+        for percentile in percentiles:
+            if(percentile < 0 or percentile > 100):
+                raise ValueError("Percentiles must be between 0 and 100")
+            results["p%g" % percentile] = _sorted_quantile(
+                sorted_data, counts, percentile / 100)
+
+    for name in statistics:
+        if(name == "mean"):
+            results[name] = mean
+        elif(name == "sum"):
+            results[name] = np.where(counts > 0, total, np.nan)
+        elif(name == "count"):
+            results[name] = counts
+        elif(name == "std"):
+            deviations = np.where(valid, data - mean, 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                results[name] = np.where(counts > 1, np.sqrt(
+                    (deviations**2).sum(axis=0) / (counts - 1)), np.nan)
+
+    if(decimals is not None):
+        results = {name: (value if name == "count" else np.round(value, decimals))
+                   for name, value in results.items()}
+    return results
+
+
+################ COHORT MEAN #################
+# \brief: Function that computes the mean across subjects for each timepoint.
+# \parameters:
+#   @param <data>: 2-D array (subjects, timepoints) or list of 1-D arrays
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return 1-D array with one value per timepoint
+##############################################
+def cohort_mean(data, decimals=2):
+    return cohort_statistics(data, ("mean",), decimals=decimals)["mean"]
+
+
+################ COHORT SUM #################
+# \brief: Function that computes the sum across subjects for each timepoint.
+# \parameters:
+#   @param <data>: 2-D array (subjects, timepoints) or list of 1-D arrays
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return 1-D array with one value per timepoint
+#############################################
+def cohort_sum(data, decimals=2):
+    return cohort_statistics(data, ("sum",), decimals=decimals)["sum"]
+
+
+################ COHORT STD #################
+# \brief: Function that computes the sample standard deviation across subjects for each
+#   timepoint.
+# \parameters:
+#   @param <data>: 2-D array (subjects, timepoints) or list of 1-D arrays
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return 1-D array with one value per timepoint
+#############################################
+def cohort_std(data, decimals=2):
+    return cohort_statistics(data, ("std",), decimals=decimals)["std"]
@@ -0,0 +1,421 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON SCRIPT FOR THE DEVICE EMULATOR
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This script emulates many devices (PCB with COZIR sensor and firmware
+4_Codice_per_PCB_Interrupt) without hardware, to test the host pipeline (see
+<Live_ingestion>) at scale.
+
+    - CozirSensor emulates the "Z" request/response protocol of the COZIR sensor (9600
+      baud, polling mode "K 2"): each "Z" request returns the next CO2 value as
+      " Z 00412\r\n". The reply is parsed as done by Calibra() and Misura().
+    - DeviceEmulator emulates the output of the firmware on the USB serial port (115200
+      baud), one second at a time: calibration (Ambiente ppm frames until the first and
+      the last of 10 values differ by at most 20 ppm), heating of the wire (Tfilo frames
+      and messages) and measurement (CO2Sangue and DeltaCO2 frames, "Valore Co2 ppm"
+      line).
+
+The CO2 values come from a recorded session (CO2 column of a raw session CSV) or from a
+synthetic rebreathing curve (exponential rise, as the model used in
+<Exponential_fitting>), with a seeded random generator for each device so that runs are
+reproducible. The output of each device is written to a virtual serial port (pty pair,
+the slave path is printed) in real time or N times faster, or to a capture file. The
+COZIR port of a device (--sensor-port) answers with its own copy of the CO2 values, so
+that external clients do not take values from the output of the device.
+
+The firmware does not send the rebreathing marks, so the session files written by
+<Live_ingestion> for the emulated devices have no R1/R2 marks and <Batch_ingestion> does
+not load them until the marks are given with Live_ingestion --marks ("<source name> R1"
+at the start of the rebreathing, "<source name> R2" at the end). The synthetic sessions
+start the rebreathing after SYNTHETIC_PRE seconds of measurement and end it
+SYNTHETIC_REBREATHING seconds later (times printed at the start of the run).
+
+\Parameters: (command line)
+    @param <sources>: raw session CSV files to be replayed, one device each. If none
+            is given, synthetic curves are used.
+    @param <--devices>: number of emulated devices. Default value is 1 (or one for each
+            source).
+    @param <--speed>: N times real time. Default value is 1.
+    @param <--seed>: seed of the random generators. Default value is 0.
+    @param <--capture-dir>: write the output of each device to a capture file in this
+            directory (as fast as possible) instead of a virtual serial port.
+    @param <--sensor-port>: also open a virtual serial port for the COZIR protocol of
+            each device, to test firmware-like clients.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import asyncio
+import os
+import pty
+import tty
+import numpy as np
+import pandas as pd
+from Serial_protocol import CO2_SERIES, DELTA_SERIES
+
+COZIR_BAUDRATE = 9600
+# Samples of the calibration window and convergence threshold (Calibra())
+CALIBRATION_SAMPLES = 10
+CALIBRATION_THRESHOLD = 20
+# Temperatures of the heating phase (RISCALDAMENTO)
+TEMPERATURE_START = 25.0
+TEMPERATURE_HOT = 41.0
+TEMPERATURE_TARGET = 42.0
+# Seconds of measurement before the rebreathing and duration of the rebreathing of the
+# synthetic sessions
+SYNTHETIC_PRE = 360
+SYNTHETIC_REBREATHING = 120
+
+
+################ COZIR REPLY #################
+# \brief: Function that formats a reply of the COZIR sensor.
+# \parameters:
+#   @param <letter>: command letter (e.g. "Z")
+#   @param <value>: value of the reply
+# \return bytes, e.g. b" Z 00412\r\n"
+##############################################
+def cozir_reply(letter, value):
+    return (" %s %05d\r\n" % (letter, int(value))).encode()
+
+
+################ PARSE COZIR REPLY #################
+# \brief: Function that parses a reply of the COZIR sensor as done by the firmware: spaces
+#   are discarded, at most 8 characters are kept, the first one (command letter) is
+#   removed and the rest is converted with atoi().
+# \parameters:
+#   @param <reply>: bytes of a reply
+# \return integer value
+####################################################
+def parse_cozir_reply(reply):
+    buffer = bytes(c for c in reply.split(b"\n")[0] if c != 32)[:8]
+    digits = buffer[1:8].rstrip(b"\r")
+    sign = -1 if digits[:1] == b"-" else 1
+    digits = digits.lstrip(b"+-")
+    end = 0
+    while(end < len(digits) and 48 <= digits[end] <= 57):
+        end += 1
+    return sign*int(digits[:end]) if end > 0 else 0
+
+
+class CozirSensor:
+
+    ################ INIT #################
+    # \brief: Constructor of the sensor emulator.
+    # \parameters:
+    #   @param <values>: iterable with the CO2 values returned by the "Z" requests
+    #######################################
+    def __init__(self, values=()):
+        self.mode = 0
+        self.value = 0
+        self.set_source(values)
+
+    ################ SET SOURCE #################
+    # \brief: Function that changes the values returned by the next "Z" requests.
+    #############################################
+    def set_source(self, values):
+        self._values = iter(values)
+
+    ################ REQUEST #################
+    # \brief: Function that answers a command of the host.
+    # \parameters:
+    #   @param <command>: bytes of the command, e.g. b"Z\r\n" or b"K 2\r\n"
+    # \return bytes of the reply (the last value is repeated when the source is over)
+    ##########################################
+    def request(self, command):
+        fields = command.strip().split()
+        if(len(fields) == 0):
+            return b""
+        letter = fields[0].decode("ascii", errors="replace")
+        if(letter == "Z"):
+            self.value = int(round(next(self._values, self.value)))
+            return cozir_reply("Z", self.value)
+        if(letter == "K" and len(fields) > 1 and fields[1].isdigit()):
+            self.mode = int(fields[1])
+            return cozir_reply("K", self.mode)
+        return b" ?\r\n"
+
+
+################ AMBIENT VALUES #################
+# \brief: Generator of the ambient CO2 values read during the calibration.
+# \parameters:
+#   @param <rng>: numpy random generator
+#################################################
+def _ambient_values(rng):
+    ambient = rng.uniform(400, 450)
+    while True:
+        yield ambient + rng.normal(0, 3)
+
+
+################ SYNTHETIC SESSION #################
+# \brief: Function that generates a synthetic rebreathing curve: baseline, exponential
+#   rise after the start of the rebreathing (plus delay) and decay after the end.
+# \parameters:
+#   @param <rng>: numpy random generator
+#   @param <pre>: seconds before the start of the rebreathing
+#   @param <rebreathing>: duration of the rebreathing in seconds
+#   @param <post>: seconds after the start of the rebreathing
+# \return (ambient values generator, 1-D array of CO2 values)
+####################################################
+def synthetic_session(rng, pre=SYNTHETIC_PRE, rebreathing=SYNTHETIC_REBREATHING,
+                      post=1080):
+    t = np.arange(-pre, post + 1)
+    baseline = rng.uniform(1100, 1500)
+    B = rng.uniform(150, 400)
+    tau = rng.uniform(60, 200)
+    delay = rng.integers(30, 80)
+    response = np.where(t > delay, B*(1 - np.exp(-(t - delay)/tau)), 0)
+    end = rebreathing + delay
+    response = np.where(t > end, response*np.exp(-(t - end)/300.0), response)
+    co2 = np.round(baseline + response + rng.normal(0, 8, len(t)))
+    return _ambient_values(rng), co2
+
+
+################ RECORDED SESSION #################
+# \brief: Function that reads the CO2 values of a raw session CSV.
+# \parameters:
+#   @param <filename>: raw session CSV (layout read by <Dataframe_Creation>)
+#   @param <rng>: numpy random generator (ambient values of the calibration)
+# \return (ambient values generator, 1-D array of CO2 values)
+###################################################
+def recorded_session(filename, rng):
+    df = pd.read_csv(filename, sep=";", usecols=[1])
+    co2 = df.iloc[:, 0].values.astype(float)
+    return _ambient_values(rng), co2[~np.isnan(co2)]
+
+
+class DeviceEmulator:
+
+    ################ INIT #################
+    # \brief: Constructor of the device emulator.
+    # \parameters:
+    #   @param <ambient>: iterable with the ambient CO2 values (calibration)
+    #   @param <co2>: iterable with the CO2 values of the measurement
+    #   @param <rng>: numpy random generator (temperatures)
+    #######################################
+    def __init__(self, ambient, co2, rng):
+        self.sensor = CozirSensor()
+        self._ambient = ambient
+        self._co2 = co2
+        self._rng = rng
+        self.ppm_ambient = 0
+
+    ################ SENSOR COPY #################
+    # \brief: Function that returns a sensor with its own copy of the CO2 values of the
+    #   measurement, for the external clients of the COZIR port (the ambient values are
+    #   not copied: they are drawn from the random generator of the device).
+    # \return CozirSensor
+    ##############################################
+    def sensor_copy(self):
+        return CozirSensor(list(self._co2))
+
+    ################ POLL #################
+    # \brief: Function that polls the sensor as done by Calibra() and Misura().
+    #######################################
+    def _poll(self):
+        return parse_cozir_reply(self.sensor.request(b"Z\r\n"))
+
+    ################ SECONDS #################
+    # \brief: Generator of the output of the device, one second at a time.
+    # \return yields the bytes written on the serial port in each second
+    ##########################################
+    def seconds(self):
+        self.sensor.request(b"K 2\r\n")
+        yield b"Entering calibration process\r\n"
+
+        # Calibration: the last 10 values are kept until the first and the last differ
+        # by at most 20 ppm
+        self.sensor.set_source(self._ambient)
+        window = []
+        while True:
+            value = self._poll()
+            window = (window + [value])[-CALIBRATION_SAMPLES:]
+            yield ("{TIMEPLOT:Ambiente|D|Ambiente ppm:g-2n|T|%.2f}\r\n" % value).encode()
+            if(len(window) == CALIBRATION_SAMPLES and
+               abs(window[0] - window[-1]) <= CALIBRATION_THRESHOLD):
+                break
+        self.ppm_ambient = int((window[0] + window[-1])/2)
+
+        # Heating of the wire
+        second = 0
+        temperature = TEMPERATURE_START
+        while temperature < TEMPERATURE_TARGET:
+            second += 1
+            temperature = TEMPERATURE_TARGET + 0.5 - (TEMPERATURE_TARGET + 0.5 -
+                                                      TEMPERATURE_START)*np.exp(-second/20.0)
+            temperature += self._rng.normal(0, 0.05)
+            output = "{TIMEPLOT:Tfilo[°C]|D|Tfilo[C]:r-2n|T|%.2f}\r\n" % temperature
+            if(TEMPERATURE_HOT <= temperature <= TEMPERATURE_TARGET):
+                output += "The wire is too hot!65%\r\n"
+            yield output.encode("utf-8")
+
+        # Measurement
+        self.sensor.set_source(self._co2)
+        for _ in range(len(self._co2)):
+            value = self._poll()
+            delta = value - self.ppm_ambient
+            yield ("{TIMEPLOT:CO2 Sangue|D|%s:k-2n|T|%d}\r\n"
+                   "{TIMEPLOT:Delta CO2|D|%s:b-2n|T|%.2f}\r\n"
+                   "\r\nValore Co2 ppm: %d\r\n" % (CO2_SERIES, value, DELTA_SERIES,
+                                                   delta, value)).encode()
+
+
+################ OPEN PTY #################
+# \brief: Function that opens a virtual serial port (pty pair) in raw mode.
+# \return (master file descriptor, slave file descriptor, slave path)
+###########################################
+def open_pty():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    return master, slave, os.ttyname(slave)
+
+
+################ WRITE FD #################
+# \brief: Function that writes to a non blocking file descriptor, waiting (without
+#   blocking the event loop) while the reader is not reading.
+###########################################
+async def write_fd(fd, data):
+    loop = asyncio.get_running_loop()
+    view = memoryview(data)
+    while len(view) > 0:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            writable = loop.create_future()
+            loop.add_writer(fd, writable.set_result, None)
+            try:
+                await writable
+            finally:
+                loop.remove_writer(fd)
+
+
+################ RUN DEVICE #################
+# \brief: Function that writes the output of a device at N times real time.
+# \parameters:
+#   @param <emulator>: DeviceEmulator
+#   @param <fd>: file descriptor (pty master) or binary file object (capture)
+#   @param <speed>: N times real time; 0 to write as fast as possible
+# \return number of seconds emulated
+#############################################
+async def run_device(emulator, fd, speed=1):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    count = 0
+    for count, output in enumerate(emulator.seconds(), 1):
+        if(isinstance(fd, int)):
+            await write_fd(fd, output)
+        else:
+            fd.write(output)
+        if(speed > 0):
+            # Sleep until the next emulated second (no drift over long sessions)
+            await asyncio.sleep(max(start + count/speed - loop.time(), 0))
+    return count
+
+
+################ SERVE SENSOR #################
+# \brief: Function that answers the COZIR commands written on a virtual serial port.
+# \parameters:
+#   @param <sensor>: CozirSensor
+#   @param <fd>: pty master file descriptor
+###############################################
+async def serve_sensor(sensor, fd):
+    loop = asyncio.get_running_loop()
+    buffer = b""
+    while True:
+        readable = loop.create_future()
+        loop.add_reader(fd, readable.set_result, None)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        try:
+            buffer += os.read(fd, 1024)
+        except (BlockingIOError, OSError):
+            continue
+        while b"\n" in buffer:
+            command, buffer = buffer.split(b"\n", 1)
+            await write_fd(fd, sensor.request(command))
+
+
+################ RUN DEVICES #################
+# \brief: Function that emulates many devices at the same time.
+# \parameters:
+#   @param <emulators>: list of DeviceEmulator
+#   @param <speed>: N times real time
+#   @param <capture_dir>: if not None, captures are written to this directory
+#   @param <sensor_port>: if True a COZIR virtual port is opened for each device
+# \return list with the number of seconds emulated by each device
+##############################################
+async def run_devices(emulators, speed=1, capture_dir=None, sensor_port=False):
+    tasks = []
+    files = []
+    servers = []
+    for i, emulator in enumerate(emulators):
+        if(capture_dir is not None):
+            os.makedirs(capture_dir, exist_ok=True)
+            capture = open(os.path.join(capture_dir, "device_%03d.txt" % i), "wb")
+            files.append(capture)
+            tasks.append(run_device(emulator, capture, 0))
+            continue
+        master, slave, path = open_pty()
+        files.extend((master, slave))
+        print("device %d: %s" % (i, path))
+        if(sensor_port):
+            sensor_master, sensor_slave, sensor_path = open_pty()
+            files.extend((sensor_master, sensor_slave))
+            servers.append(asyncio.ensure_future(
+                serve_sensor(emulator.sensor_copy(), sensor_master)))
+            print("device %d COZIR: %s" % (i, sensor_path))
+        tasks.append(run_device(emulator, master, speed))
+
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for server in servers:
+            server.cancel()
+        for item in files:
+            if(isinstance(item, int)):
+                os.close(item)
+            else:
+                item.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulation of the devices")
+    parser.add_argument("sources", nargs="*",
+                        help="raw session CSV files to be replayed (default: synthetic)")
+    parser.add_argument("--devices", type=int, default=None,
+                        help="number of emulated devices (default: 1 or one per source)")
+    parser.add_argument("--speed", type=float, default=1,
+                        help="N times real time (default: 1)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random generators (default: 0)")
+    parser.add_argument("--capture-dir", default=None,
+                        help="write capture files instead of virtual serial ports")
+    parser.add_argument("--sensor-port", action="store_true",
+                        help="open a COZIR virtual serial port for each device")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    devices = args.devices or max(len(args.sources), 1)
+    generators = [np.random.default_rng(seed)
+                  for seed in np.random.SeedSequence(args.seed).spawn(devices)]
+    emulators = []
+    for i, rng in enumerate(generators):
+        if(len(args.sources) > 0):
+            ambient, co2 = recorded_session(args.sources[i % len(args.sources)], rng)
+        else:
+            ambient, co2 = synthetic_session(rng)
+        emulators.append(DeviceEmulator(ambient, co2, rng))
+    if(len(args.sources) == 0):
+        print("Rebreathing marks: R1 after %d s and R2 after %d s of measurement" % (
+            SYNTHETIC_PRE, SYNTHETIC_PRE + SYNTHETIC_REBREATHING))
+
+    try:
+        seconds = asyncio.run(run_devices(emulators, args.speed, args.capture_dir,
+                                          args.sensor_port))
+        print("Emulated seconds: %s" % seconds)
+    except KeyboardInterrupt:
+        pass
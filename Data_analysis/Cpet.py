@@ -0,0 +1,214 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR THE CPET DATA
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module reads the breath-by-breath EtCO2 values of the CPET (CPET_P_T.csv and
+CPET_L_T.csv: one row per subject, subject label in the first column, "START" and "END"
+between the breaths at the start and at the end of the rebreathing) and aligns them with
+the PtCO2 timelines of the PCB and Sentec devices.
+
+All the rows are parsed once in a CpetTable: the breaths of each subject (markers and
+empty cells removed) in a NaN-padded float matrix, with the number of breaths before the
+START and END markers found with array operations on the whole table. Rows without the
+markers are reported and kept without times (NaN), as the rows without breaths between
+START and END.
+The CPET has no time stamps: the breaths between START and END are assumed evenly spaced
+over the rebreathing (REBREATHING_DURATION, as the "Start/End rebreathing" lines of the
+analysis scripts), and the same breath period is used before and after. The time of each
+column of a SubjectMatrix (see <Subject_matrix>) is given by the window size, with 0 at
+the baseline window (start of the rebreathing), so the EtCO2 is interpolated on the
+PtCO2 time grid and the three devices are compared point by point (cohort_alignment()).
+------------------------------------------------------------------------------------------
+'''
+
+import numpy as np
+import pandas as pd
+
+START_MARK = "START"
+END_MARK = "END"
+# Duration of the rebreathing in seconds (4 windows of 30 s, 12 windows of 10 s)
+REBREATHING_DURATION = 120
+ALIGNMENT_COLUMNS = ("subject", "cpet", "time", "pcb", "sentec", "etco2")
+
+
+class CpetTable:
+
+    ################ INIT #################
+    # \brief: Constructor of the CPET table.
+    # \parameters:
+    #   @param <values>: 2-D array (subjects, breaths), NaN after the last breath
+    #   @param <counts>: number of breaths of each subject
+    #   @param <labels>: list of subject labels (e.g. "S01")
+    #   @param <start>: breaths before the START marker (first breath of the rebreathing)
+    #   @param <end>: breaths before the END marker
+    #######################################
+    def __init__(self, values, counts, labels, start, end):
+        self.values = np.asarray(values, dtype=float)
+        if(self.values.ndim != 2):
+            raise ValueError("values must be a 2-D array (subjects, breaths)")
+        self.counts = np.asarray(counts, dtype=int)
+        self.labels = [str(label) for label in labels]
+        self.start = np.asarray(start, dtype=int)
+        self.end = np.asarray(end, dtype=int)
+        if(not (len(self.labels) == len(self.counts) == len(self.start) ==
+                len(self.end) == self.values.shape[0])):
+            raise ValueError("one label, count, START and END are needed for each subject")
+
+    ################ FROM DATAFRAME #################
+    # \brief: Function that parses the CPET table.
+    # \parameters:
+    #   @param <df>: pandas DataFrame read with header=None (subject label in the first
+    #           column, breaths and markers in the following columns)
+    # \return CpetTable, START and END set to 0 for the rows without the markers
+    #################################################
+    @classmethod
+    def from_dataframe(cls, df):
+        cells = df.iloc[:, 1:]
+        text = cells.astype(str).apply(lambda column: column.str.strip()).to_numpy()
+        starts = text == START_MARK
+        ends = text == END_MARK
+        missing = ~starts.any(axis=1) | ~ends.any(axis=1)
+        if(missing.any()):
+            print("Warning: START or END missing for the CPET subjects %s, not aligned" %
+                  list(df.iloc[np.flatnonzero(missing), 0]))
+
+        values = cells.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        breath = ~np.isnan(values)
+        # Breaths before each cell: position of the breath in the row without markers
+        before = np.cumsum(breath, axis=1) - breath
+        rows = np.arange(len(values))
+        start = np.where(missing, 0, before[rows, np.argmax(starts, axis=1)])
+        end = np.where(missing, 0, before[rows, np.argmax(ends, axis=1)])
+
+        counts = breath.sum(axis=1)
+        matrix = np.full((len(values), max(int(counts.max(initial=0)), 1)), np.nan)
+        matrix[np.nonzero(breath)[0], before[breath]] = values[breath]
+        return cls(matrix, counts, df.iloc[:, 0], start, end)
+
+    @property
+    def subjects(self):
+        return self.values.shape[0]
+
+    ################ BREATHS #################
+    # \brief: Function that returns the breaths of a subject.
+    # \parameters:
+    #   @param <subject>: row of the subject
+    # \return 1-D array
+    ##########################################
+    def breaths(self, subject):
+        return self.values[subject, :self.counts[subject]]
+
+    ################ BREATH TIMES #################
+    # \brief: Function that computes the time of each breath from the start of the
+    #   rebreathing (breaths evenly spaced between START and END).
+    # \parameters:
+    #   @param <duration>: duration of the rebreathing in seconds
+    # \return 2-D array (subjects, breaths), NaN after the last breath and for the
+    #   subjects without breaths between START and END
+    ###############################################
+    def breath_times(self, duration=REBREATHING_DURATION):
+        breaths = self.end - self.start
+        period = np.where(breaths > 0, duration/np.maximum(breaths, 1), np.nan)
+        times = (np.arange(self.values.shape[1]) - self.start[:, None])*period[:, None]
+        return np.where(np.isnan(self.values), np.nan, times)
+
+    ################ RESAMPLE #################
+    # \brief: Function that interpolates the EtCO2 of all the subjects on a time grid.
+    # \parameters:
+    #   @param <times>: 1-D array (same grid for all the subjects) or 2-D array (one row
+    #           per subject), seconds from the start of the rebreathing
+    #   @param <duration>: duration of the rebreathing in seconds
+    # \return 2-D array (subjects, times), NaN outside the breaths of each subject
+    ###########################################
+    def resample(self, times, duration=REBREATHING_DURATION):
+        return interpolate_rows(self.breath_times(duration), self.values, times)
+
+
+################ INTERPOLATE ROWS #################
+# \brief: Function that interpolates each row of a matrix on its own time grid with a
+#   single np.interp() call: the rows are put one after the other on the time axis.
+# \parameters:
+#   @param <xp>: 2-D array with the increasing times of the samples (NaN or inf not
+#           valid)
+#   @param <fp>: 2-D array with the samples, same shape
+#   @param <x>: 1-D array (same for all the rows) or 2-D array of times to interpolate
+# \return 2-D array (rows of xp, len(x)), NaN outside the samples of each row
+###################################################
+def interpolate_rows(xp, fp, x):
+    xp = np.asarray(xp, dtype=float)
+    fp = np.asarray(fp, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), (len(xp),) + np.shape(x)[-1:])
+    valid = np.isfinite(xp) & ~np.isnan(fp)
+    counts = valid.sum(axis=1)
+    if(counts.sum() == 0):
+        return np.full(x.shape, np.nan)
+
+    first = np.where(counts > 0, np.nanmin(np.where(valid, xp, np.inf), axis=1), np.nan)
+    last = np.where(counts > 0, np.nanmax(np.where(valid, xp, -np.inf), axis=1), np.nan)
+    # Each row moved after the previous one
+    span = np.nanmax(np.abs(np.concatenate((xp[valid], x[np.isfinite(x)])))) + 1
+    shift = 3*span*np.arange(len(xp))[:, None]
+    result = np.interp((x + shift).ravel(), (xp + shift)[valid], fp[valid]).reshape(x.shape)
+    with np.errstate(invalid="ignore"):
+        inside = (x >= first[:, None]) & (x <= last[:, None])
+    return np.where(inside, result, np.nan)
+
+
+################ MATRIX TIMES #################
+# \brief: Function that computes the time of each column of a subject matrix from the
+#   start of the rebreathing (0 at the baseline window).
+# \parameters:
+#   @param <matrix>: SubjectMatrix
+#   @param <seconds>: window size of the merged table (10 or 30)
+# \return 1-D array, seconds
+###############################################
+def matrix_times(matrix, seconds):
+    return (np.arange(matrix.samples) - matrix.baseline_position)*float(seconds)
+
+
+################ READ CPET #################
+# \brief: Function that reads a CPET CSV file (first row is not a header).
+# \parameters:
+#   @param <filename>: CSV file (e.g. CPET_P_T.csv)
+# \return CpetTable
+############################################
+def read_cpet(filename):
+    return CpetTable.from_dataframe(pd.read_csv(filename, sep=";", header=None))
+
+
+################ COHORT ALIGNMENT #################
+# \brief: Function that aligns the three devices on the time grid of the PCB device:
+#   the Sentec data and the EtCO2 are interpolated at the times of the PCB windows. The
+#   subjects are matched by position (row i of the CPET table is column i of the merged
+#   tables, as subject_id in the analysis scripts). With a different number of subjects
+#   only the first rows, common to the three tables, are aligned.
+# \parameters:
+#   @param <cpet>: CpetTable
+#   @param <pcb_matrix>, <sentec_matrix>: SubjectMatrix of the two devices
+#   @param <seconds>: window size of the merged tables (10 or 30)
+#   @param <duration>: duration of the rebreathing in seconds
+# \return pandas DataFrame (ALIGNMENT_COLUMNS), one row for each common subject and
+#   window
+###################################################
+def cohort_alignment(cpet, pcb_matrix, sentec_matrix, seconds,
+                     duration=REBREATHING_DURATION):
+    subjects = min(cpet.subjects, pcb_matrix.subjects, sentec_matrix.subjects)
+    if(not (cpet.subjects == pcb_matrix.subjects == sentec_matrix.subjects)):
+        print("Warning: different number of subjects (CPET %d, PCB %d, Sentec %d), only "
+              "the first %d are aligned" % (cpet.subjects, pcb_matrix.subjects,
+                                            sentec_matrix.subjects, subjects))
+    times = matrix_times(pcb_matrix, seconds)
+    sentec_times = np.broadcast_to(matrix_times(sentec_matrix, seconds),
+                                   sentec_matrix.values.shape)
+    sentec = interpolate_rows(sentec_times, sentec_matrix.values, times)[:subjects]
+    etco2 = cpet.resample(times, duration)[:subjects]
+
+    samples = pcb_matrix.samples
+    return pd.DataFrame({"subject": np.repeat(pcb_matrix.labels[:subjects], samples),
+                         "cpet": np.repeat(cpet.labels[:subjects], samples),
+                         "time": np.tile(times, subjects),
+                         "pcb": pcb_matrix.values[:subjects].astype(float).ravel(),
+                         "sentec": sentec.ravel(),
+                         "etco2": np.round(etco2.ravel(), 2)})
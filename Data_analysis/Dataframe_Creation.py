@@ -7,14 +7,25 @@ Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for E
 This script is used to extract averages value in the measurement data every other sample,
 where the number of samples to be considered can vary. Some quantities has to be changed
 when running the script, depending on user's needs.
+To process a whole directory of sessions at once, use the script <Batch_ingestion>.
 
 \Parameters:
     @param <filename.csv>: at the beginning of the script change the file name to
             associate the running of the script with the desired CSV file.
+    @param flag_streaming: if 1 the CSV file is read in chunks of <chunksize> rows and
+            the windowed values are computed incrementally (for very long recordings
+            that do not fit in memory, see the module <Session_stream>).
+    @param flag_columnar_store: if 1 the tables are also written in the columnar session
+            store (see the module <Session_store>), next to the CSV files.
+    @param flag_headless: if 1 the figures are not displayed: they are written to the
+            directory Figures (see the module <Figure_rendering>), for unattended runs.
     @param df.columns: change the names of the columns (ONLY AFTER THE COLUMN NAMED
             'SENTEC') with the name you want, if other columns are present.
     @param sample_number: number of samples in the interval on which the average is
             computed. Default value is 10.
+    @param sample_numbers: list of window sizes exported in a single pass on the same
+            recording (files CO2_df_<n>_median_exp.csv, CO2_df_<n>_mean_exp.csv and the
+            Sentec ones). Leave it empty to export only <sample_number>.
 ------------------------------------------------------------------------------------------
 '''
 
@@ -24,51 +35,72 @@ import numpy as np
 import math
 import matplotlib.pyplot as plt
 import statistics as stat
+from Window_statistics import window_statistics, multi_resolution_statistics, mark_start
+from Session_stream import collect_window_statistics
+from Session_store import write_table
+from Figure_rendering import use_headless_backend, show_figures
 
+filename = '18_07L.csv'
 sample_number = 30
+sample_numbers = [10, 30, 60]
+flag_streaming = 0  # 1 to read the CSV file in chunks
+chunksize = 100000
+flag_columnar_store = 0  # 1 to write the columnar session store
+flag_headless = 0  # 1 to save the figures without displaying them
+
+if(flag_headless):
+    use_headless_backend()
 
 # Dataframe import for aggregate data analysis
 print("------------------------------- New run ---------------------------------")
-df = pd.read_csv('18_07L.csv', sep=";")
-df.columns = ("Timestamp_CO2", "CO2Sange", "Timestamp_deltaCO2",
-              "DeltaCO2", "Sentec", "Rebreathing_mark")
-print(df.head(10))
-print("\n")
-print("Type of Sentec:")
-print(type(df[["Sentec"]]))
-print("\n")
-print(df[["Sentec"]])
-
-# Rebreathing marks extraction
-options = ["R1", "R2"]
-print(df[df["Rebreathing_mark"].isin(options)])
-
-index_start_rebreathing = df[df["Rebreathing_mark"] == "R1"].index.values
-print("\nIndex start rebreathing")
-print(index_start_rebreathing)
-print(type(index_start_rebreathing))
-start_rebreathing = int(index_start_rebreathing[0])
-print(start_rebreathing)
-print(type(start_rebreathing))
-
-index_end_rebreathing = df[df["Rebreathing_mark"] == "R2"].index.values
-print("\nIndex end rebreathing\n")
-print(index_end_rebreathing)
-end_rebreathing = int(index_end_rebreathing[0])
-print(end_rebreathing)
-print(type(end_rebreathing))
-
-# Conversion of CO2 and Sentec data from a dataframe object to array
-CO2_data = df.iloc[:, 1].values
-print("\nCO2 Raw data array:")
-print(CO2_data)
-print(type(CO2_data))
-
-print("\nSentec Raw data array:")
-Sentec_data = df.iloc[:, 4].values
-# Sentec_data = list(map(float, Sentec_data))
-print(Sentec_data)
-print(type(Sentec_data))
+if(flag_streaming == 0):
+    df = pd.read_csv(filename, sep=";")
+    df.columns = ("Timestamp_CO2", "CO2Sange", "Timestamp_deltaCO2",
+                  "DeltaCO2", "Sentec", "Rebreathing_mark")
+    print(df.head(10))
+    print("\n")
+    print("Type of Sentec:")
+    print(type(df[["Sentec"]]))
+    print("\n")
+    print(df[["Sentec"]])
+
+    # Rebreathing marks extraction
+    options = ["R1", "R2"]
+    print(df[df["Rebreathing_mark"].isin(options)])
+
+    index_start_rebreathing = df[df["Rebreathing_mark"] == "R1"].index.values
+    print("\nIndex start rebreathing")
+    print(index_start_rebreathing)
+    print(type(index_start_rebreathing))
+    start_rebreathing = int(index_start_rebreathing[0])
+    print(start_rebreathing)
+    print(type(start_rebreathing))
+
+    index_end_rebreathing = df[df["Rebreathing_mark"] == "R2"].index.values
+    print("\nIndex end rebreathing\n")
+    print(index_end_rebreathing)
+    end_rebreathing = int(index_end_rebreathing[0])
+    print(end_rebreathing)
+    print(type(end_rebreathing))
+
+    # Conversion of CO2 and Sentec data from a dataframe object to array
+    CO2_data = df.iloc[:, 1].values
+    print("\nCO2 Raw data array:")
+    print(CO2_data)
+    print(type(CO2_data))
+
+    print("\nSentec Raw data array:")
+    Sentec_data = df.iloc[:, 4].values
+    # Sentec_data = list(map(float, Sentec_data))
+    print(Sentec_data)
+    print(type(Sentec_data))
+else:
+    # Streaming mode: the recording is never loaded as a whole, rebreathing marks are
+    # located while reading and all the window sizes are computed in the same pass
+    resolutions_device, resolutions_sentec, start_rebreathing, end_rebreathing = collect_window_statistics(
+        filename, [sample_number] + sample_numbers, ("mean", "median"), chunksize)
+    print("\nIndex start rebreathing: %s" % start_rebreathing)
+    print("Index end rebreathing: %s" % end_rebreathing)
 
 
 '''
@@ -79,58 +111,34 @@ Firstly all data from the beginning of the procedure to the
 start of the rebreathing phase are summed and an average on this value is computed.
 
 Then, given a specific window of samples, the average value on this window is computed
-and save in an array. Finally, the array is reversed, ready to be merged with the other
-array that will be generated (this time sequentially) from the start rebreathing
+and save in an array. Windows are anchored at the start rebreathing index and walk
+backward, so the samples are reshaped in a matrix (one row per window, see the module
+<Window_statistics>) and all the windows are averaged at once, already in chronological
+order and ready to be merged with the array generated from the start rebreathing
 index down.
 ------------------------------------------------------------------------------------------
 '''
 # Pre-rebreathing Mean value extraction
-total_CO2 = 0
-average_total_CO2 = 0
-for i in range(start_rebreathing, 0, -1):
-    total_CO2 += CO2_data[i]
-
-# print("\n\nTotal CO2 before rebreathing:")
-# print(total_CO2)
-
-average_total_CO2 = float(total_CO2/start_rebreathing)
-# print("\n\nAverage CO2 before rebreathing:")
-# print(average_total_CO2)
-# print("\n\n")
-
-# Pre-rebreathing Mean interval values extraction (10 samples average)
-total_CO2 = 0
-total_Sentec = 0
-partial_total_co2 = 0
-partial_total_sentec = 0
-add_co2 = 0
-add_sentec = 0
-averages_device_pre = []
-averages_sentec_pre = []
-j = 0
-
-for i in range(start_rebreathing, 0, -1):
-    partial_total_co2 += CO2_data[i]
-    partial_total_sentec += Sentec_data[i]
-    # print(CO2_data[i])
-    if((start_rebreathing-i+1) % sample_number == 0 and (start_rebreathing-i+1) != 0):
-        # print(i)
-        add_co2 = round(float(partial_total_co2/sample_number), 2)
-        add_sentec = round(float(partial_total_sentec/sample_number), 2)
-        averages_device_pre.append(add_co2)
-        averages_sentec_pre.append(add_sentec)
-        j = j + 1
-        partial_total_co2 = 0
-        partial_total_sentec = 0
-
-# print("\n\nArray of average values, first part")
-# print(averages_device_pre)
-
-# Need of reverting the array because the for loop is done from
-# start rebreathing up, so values need to be reindexed
-averages_device_pre.reverse()
-averages_sentec_pre.reverse()
-# print(averages_device_pre)
+if(flag_streaming == 0):
+    average_total_CO2 = float(
+        np.sum(CO2_data[1:start_rebreathing+1].astype(float))/start_rebreathing)
+    # print("\n\nAverage CO2 before rebreathing:")
+    # print(average_total_CO2)
+
+# Windowed statistics of both devices, PRE and POST start of rebreathing
+# (PRE arrays are already in chronological order, no need of reverting them)
+if(flag_streaming == 0):
+    statistics_device = window_statistics(
+        CO2_data, start_rebreathing, sample_number, ("mean", "median"))
+    statistics_sentec = window_statistics(
+        Sentec_data, start_rebreathing, sample_number, ("mean", "median"))
+else:
+    statistics_device = resolutions_device[sample_number]
+    statistics_sentec = resolutions_sentec[sample_number]
+
+# Pre-rebreathing Mean interval values extraction
+averages_device_pre = statistics_device["mean"][0].tolist()
+averages_sentec_pre = statistics_sentec["mean"][0].tolist()
 averages_device_pre.append("START")  # to martk start rebreathing
 averages_sentec_pre.append("START")
 # print(averages_device_pre)
@@ -144,28 +152,8 @@ Data from the start of the rebreathing phase are summed and an averaged.
 Resulting vector will be attached to the previously generated one.
 ------------------------------------------------------------------------------------------
 '''
-partial_total_co2 = 0
-partial_total_sentec = 0
-averages_device_post = []
-averages_sentec_post = []
-add_co2 = 0
-add_sentec = 0
-j = 0
-
-for i in range(start_rebreathing+1, len(CO2_data), 1):
-    partial_total_co2 += CO2_data[i]
-    partial_total_sentec += Sentec_data[i]
-    if((i-(start_rebreathing+1)+1) % sample_number == 0 and (i-(start_rebreathing+1)+1) != 0):
-        add_co2 = round(float(partial_total_co2/sample_number), 2)
-        add_sentec = round(float(partial_total_sentec/sample_number), 2)
-        averages_device_post.append(add_co2)
-        averages_sentec_post.append(add_sentec)
-        j = j + 1
-        partial_total_co2 = 0
-        partial_total_sentec = 0
-
-# print("\n\nArray of average values, second part")
-# print(averages_device_post)
+averages_device_post = statistics_device["mean"][1].tolist()
+averages_sentec_post = statistics_sentec["mean"][1].tolist()
 
 # Linking the two array parts and creating a df
 averages_device_complete = np.concatenate(
@@ -191,8 +179,12 @@ print("\n\nSentec averages dataframe:")
 print(Sentec_df_mean)
 
 # Exporting data to CSV
-CO2_df_mean.to_csv('CO2_df_exp_mean.csv', sep=';')
-Sentec_df_mean.to_csv('Sentec_df_exp_mean.csv', sep=';')
+if(flag_columnar_store):
+    write_table(CO2_df_mean, 'CO2_df_exp_mean', index=True)
+    write_table(Sentec_df_mean, 'Sentec_df_exp_mean', index=True)
+else:
+    CO2_df_mean.to_csv('CO2_df_exp_mean.csv', sep=';')
+    Sentec_df_mean.to_csv('Sentec_df_exp_mean.csv', sep=';')
 
 
 '''
@@ -241,36 +233,14 @@ Firstly all data from the beginning of the procedure to the
 start of the rebreathing phase are grouped and median values are computed.
 
 Then, given a specific window of samples, the median value on this window is computed
-and save in an array. Finally, the array is reversed, ready to be merged with the other
-array that will be generated (this time sequentially) from the start rebreathing
-index down.
+and save in an array. Medians are computed together with the averages by the same
+windowing engine, so the array is already in chronological order and ready to be merged
+with the array generated from the start rebreathing index down.
 ------------------------------------------------------------------------------------------
 '''
 # Pre-rebreathing Median interval values extraction
-median_partial_array_device = []
-median_partial_array_sentec = []
-median_array_device_pre = []
-median_array_sentec_pre = []
-
-for i in range(start_rebreathing, 0, -1):
-    median_partial_array_device.append(round(float(CO2_data[i]), 2))
-    median_partial_array_sentec.append(round(float(Sentec_data[i]), 2))
-    # print(CO2_data[i])
-    if((start_rebreathing-i+1) % sample_number == 0 and (start_rebreathing-i+1) != 0):
-        median_array_device_pre.append(round(float(
-            stat.median(median_partial_array_device)), 2))
-        median_array_sentec_pre.append(round(float(
-            stat.median(median_partial_array_sentec)), 2))
-        # print(median_array_sentec_pre)
-        # print(median_array_device_pre)
-        median_partial_array_device = []
-        median_partial_array_sentec = []
-
-# Need of reverting the array because the for loop is done from
-# start rebreathing up, so values need to be reindexed
-median_array_device_pre.reverse()
-median_array_sentec_pre.reverse()
-# print(median_array_device_pre)
+median_array_device_pre = statistics_device["median"][0].tolist()
+median_array_sentec_pre = statistics_sentec["median"][0].tolist()
 
 median_array_device_pre.append("START")  # to martk start rebreathing
 median_array_sentec_pre.append("START")
@@ -285,29 +255,8 @@ computed.
 Resulting vector will be attached to the previously generated one.
 ------------------------------------------------------------------------------------------
 '''
-median_partial_array_device = []
-median_partial_array_sentec = []
-median_array_device_post = []
-median_array_sentec_post = []
-
-median_device = []
-median_sentec = []
-
-for i in range(start_rebreathing+1, len(CO2_data), 1):
-    median_partial_array_device.append(round(float(CO2_data[i]), 2))
-    median_partial_array_sentec.append(round(float(Sentec_data[i]), 2))
-    if((i-(start_rebreathing+1)+1) % sample_number == 0 and (i-(start_rebreathing+1)+1) != 0):
-        median_array_device_post.append(
-            round(float(stat.median(median_partial_array_device)), 2))
-        median_array_sentec_post.append(round(float(
-            stat.median(median_partial_array_sentec)), 2))
-        # print(median_array_sentec_post)
-        # print(median_array_device_post)
-        median_partial_array_device = []
-        median_partial_array_sentec = []
-
-# print("\n\nArray of average values, second part")
-# print(averages_device_post)
+median_array_device_post = statistics_device["median"][1].tolist()
+median_array_sentec_post = statistics_sentec["median"][1].tolist()
 
 # Linking the two array parts and creating a df
 median_device = np.concatenate(
@@ -335,8 +284,39 @@ print("\n\nSentec averages dataframe:")
 print(Sentec_df_median)
 
 # Exporting data to CSV
-CO2_df_median.to_csv('CO2_df_exp_median.csv', sep=';')
-Sentec_df_median.to_csv('Sentec_df_exp_median.csv', sep=';')
+if(flag_columnar_store):
+    write_table(CO2_df_median, 'CO2_df_exp_median', index=True)
+    write_table(Sentec_df_median, 'Sentec_df_exp_median', index=True)
+else:
+    CO2_df_median.to_csv('CO2_df_exp_median.csv', sep=';')
+    Sentec_df_median.to_csv('Sentec_df_exp_median.csv', sep=';')
+
+'''
+------------------------------------------------------------------------------------------
+MULTI-RESOLUTION export
+
+Mean and median values for all the window sizes in <sample_numbers> are computed on the
+same recording in a single pass (longer windows are built from the shorter ones) and
+exported with the same layout of the files above.
+------------------------------------------------------------------------------------------
+'''
+if(len(sample_numbers) > 0):
+    if(flag_streaming == 0):
+        resolutions_device = multi_resolution_statistics(
+            CO2_data, start_rebreathing, sample_numbers, ("mean", "median"))
+        resolutions_sentec = multi_resolution_statistics(
+            Sentec_data, start_rebreathing, sample_numbers, ("mean", "median"))
+    for n in sample_numbers:
+        for statistic in ("mean", "median"):
+            for device, resolutions in (("CO2", resolutions_device), ("Sentec", resolutions_sentec)):
+                df_resolution = pd.DataFrame(
+                    mark_start(*resolutions[n][statistic]))
+                name = '%s_df_%s_%s_exp' % (device, n, statistic)
+                if(flag_columnar_store):
+                    write_table(df_resolution, name, index=True)
+                else:
+                    df_resolution.to_csv(name + '.csv', sep=';')
+        print("\nExported resolution: %s samples" % n)
 
 '''
 ------------------------------------------------------------------------------------------
@@ -404,4 +384,4 @@ plt.xlabel('Time stamp')
 plt.ylabel('Measured value [ppm]')
 plt.legend(['Mean', 'Median'], loc="upper left")
 
-plt.show()
+show_figures(flag_headless, 'Figures', 'Dataframe_Creation')
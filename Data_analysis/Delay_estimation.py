@@ -0,0 +1,272 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR DELAY ESTIMATION
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module estimates the delay of the response of every subject, instead of the values
+read on the plots of a single subject in <Aggregated_data_analysis_3> (delay_pcb = 19,
+delay_sentec = 18, delay_phys = 14, subject S03 of 9-02-2022).
+
+The data are prepared as in the script (data with 10s resolution, from the start of the
+rebreathing, with 10 samples equal to the first value added before) and compared with:
+    - the stimulus built in the "PLOT OF THE STIMULUS" section of the script (start of
+      the rebreathing after 10 samples, physiological delay of 5 samples, exponential
+      rise and decay), see stimulus()
+    - the Sentec data of the same subject (delay of the PCB device with respect to the
+      Sentec device)
+The rate of change of the data (first differences) is correlated: the rise of a sensor
+with a first order response is fastest at its start, so with respect to the rising edge
+of the stimulus (its positive first differences) the lag of the maximum of the
+normalized cross-correlation gives the start of the rise, i.e. the delay used by
+<Exponential_fitting>: STIMULUS_ONSET plus the lag. The cross-correlations of all the
+subjects are computed at once with FFTs along the rows of the matrix (O(n log n) for
+each subject) and the maximum is refined below the sample with a parabola through the
+three samples around it. A first estimate of the
+time constant is also given: time from the start of the rise to 63% of the final value.
+
+Output file (when run as a script): Delay_estimates.csv, one row for each subject and
+site. The delays can be used by <Exponential_fitting> (--auto-delay).
+
+\Parameters: (command line)
+    @param <--sample-number>: window size of the merged tables. Default value is 10.
+    @param <--max-lag>: maximum lag searched, in samples. Default value is 40.
+    @param <--columnar-store>: read the merged tables from the columnar session store
+            (see the module <Session_store>).
+    @param <--output>: output CSV file. Default is Delay_estimates.csv.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import fft
+
+# Samples added before the start of the rebreathing (as in <Exponential_fitting>)
+PADDING = 10
+# Physiological delay of the stimulus after the start of the rebreathing, samples
+PHYSIOLOGICAL_DELAY = 5
+# First sample of the rise of the stimulus in the padded array
+STIMULUS_ONSET = PADDING + PHYSIOLOGICAL_DELAY
+DELAY_COLUMNS = ("subject", "site", "lag_pcb_stimulus", "corr_pcb_stimulus",
+                 "lag_sentec_stimulus", "corr_sentec_stimulus", "lag_pcb_sentec",
+                 "corr_pcb_sentec", "delay_pcb", "delay_sentec", "tau_pcb", "tau_sentec")
+
+
+################ STIMULUS #################
+# \brief: Function that builds the stimulus of the script (PCO2 in mmHg).
+# \parameters:
+#   @param <length>: minimum length of the array (padded with the baseline)
+#   @param <interval_duration>: samples of the rise and of the decay
+#   @param <tau>: time constant of the rise (the decay has tau/2)
+#   @param <amplitude>: amplitude of the rise
+#   @param <baseline>: value before and after the stimulus
+# \return 1-D array
+###########################################
+def stimulus(length=0, interval_duration=12, tau=2.5, amplitude=5.0, baseline=40):
+    i = np.arange(interval_duration)
+    rise = amplitude*(1 - np.exp(-i/tau))
+    rise = rise[rise < amplitude - 0.5]
+    plateau = rise[-1]
+    hold = np.full(max(interval_duration - len(rise) - 1, 0), plateau)
+    decay = plateau*np.exp(-i/(tau/2))
+    decay = decay[decay > 0.01]
+    decay = np.append(decay, np.zeros(interval_duration - len(decay)))
+    values = np.concatenate((np.zeros(STIMULUS_ONSET), rise, hold, decay)) + baseline
+    return np.append(values, np.full(max(length - len(values), 0), float(baseline)))
+
+
+################ PADDED RESPONSES #################
+# \brief: Function that prepares the data of all the subjects as in the script: data
+#   from the start of the rebreathing, with PADDING samples equal to the first value
+#   added before.
+# \parameters:
+#   @param <values>: 2-D array (subjects, timepoints)
+#   @param <start_position>: position of the start of the rebreathing in the rows
+# \return 2-D array (subjects, PADDING + timepoints after the start)
+###################################################
+def padded_responses(values, start_position):
+    post = np.asarray(values, dtype=float)[:, int(start_position):]
+    return np.concatenate((np.repeat(post[:, :1], PADDING, axis=1), post), axis=1)
+
+
+################ CROSS CORRELATION #################
+# \brief: Function that computes the normalized cross-correlation of each row of the
+#   signals with a reference, with FFTs.
+# \parameters:
+#   @param <signals>: 2-D array (one signal per row)
+#   @param <references>: 2-D array with one reference per row, or 1-D array used for
+#           all the rows
+# \return (lags array, 2-D array of correlation coefficients, one row per signal):
+#   a positive lag means that the signal is delayed with respect to the reference
+####################################################
+def cross_correlation(signals, references):
+    x = np.atleast_2d(np.asarray(signals, dtype=float))
+    y = np.atleast_2d(np.asarray(references, dtype=float))
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    nx, ny = x.shape[1], y.shape[1]
+    n = fft.next_fast_len(nx + ny - 1, real=True)
+    circular = fft.irfft(fft.rfft(x, n, axis=1)*np.conj(fft.rfft(y, n, axis=1)), n, axis=1)
+    correlation = np.concatenate((circular[:, n-ny+1:], circular[:, :nx]), axis=1)
+    norms = np.sqrt((x**2).sum(axis=1)*(y**2).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = correlation/norms[:, None]
+    return np.arange(-(ny - 1), nx), correlation
+
+
+################ ESTIMATE DELAYS #################
+# \brief: Function that estimates the delay of each signal with respect to its reference.
+# \parameters:
+#   @param <signals>, <references>: see cross_correlation()
+#   @param <min_lag>, <max_lag>: range of lags searched, in samples (None: no limit)
+# \return (delays array, in samples with sub-sample precision; correlation coefficient at
+#   the maximum)
+##################################################
+def estimate_delays(signals, references, min_lag=None, max_lag=None):
+    lags, correlation = cross_correlation(signals, references)
+    allowed = np.ones(len(lags), dtype=bool)
+    if(min_lag is not None):
+        allowed &= lags >= min_lag
+    if(max_lag is not None):
+        allowed &= lags <= max_lag
+    searched = np.where(allowed, np.nan_to_num(correlation, nan=-np.inf), -np.inf)
+    peak = np.argmax(searched, axis=1)
+    rows = np.arange(len(peak))
+    value = searched[rows, peak]
+
+    # Parabola through the maximum and the two samples around it (inside the range)
+    inner = (peak > 0) & (peak < len(lags) - 1)
+    before = np.where(inner, searched[rows, np.maximum(peak - 1, 0)], -np.inf)
+    after = np.where(inner, searched[rows, np.minimum(peak + 1, len(lags) - 1)], -np.inf)
+    inner &= np.isfinite(before) & np.isfinite(after)
+    curvature = np.where(inner, before - 2*value + after, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shift = np.where(inner & (curvature < 0), 0.5*(before - after)/curvature, 0.0)
+    delays = lags[peak] + shift
+    found = np.isfinite(value)
+    return np.where(found, delays, np.nan), np.where(found, value, np.nan)
+
+
+################ TIME CONSTANTS #################
+# \brief: Function that estimates the time constant of the rise of each signal: time
+#   from the start of the rise to 63% of the final value (mean of the last 10% of the
+#   samples), with linear interpolation between samples.
+# \parameters:
+#   @param <signals>: 2-D array (one signal per row)
+#   @param <onsets>: start of the rise of each signal, in samples
+# \return array of time constants in samples (NaN if 63% is not reached)
+#################################################
+def time_constants(signals, onsets):
+    x = np.atleast_2d(np.asarray(signals, dtype=float))
+    onsets = np.asarray(onsets, dtype=float)
+    samples = np.arange(x.shape[1])
+    rows = np.arange(len(x))
+    valid = np.isfinite(onsets)
+    start = np.clip(np.floor(np.where(valid, onsets, 0)).astype(int), 0, x.shape[1] - 1)
+    base = x[rows, start]
+    tail = max(x.shape[1]//10, 1)
+    amplitude = x[:, -tail:].mean(axis=1) - base
+    with np.errstate(invalid="ignore", divide="ignore"):
+        progress = (x - base[:, None])/amplitude[:, None]
+    reached = (progress >= 1 - np.exp(-1)) & (samples > start[:, None])
+    first = np.argmax(reached, axis=1)
+    found = valid & reached[rows, first] & (amplitude != 0)
+    previous = np.maximum(first - 1, 0)
+    p0, p1 = progress[rows, previous], progress[rows, first]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.where(p1 > p0, (1 - np.exp(-1) - p0)/(p1 - p0), 1.0)
+    crossing = previous + np.clip(fraction, 0, 1)
+    return np.where(found, np.maximum(crossing - onsets, 0), np.nan)
+
+
+################ STIMULUS DELAYS #################
+# \brief: Function that estimates the start of the rise of the padded responses (rate of
+#   change correlated with the rising edge of the stimulus).
+# \parameters:
+#   @param <responses>: 2-D array returned by padded_responses()
+#   @param <max_lag>: maximum lag with respect to the stimulus, in samples
+# \return (start of the rise in samples of the padded array, correlation coefficient)
+##################################################
+def stimulus_delays(responses, max_lag=40):
+    # Rising edge: the plateau and the decay of the stimulus would move the maximum
+    reference = np.clip(np.diff(stimulus(responses.shape[1])), 0, None)
+    # The rise can not start before the start of the rebreathing
+    lags, corr = estimate_delays(np.diff(responses, axis=1), reference,
+                                 -PHYSIOLOGICAL_DELAY, max_lag)
+    return STIMULUS_ONSET + lags, corr
+
+
+################ FITTING DELAYS #################
+# \brief: Function that estimates the start of the rise of every subject in the padded
+#   array, i.e. the delay used by fit_cohort() in <Exponential_fitting>.
+# \parameters:
+#   @param <matrix>: SubjectMatrix of the PCB device data (10s resolution)
+#   @param <max_lag>: maximum lag with respect to the stimulus, in samples
+# \return dictionary {subject label: delay}
+#################################################
+def fitting_delays(matrix, max_lag=40):
+    responses = padded_responses(matrix.values, matrix.start_rebreathing - matrix.offset)
+    return dict(zip(matrix.labels, stimulus_delays(responses, max_lag)[0]))
+
+
+################ SUBJECT DELAYS #################
+# \brief: Function that estimates delays and time constants of all the subjects of a
+#   site.
+# \parameters:
+#   @param <pcb_matrix>: SubjectMatrix of the PCB device data
+#   @param <sentec_matrix>: SubjectMatrix of the Sentec device data (same subjects)
+#   @param <site>: site label
+#   @param <max_lag>: maximum lag searched, in samples
+# \return pandas DataFrame (DELAY_COLUMNS)
+#################################################
+def subject_delays(pcb_matrix, sentec_matrix, site, max_lag=40):
+    pcb = padded_responses(pcb_matrix.values, pcb_matrix.start_rebreathing - pcb_matrix.offset)
+    sentec = padded_responses(sentec_matrix.values,
+                              sentec_matrix.start_rebreathing - sentec_matrix.offset)
+    delay_pcb, corr_pcb = stimulus_delays(pcb, max_lag)
+    delay_sentec, corr_sentec = stimulus_delays(sentec, max_lag)
+    lag_relative, corr_relative = estimate_delays(np.diff(pcb, axis=1),
+                                                  np.diff(sentec, axis=1), -max_lag, max_lag)
+    return pd.DataFrame({"subject": pcb_matrix.labels, "site": site,
+                         "lag_pcb_stimulus": delay_pcb - STIMULUS_ONSET,
+                         "corr_pcb_stimulus": corr_pcb,
+                         "lag_sentec_stimulus": delay_sentec - STIMULUS_ONSET,
+                         "corr_sentec_stimulus": corr_sentec,
+                         "lag_pcb_sentec": lag_relative, "corr_pcb_sentec": corr_relative,
+                         "delay_pcb": delay_pcb, "delay_sentec": delay_sentec,
+                         "tau_pcb": time_constants(pcb, delay_pcb),
+                         "tau_sentec": time_constants(sentec, delay_sentec)}).round(3)
+
+
+if __name__ == "__main__":
+    from Session_store import read_table, start_index
+    from Subject_matrix import SubjectMatrix
+
+    parser = argparse.ArgumentParser(
+        description="Estimation of the delay of the response of every subject")
+    parser.add_argument("--sample-number", type=int, default=10,
+                        help="window size of the merged tables (default: 10)")
+    parser.add_argument("--max-lag", type=int, default=40,
+                        help="maximum lag searched, in samples (default: 40)")
+    parser.add_argument("--columnar-store", action="store_true",
+                        help="read the merged tables from the columnar session store")
+    parser.add_argument("--output", default="Delay_estimates.csv",
+                        help="output CSV file (default: Delay_estimates.csv)")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    tables = []
+    for site in ("L", "P"):
+        matrices = []
+        for device in ("CO2", "Sentec"):
+            name = '%s_df_%s_median_%s' % (device, args.sample_number, site)
+            if(args.columnar_store):
+                df = read_table(name)
+            else:
+                df = pd.read_csv(name + '.csv', sep=";")
+            matrices.append(SubjectMatrix.from_dataframe(df, start_index(df, df.columns[0])))
+        tables.append(subject_delays(matrices[0], matrices[1], site, args.max_lag))
+    df_delays = pd.concat(tables, ignore_index=True)
+    print(df_delays)
+    df_delays.to_csv(args.output, sep=';', index=False)
@@ -0,0 +1,278 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR EXPONENTIAL FITTING
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module fits the exponential rise model used in <Aggregated_data_analysis_3>
+
+    y(t) = B*(1 - exp(-(t - delay)/tau)) + gap
+
+to the response of every subject, both for lobe and forearm data. For each subject three
+fittings are performed, as done in the script for the selected subject_id:
+    - raw: PCB device values, time in samples
+    - delta: PCB device delta values (baseline subtracted), time in samples
+    - delta_seconds: PCB device delta values, time in seconds (samples*window length)
+
+The data of each subject are prepared as in the script: 10 samples equal to the first
+value after the start of the rebreathing are added before the data from the start of the
+rebreathing, and the fitting is performed from <delay> to <end_fitting>. The Jacobian of
+the model is given analytically, gap and initial guesses of B and tau are computed from
+the data, and the subjects are fitted in a pool of processes.
+
+Output file (when run as a script): Fitting_parameters.csv, one row for each subject,
+site and model, with B, tau, their covariance and the R2 score of the fitting.
+
+\Parameters: (command line)
+    @param <--sample-number>: window size of the merged tables. Default value is 10.
+    @param <--delay>: sensor delay (samples of the padded array). Default value is 19.
+    @param <--auto-delay>: estimate the delay of every subject by cross-correlation with
+            the stimulus (see the module <Delay_estimation>) instead of --delay.
+    @param <--end-fitting>: sample number where to stop the fitting. Default value is 88.
+    @param <--workers>: number of worker processes. Default is the number of CPUs.
+    @param <--columnar-store>: read the merged tables from the columnar session store
+            (see the module <Session_store>).
+    @param <--calibration-report>: report of <Calibration_analysis>. The sessions with an
+            unreliable baseline are not fitted.
+    @param <--output>: output CSV file. Default is Fitting_parameters.csv.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import scipy.optimize
+from sklearn import metrics
+
+# Samples added before the start of the rebreathing, as in the plots of the script
+PADDING = 10
+MODELS = ("raw", "delta", "delta_seconds")
+FITTING_COLUMNS = ("subject", "site", "model", "delay", "gap", "B", "tau", "var_B",
+                   "cov_B_tau", "var_tau", "r2", "nfev", "success")
+
+
+################ EXPONENTIAL RISE #################
+# \brief: Exponential rise model.
+# \parameters:
+#   @param <t>: time array
+#   @param <B>: amplitude of the rise
+#   @param <tau>: time constant
+#   @param <delay>: start of the rise
+#   @param <gap>: value before the rise (baseline or deviation from the baseline)
+# \return array of model values
+###################################################
+def exponential_rise(t, B, tau, delay, gap):
+    return B*(1 - np.exp(-(np.asarray(t, dtype=float) - delay)/tau)) + gap
+
+
+################ EXPONENTIAL JACOBIAN #################
+# \brief: Jacobian of the exponential rise model with respect to B and tau.
+# \parameters:
+#   @param <t>: time array
+#   @param <B>: amplitude of the rise
+#   @param <tau>: time constant
+#   @param <delay>: start of the rise
+# \return 2-D array (samples, 2) with the derivatives with respect to B and tau
+#######################################################
+def exponential_jacobian(t, B, tau, delay):
+    elapsed = np.asarray(t, dtype=float) - delay
+    decay = np.exp(-elapsed/tau)
+    return np.column_stack((1 - decay, -B*decay*elapsed/tau**2))
+
+
+################ FITTING WINDOW #################
+# \brief: Function that prepares the data of a subject: PADDING samples equal to the
+#   first value after the start of the rebreathing, followed by the data from the start
+#   of the rebreathing; the samples from <delay> to <end_fitting> are returned.
+# \parameters:
+#   @param <series>: 1-D array with the data of the subject
+#   @param <start_position>: position of the start of the rebreathing in the series
+#           (index_start_rebreathing-offset in the scripts)
+#   @param <delay>: first sample of the fitting (padded array)
+#   @param <end_fitting>: sample where to stop the fitting (padded array)
+# \return (sample numbers, values, padded array)
+#################################################
+def fitting_window(series, start_position, delay, end_fitting):
+    series = np.asarray(series, dtype=float)[int(start_position):]
+    if(len(series) == 0):
+        raise ValueError("no data after the start of the rebreathing")
+    padded = np.concatenate((np.full(PADDING, series[0]), series))
+    end_fitting = min(int(end_fitting), len(padded))
+    samples = np.arange(int(delay), end_fitting)
+    return samples, padded[samples], padded
+
+
+################ INITIAL GUESS #################
+# \brief: Function that computes gap and the initial guesses of B and tau from the data:
+#   gap is the mean value from the start of the rebreathing to the delay, B is the
+#   difference between the final values and gap, tau is the time at which 63% of B is
+#   reached.
+# \parameters:
+#   @param <t>: time array of the fitting
+#   @param <y>: values of the fitting
+#   @param <padded>: padded array returned by fitting_window()
+#   @param <delay>: start of the rise (same unit of t)
+#   @param <delay_sample>: start of the rise in samples of the padded array
+# \return (gap, B guess, tau guess)
+################################################
+def initial_guess(t, y, padded, delay, delay_sample):
+    gap = float(np.mean(padded[PADDING:max(delay_sample, PADDING)+1]))
+    tail = max(len(y)//10, 1)
+    B = float(np.mean(y[-tail:])) - gap
+    if(B == 0):
+        B = float(np.ptp(y)) or 1.0
+    span = float(t[-1] - delay) if len(t) > 0 else 1.0
+    reached = np.flatnonzero((y - gap)/B >= 1 - np.exp(-1))
+    if(len(reached) > 0 and t[reached[0]] > delay):
+        tau = float(t[reached[0]] - delay)
+    else:
+        tau = max(span/3, 1e-3)
+    return gap, B, tau
+
+
+################ FIT EXPONENTIAL #################
+# \brief: Function that fits the exponential rise model (B and tau) to the data.
+# \parameters:
+#   @param <t>: time array
+#   @param <y>: values
+#   @param <delay>: start of the rise
+#   @param <gap>: value before the rise
+#   @param <p0>: initial guesses (B, tau)
+# \return dictionary with B, tau, covariance, R2 score, number of function evaluations
+#   and success flag (NaN values if the fitting does not converge)
+##################################################
+def fit_exponential(t, y, delay, gap, p0):
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    result = {"B": np.nan, "tau": np.nan, "var_B": np.nan, "cov_B_tau": np.nan,
+              "var_tau": np.nan, "r2": np.nan, "nfev": 0, "success": False}
+    if(len(t) < 3):
+        return result
+    try:
+        params, cv, infodict, message, status = scipy.optimize.curve_fit(
+            lambda t, B, tau: exponential_rise(t, B, tau, delay, gap), t, y, p0=p0,
+            jac=lambda t, B, tau: exponential_jacobian(t, B, tau, delay),
+            bounds=([-np.inf, 1e-6], [np.inf, np.inf]), full_output=True)
+    except (RuntimeError, ValueError):
+        return result
+
+    B, tau = params
+    result.update({"B": B, "tau": tau, "var_B": cv[0, 0], "cov_B_tau": cv[0, 1],
+                   "var_tau": cv[1, 1], "nfev": int(infodict["nfev"]),
+                   "success": status > 0,
+                   "r2": metrics.r2_score(y, exponential_rise(t, B, tau, delay, gap))})
+    return result
+
+
+################ FIT SUBJECT #################
+# \brief: Worker function: fits the raw, delta and delta_seconds models for a subject.
+# \parameters:
+#   @param <task>: tuple (subject label, site, raw array, delta array, start position,
+#           delay, end_fitting, seconds per sample)
+# \return list of dictionaries, one for each model (see FITTING_COLUMNS)
+##############################################
+def fit_subject(task):
+    subject, site, raw, delta, start_position, delay, end_fitting, seconds = task
+    rows = []
+    for model in MODELS:
+        series = raw if model == "raw" else delta
+        samples, y, padded = fitting_window(
+            series, start_position, delay, end_fitting)
+        scale = seconds if model == "delta_seconds" else 1
+        t = samples*scale
+        gap, B, tau = initial_guess(t, y, padded, delay*scale, delay)
+        row = {"subject": subject, "site": site, "model": model,
+               "delay": delay*scale, "gap": gap}
+        row.update(fit_exponential(t, y, delay*scale, gap, (B, tau)))
+        rows.append(row)
+    return rows
+
+
+################ FIT COHORT #################
+# \brief: Function that fits all the subjects of one or more sites in a process pool.
+# \parameters:
+#   @param <matrices>: dictionary {site: SubjectMatrix of the PCB device data}
+#   @param <delays>: sensor delay (samples of the padded array), as a single value or
+#           as a dictionary {subject label: delay}
+#   @param <end_fitting>: sample where to stop the fitting (padded array)
+#   @param <seconds>: seconds per sample (window length) for the delta_seconds model
+#   @param <workers>: number of worker processes (None to use all the CPUs)
+#   @param <exclude>: subject labels not to be fitted (e.g. unreliable calibration)
+# \return pandas DataFrame, one row for each subject, site and model
+#############################################
+def fit_cohort(matrices, delays=19, end_fitting=88, seconds=10, workers=None, exclude=()):
+    tasks = []
+    for site, matrix in matrices.items():
+        start_position = matrix.start_rebreathing - matrix.offset
+        delta = matrix.delta()
+        for i, subject in enumerate(matrix.labels):
+            delay = delays.get(subject, np.nan) if isinstance(
+                delays, dict) else delays
+            if(np.isnan(delay) or subject in exclude):
+                continue
+            tasks.append((subject, site, matrix.values[i], delta[i], start_position,
+                          int(round(delay)), end_fitting, seconds))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(fit_subject, tasks, chunksize=max(
+            len(tasks)//(4*(workers or 4)), 1))
+        rows = [row for subject_rows in results for row in subject_rows]
+    return pd.DataFrame(rows, columns=FITTING_COLUMNS)
+
+
+if __name__ == "__main__":
+    from Session_store import read_table, start_index
+    from Subject_matrix import SubjectMatrix
+
+    parser = argparse.ArgumentParser(
+        description="Exponential fitting of the rebreathing response of every subject")
+    parser.add_argument("--sample-number", type=int, default=10,
+                        help="window size of the merged tables (default: 10)")
+    parser.add_argument("--delay", type=int, default=19,
+                        help="sensor delay in samples of the padded array (default: 19)")
+    parser.add_argument("--auto-delay", action="store_true",
+                        help="estimate the delay of every subject (cross-correlation)")
+    parser.add_argument("--end-fitting", type=int, default=88,
+                        help="sample where to stop the fitting (default: 88)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: all the CPUs)")
+    parser.add_argument("--columnar-store", action="store_true",
+                        help="read the merged tables from the columnar session store")
+    parser.add_argument("--calibration-report", default=None,
+                        help="skip the sessions with an unreliable calibration")
+    parser.add_argument("--output", default="Fitting_parameters.csv",
+                        help="output CSV file (default: Fitting_parameters.csv)")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    matrices = {}
+    for site in ("L", "P"):
+        name = 'CO2_df_%s_median_%s' % (args.sample_number, site)
+        if(args.columnar_store):
+            df_pcb = read_table(name)
+        else:
+            df_pcb = pd.read_csv(name + '.csv', sep=";")
+        index_start_rebreathing = start_index(df_pcb, df_pcb.columns[0])
+        matrices[site] = SubjectMatrix.from_dataframe(
+            df_pcb, index_start_rebreathing)
+
+    delays = args.delay
+    if(args.auto_delay):
+        from Delay_estimation import fitting_delays
+        delays = {}
+        for matrix in matrices.values():
+            delays.update(fitting_delays(matrix))
+        print("Estimated delays: %s" % {subject: round(delay, 2)
+                                         for subject, delay in delays.items()})
+
+    exclude = set()
+    if(args.calibration_report is not None):
+        from Calibration_analysis import unreliable_sessions
+        exclude = unreliable_sessions(pd.read_csv(args.calibration_report, sep=";"))
+        print("Sessions skipped (unreliable calibration): %s" % len(exclude))
+
+    df_fitting = fit_cohort(matrices, delays, args.end_fitting,
+                            args.sample_number, args.workers, exclude)
+    print(df_fitting)
+    df_fitting.to_csv(args.output, sep=';', index=False)
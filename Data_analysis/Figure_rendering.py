@@ -0,0 +1,200 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR FIGURE RENDERING
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the plot_data() helper used by the analysis scripts and the
+functions used to run the scripts without a display (e.g. batch jobs on a cluster).
+
+In headless mode the non interactive Agg backend is used and plt.show() is replaced by
+show_figures(): all the open figures are written to PNG/SVG/PDF files and closed, so that
+memory does not grow with the number of figures. By default the files are written in the
+calling process: the analysis scripts have no __main__ guard, so worker processes started
+with the "spawn" method (default on Windows and macOS) would run the whole script again.
+On request (workers > 0, from code with a __main__ guard) the figures are serialized
+(figures can be pickled) and drawn in a pool of worker processes, which is where most of
+the rendering time is spent. Independent figures can also be built directly in the
+workers, through plot_data(), with render_figures().
+
+File names: <prefix>_<show call>_figure_<figure number>.<format>
+------------------------------------------------------------------------------------------
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import pickle
+from pickle import NONE, TRUE
+import matplotlib
+import matplotlib.pyplot as plt
+
+FORMATS = ("png", "svg", "pdf")
+
+# Number of calls to show_figures(), used in the file names (figure numbers are reused
+# by the scripts after the figures are closed)
+_show_calls = {}
+
+
+################ IS NONE #################
+# \brief: Function that checks if a plot_data() argument is empty. The scripts pass the
+#   NONE constant imported from pickle, None is accepted as well.
+##########################################
+def _is_none(value):
+    return value is None or (isinstance(value, bytes) and value == NONE)
+
+
+################ PLOT DATA #################
+# \brief: Function that is used to plot data.
+# \parameters:
+#   @param <figure_id>: figure number to be opened
+#   @param <x>: x-axis array
+#   @param <y>: y-axis array
+#   @param <title>: string containing the plot's title
+#   @param <xlabel>: string containing the x-axis label
+#   @param <xlabel>: string containing the y-axis label
+#   @param <legend>: array of strings containing the legend
+#   @param <legend_location>: legend location
+#   @param <style>: line style. If put to NONE, by default it will be black and continuous
+#   @param <color>: color of the plot
+#   @param <linewidth>: thickness of the plot
+#   @param <gridx>: array to setup the x-axis grid
+#   @param <ygrid>: boolean, TRUE or FALSE
+#   @param <start_rebr>: rebreathing starting index
+#   @param <end_rebr>: rebreathing ending index
+# \return figure
+#############################################
+def plot_data(figure_id, x, y, title, xlabel, ylabel, legend, legend_location, style, color, linewidth, gridx, ygrid, start_rebr, end_rebr):
+    figure = plt.figure(figure_id)
+    plt.title(title)
+    if(_is_none(style)):
+        plt.plot(x, y, color, linewidth=linewidth)
+    else:
+        plt.plot(x, y, style, color=color, linewidth=linewidth)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    if(ygrid is True or ygrid == TRUE):
+        plt.grid(axis='y')
+    plt.axvline(x=start_rebr, color='gold')
+    plt.axvline(x=end_rebr, color='coral')
+    if(not _is_none(gridx)):
+        plt.xticks(gridx)
+
+    plt.legend(legend, loc=legend_location)
+    return figure
+
+
+################ USE HEADLESS BACKEND #################
+# \brief: Function that switches matplotlib to the non interactive Agg backend. It has
+#   to be called before the first figure is created.
+#######################################################
+def use_headless_backend():
+    matplotlib.use("Agg", force=True)
+    plt.switch_backend("Agg")
+
+
+################ FIGURE PATHS #################
+# \brief: Function that returns the file names of a figure.
+# \parameters:
+#   @param <directory>: output directory
+#   @param <name>: file name without extension
+#   @param <formats>: iterable with the file formats (see FORMATS)
+# \return list of paths
+###############################################
+def _figure_paths(directory, name, formats):
+    for fmt in formats:
+        if(fmt not in FORMATS):
+            raise ValueError("Unknown figure format: %s" % fmt)
+    return [os.path.join(directory, "%s.%s" % (name, fmt)) for fmt in formats]
+
+
+################ SAVE FIGURE #################
+# \brief: Worker function: draws a pickled figure and writes it to files.
+# \parameters:
+#   @param <data>: pickled figure
+#   @param <paths>: list of output paths
+# \return list of written paths
+##############################################
+def _save_figure(data, paths):
+    use_headless_backend()
+    figure = pickle.loads(data)
+    for path in paths:
+        figure.savefig(path)
+    plt.close(figure)
+    return paths
+
+
+################ RENDER JOB #################
+# \brief: Worker function: builds a figure with plot_data() and writes it to files.
+# \parameters:
+#   @param <arguments>: dictionary with the arguments of plot_data()
+#   @param <paths>: list of output paths
+# \return list of written paths
+#############################################
+def _render_job(arguments, paths):
+    use_headless_backend()
+    figure = plot_data(**arguments)
+    for path in paths:
+        figure.savefig(path)
+    plt.close(figure)
+    return paths
+
+
+################ SHOW FIGURES #################
+# \brief: Function that replaces plt.show() in the scripts. In interactive mode the
+#   figures are shown; in headless mode all the open figures are written to files and
+#   closed.
+# \parameters:
+#   @param <headless>: if 0 plt.show() is called
+#   @param <directory>: output directory
+#   @param <prefix>: prefix of the file names (e.g. the script name)
+#   @param <formats>: iterable with the file formats (see FORMATS)
+#   @param <workers>: number of worker processes (0 to write the files in the calling
+#           process, None to use all the CPUs). Workers need a __main__ guard in the
+#           calling script.
+# \return list of written paths
+###############################################
+def show_figures(headless=0, directory="Figures", prefix="figure", formats=("png",), workers=0):
+    if(not headless):
+        plt.show()
+        return []
+
+    os.makedirs(directory, exist_ok=True)
+    _show_calls[prefix] = _show_calls.get(prefix, 0) + 1
+    jobs = []
+    for number in plt.get_fignums():
+        figure = plt.figure(number)
+        name = "%s_%02d_figure_%s" % (prefix, _show_calls[prefix], number)
+        jobs.append((pickle.dumps(figure), _figure_paths(directory, name, formats)))
+        # The figure is closed as soon as it is serialized
+        plt.close(figure)
+
+    if(workers == 0 or len(jobs) <= 1):
+        return [path for data, paths in jobs for path in _save_figure(data, paths)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_save_figure, *zip(*jobs))
+        return [path for paths in results for path in paths]
+
+
+################ RENDER FIGURES #################
+# \brief: Function that builds independent figures with plot_data() and writes them to
+#   files, in the calling process or in a pool of processes.
+# \parameters:
+#   @param <jobs>: dictionary {file name without extension: dictionary with the
+#           arguments of plot_data()}
+#   @param <directory>: output directory
+#   @param <formats>: iterable with the file formats (see FORMATS)
+#   @param <workers>: number of worker processes (0 to build the figures in the calling
+#           process, None to use all the CPUs). Workers need a __main__ guard in the
+#           calling script.
+# \return list of written paths
+#################################################
+def render_figures(jobs, directory="Figures", formats=("png",), workers=0):
+    os.makedirs(directory, exist_ok=True)
+    names = list(jobs)
+    paths = [_figure_paths(directory, name, formats) for name in names]
+    if(workers == 0 or len(names) <= 1):
+        return [path for name, written in zip(names, paths)
+                for path in _render_job(jobs[name], written)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_render_job, [jobs[name] for name in names], paths)
+        return [path for written in results for path in written]
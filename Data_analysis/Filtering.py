@@ -0,0 +1,83 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR FILTERING
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the Butterworth low pass filter used in <Aggregated_data_analysis_3>
+on the PCB device data. The filter is designed as second order sections (numerically
+stable also for high orders) and the designs are cached by (order, cutoff, fs), so that
+they are computed only once per run. The filter is applied to a whole matrix (e.g. one
+row per subject) in a single call, along the time axis:
+    - causal (zero_phase=False): the initial conditions are set to the steady state of
+      the first sample of each row, so that there is no start-up transient (with zero
+      initial conditions the first samples go from 0 to the signal and had to be
+      discarded)
+    - zero phase (zero_phase=True): the filter is applied forward and backward, so that
+      the filtered signal is not delayed (e.g. for the position of the maximum). The
+      squared magnitude response is obtained (double attenuation at the cutoff).
+------------------------------------------------------------------------------------------
+'''
+
+from functools import lru_cache
+import numpy as np
+from scipy import signal
+
+
+################ BUTTER LOWPASS SOS #################
+# \brief: Function that designs a Butterworth low pass filter (cached).
+# \parameters:
+#   @param <order>: order of the filter
+#   @param <cutoff>: cutoff frequency, Hz
+#   @param <fs>: sample rate, Hz
+# \return second order sections (the cached array is shared: not to be modified)
+#####################################################
+@lru_cache(maxsize=None)
+def butter_lowpass_sos(order, cutoff, fs):
+    return signal.butter(order, cutoff, fs=fs, btype='low', analog=False, output='sos')
+
+
+################ STEADY STATE #################
+# \brief: Function that computes the initial conditions of sosfilt() for a unit step
+#   (cached with the design): scaled by the first sample of a signal, they give the
+#   output of a filter that saw that value forever before the start.
+# \parameters: see butter_lowpass_sos()
+# \return array (sections, 2)
+###############################################
+@lru_cache(maxsize=None)
+def _steady_state(order, cutoff, fs):
+    zi = signal.sosfilt_zi(butter_lowpass_sos(order, cutoff, fs))
+    zi.setflags(write=False)
+    return zi
+
+
+################ LOWPASS FILTER #################
+# \brief: Function that filters the data with a Butterworth low pass filter.
+# \parameters:
+#   @param <data>: array (e.g. 2-D, one row per subject)
+#   @param <cutoff>: cutoff frequency, Hz
+#   @param <fs>: sample rate, Hz
+#   @param <order>: order of the filter
+#   @param <axis>: time axis. Default is the last one
+#   @param <zero_phase>: if True the filter is applied forward and backward
+#   @param <steady_start>: causal filter, if True the initial conditions are the steady
+#           state of the first sample, otherwise zero (as scipy.signal.lfilter)
+# \return filtered array, same shape of data
+#################################################
+def lowpass_filter(data, cutoff, fs, order=5, axis=-1, zero_phase=False, steady_start=True):
+    design = (int(order), float(cutoff), float(fs))
+    sos = butter_lowpass_sos(*design)
+    x = np.moveaxis(np.asarray(data, dtype=np.float64), axis, -1)
+    if(x.shape[-1] == 0):
+        return np.moveaxis(x.copy(), -1, axis)
+
+    if(zero_phase):
+        # Default padding of sosfiltfilt, reduced for short signals
+        padlen = 3*(2*len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum()))
+        y = signal.sosfiltfilt(sos, x, axis=-1, padlen=min(padlen, x.shape[-1] - 1))
+    elif(steady_start):
+        zi = _steady_state(*design).reshape((len(sos),) + (1,)*(x.ndim - 1) + (2,))
+        y = signal.sosfilt(sos, x, axis=-1, zi=zi*x[np.newaxis, ..., :1])[0]
+    else:
+        y = signal.sosfilt(sos, x, axis=-1)
+    return np.moveaxis(y, -1, axis)
@@ -0,0 +1,419 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON SCRIPT FOR LIVE SESSION INGESTION
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This script reads the serial output of many devices at the same time (one asyncio task
+per device) and writes a session file for each of them, in the same layout read by
+<Dataframe_Creation> and <Batch_ingestion>:
+    Timestamp_CO2;CO2Sange;Timestamp_deltaCO2;DeltaCO2;Sentec;Rebreathing_mark
+Timestamps are the milliseconds elapsed from the start of the session, measured on the
+host when the line is received. Sentec and Rebreathing_mark columns are left empty (they
+are filled in by hand, or by SessionWriter.mark() for the marks).
+
+The lines are parsed with the module <Serial_protocol>: a row is written for each CO2
+value (CO2Sangue frame, or "Valore Co2 ppm" line when the frames are not sent) together
+with the following DeltaCO2 frame. All the other frames (Ambiente, Tfilo, Tpelle) and the
+text messages of the firmware are written to <session>_log.csv. The CO2 values are also
+given to a RebreathingTracker (see <Online_tracker>) for each session, so that baseline,
+delta and peak of the rebreathing response can be printed while the session runs.
+
+Sources are given as [name=]kind:path, kind being:
+    - serial: serial port (pyserial-asyncio is used if installed)
+    - pty: terminal device, e.g. the virtual port of a device emulator (POSIX only, as
+      the serial ports without pyserial-asyncio)
+    - replay: text file with a serial capture
+If the name is not given, the file name of the path is used.
+
+\Parameters: (command line)
+    @param <sources>: sources, e.g. bed1=serial:/dev/ttyACM0 pty:/dev/pts/4
+    @param <--baudrate>: baudrate of the serial ports. Default value is 115200.
+    @param <--output-dir>: directory where the session files are written.
+    @param <--replay-interval>: seconds between two lines of a replayed file. Default
+            value is 0 (as fast as possible).
+    @param <--status-interval>: seconds between two prints of the state of the
+            sessions (baseline, delta, peak). Default value is 0 (no print).
+    @param <--marks>: read the rebreathing marks from the standard input, one per line
+            as "<source name> R1" or "<source name> R2".
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import sys
+import time
+import numpy as np
+from Batch_ingestion import SESSION_COLUMNS
+from Online_tracker import RebreathingTracker
+from Serial_protocol import BAUDRATE, CO2_SERIES, DELTA_SERIES, parse_line
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+LOG_COLUMNS = ("Timestamp", "Kind", "Channel", "Series", "Color", "Value", "Text")
+SOURCE_KINDS = ("serial", "pty", "replay")
+
+
+class SessionWriter:
+
+    ################ INIT #################
+    # \brief: Constructor of the session writer: creates <name>.csv and <name>_log.csv.
+    # \parameters:
+    #   @param <directory>: output directory
+    #   @param <name>: session name
+    #   @param <flush_rows>: number of rows after which the files are flushed
+    #   @param <clock>: function returning the time in seconds
+    #######################################
+    def __init__(self, directory, name, flush_rows=10, clock=time.monotonic):
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.path = os.path.join(directory, name + ".csv")
+        self.log_path = os.path.join(directory, name + "_log.csv")
+        self._file = open(self.path, "w", newline="")
+        self._log_file = open(self.log_path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file, delimiter=";")
+        self._log = csv.writer(self._log_file, delimiter=";")
+        self._writer.writerow(SESSION_COLUMNS)
+        self._log.writerow(LOG_COLUMNS)
+        self._clock = clock
+        self._start = clock()
+        self._flush_rows = flush_rows
+        self._unflushed = 0
+        self._pending = None
+        self._pending_mark = ""
+        self.rows = 0
+        self.tracker = RebreathingTracker()
+
+    ################ ELAPSED #################
+    # \brief: Milliseconds elapsed from the start of the session.
+    ##########################################
+    def elapsed(self):
+        return int(round((self._clock() - self._start)*1000))
+
+    ################ MARK #################
+    # \brief: Function that sets a rebreathing mark (R1 or R2) on the next CO2 row. The
+    #   R1 mark starts the tracking of the rebreathing response.
+    #######################################
+    def mark(self, label):
+        self._pending_mark = label
+
+    ################ ADD #################
+    # \brief: Function that adds the records of a parsed line to the session.
+    # \parameters:
+    #   @param <records>: list of Record (see parse_line() in <Serial_protocol>)
+    #   @param <timestamp>: milliseconds from the start of the session. If None the
+    #           current time is used
+    ######################################
+    def add(self, records, timestamp=None):
+        if(timestamp is None):
+            timestamp = self.elapsed()
+        for record in records:
+            if(record.kind == "frame" and record.series == CO2_SERIES):
+                self._new_row(timestamp, record.value, "frame")
+            elif(record.kind == "co2"):
+                # The text line follows the CO2Sangue frame with the same value
+                if(self._pending is not None and self._pending["source"] == "frame"
+                   and self._pending["co2"] == record.value):
+                    self._pending["source"] = "confirmed"
+                else:
+                    self._new_row(timestamp, record.value, "text")
+            elif(record.kind == "frame" and record.series == DELTA_SERIES and
+                 self._pending is not None and self._pending["delta"] is None):
+                self._pending["delta"] = record.value
+                self._pending["delta_time"] = timestamp
+            else:
+                self._log.writerow((timestamp, record.kind, record.channel or "",
+                                    record.series or "", record.color or "",
+                                    "" if record.kind == "message" else record.value,
+                                    record.text or ""))
+
+    ################ ADD VALUES #################
+    # \brief: Function that adds a block of CO2 values without DeltaCO2 frames (e.g. the
+    #   BLE notifications, see <Ble_client>).
+    # \parameters:
+    #   @param <times>: 1-D array of times in seconds, given by the clock of the writer
+    #   @param <values>: 1-D array of CO2 values
+    #############################################
+    def add_values(self, times, values):
+        self._write_pending()
+        values = np.asarray(values)
+        if(len(values) == 0):
+            return
+        timestamps = np.round((np.asarray(times) - self._start)*1000).astype(np.int64)
+        marks = [self._pending_mark] + [""]*(len(values) - 1)
+        self.tracker.update_batch(values, start=0 if self._pending_mark == "R1" else None)
+        self._pending_mark = ""
+        self._writer.writerows(zip(timestamps.tolist(), map(_format, values.tolist()),
+                                   itertools.repeat(""), itertools.repeat(""),
+                                   itertools.repeat(""), marks))
+        self.rows += len(values)
+        self._unflushed += len(values)
+        if(self._unflushed >= self._flush_rows):
+            self.flush()
+
+    ################ NEW ROW #################
+    # \brief: Function that writes the pending row and starts a new one.
+    ##########################################
+    def _new_row(self, timestamp, co2, source):
+        self._write_pending()
+        self._pending = {"time": timestamp, "co2": co2, "source": source,
+                         "delta": None, "delta_time": None, "mark": self._pending_mark}
+        if(self._pending_mark == "R1"):
+            self.tracker.start()
+        self.tracker.update(co2)
+        self._pending_mark = ""
+
+    ################ WRITE PENDING #################
+    # \brief: Function that writes the pending row to the session file.
+    ################################################
+    def _write_pending(self):
+        row = self._pending
+        if(row is None):
+            return
+        self._pending = None
+        self._writer.writerow((row["time"], _format(row["co2"]),
+                               "" if row["delta_time"] is None else row["delta_time"],
+                               "" if row["delta"] is None else _format(row["delta"]),
+                               "", row["mark"]))
+        self.rows += 1
+        self._unflushed += 1
+        if(self._unflushed >= self._flush_rows):
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._log_file.flush()
+        self._unflushed = 0
+
+    def close(self):
+        self._write_pending()
+        self._file.close()
+        self._log_file.close()
+
+
+################ FORMAT #################
+# \brief: Function that writes integer values without decimals (CO2 ppm).
+#########################################
+def _format(value):
+    return int(value) if float(value).is_integer() else value
+
+
+################ PARSE SOURCE #################
+# \brief: Function that parses a source given as [name=]kind:path.
+# \return (name, kind, path)
+###############################################
+def parse_source(spec):
+    name, separator, rest = spec.partition("=")
+    if(not separator):
+        name, rest = None, spec
+    kind, separator, path = rest.partition(":")
+    if(not separator or kind not in SOURCE_KINDS):
+        raise ValueError("Source must be [name=]kind:path, kind in %s: %s" %
+                         (", ".join(SOURCE_KINDS), spec))
+    if(name is None):
+        name = os.path.splitext(os.path.basename(path))[0]
+    return name, kind, path
+
+
+################ OPEN TERMINAL #################
+# \brief: Function that opens a terminal device (serial port or pty) in raw mode and
+#   connects it to an asyncio stream, without blocking the event loop. POSIX only:
+#   termios and tty are imported here, so that the module is imported on Windows too.
+# \parameters:
+#   @param <path>: device path
+#   @param <baudrate>: baudrate, None to keep the current setting (pty)
+# \return asyncio.StreamReader
+################################################
+async def open_terminal(path, baudrate=None):
+    import termios
+    import tty
+
+    loop = asyncio.get_running_loop()
+    fd = os.open(path, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+    if(os.isatty(fd)):
+        tty.setraw(fd)
+        if(baudrate is not None):
+            attributes = termios.tcgetattr(fd)
+            speed = getattr(termios, "B%d" % baudrate)
+            attributes[4] = attributes[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                 os.fdopen(fd, "rb", buffering=0))
+    return reader
+
+
+################ OPEN REPLAY #################
+# \brief: Function that replays a serial capture as an asyncio stream.
+# \parameters:
+#   @param <path>: text file with the serial capture
+#   @param <interval>: seconds between two lines (0 to replay as fast as possible)
+# \return asyncio.StreamReader
+##############################################
+async def open_replay(path, interval=0):
+    reader = asyncio.StreamReader()
+
+    async def feed():
+        with open(path, "rb") as capture:
+            for line in capture:
+                reader.feed_data(line)
+                await asyncio.sleep(interval)
+        reader.feed_eof()
+
+    reader.feeder = asyncio.ensure_future(feed())
+    return reader
+
+
+################ OPEN SOURCE #################
+# \brief: Function that opens a source.
+# \parameters:
+#   @param <kind>: serial, pty or replay
+#   @param <path>: device or file path
+#   @param <baudrate>: baudrate of the serial ports
+#   @param <replay_interval>: seconds between two lines of a replayed file
+# \return asyncio.StreamReader
+##############################################
+async def open_source(kind, path, baudrate=BAUDRATE, replay_interval=0):
+    if(kind == "replay"):
+        return await open_replay(path, replay_interval)
+    if(kind == "serial" and serial_asyncio is not None):
+        reader, _ = await serial_asyncio.open_serial_connection(url=path, baudrate=baudrate)
+        return reader
+    return await open_terminal(path, baudrate if kind == "serial" else None)
+
+
+################ INGEST #################
+# \brief: Function that reads a source until the end of the stream (or until the task
+#   is cancelled) and writes the session files.
+# \parameters:
+#   @param <reader>: asyncio.StreamReader
+#   @param <writer>: SessionWriter
+# \return number of CO2 rows written
+#########################################
+async def ingest(reader, writer):
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Line longer than the buffer (noise on the line): skipped
+                continue
+            except OSError:
+                # Device disconnected (e.g. pty closed by the other side)
+                break
+            if(not line):
+                break
+            writer.add(parse_line(line.decode("utf-8", errors="replace")))
+    finally:
+        writer.close()
+    return writer.rows
+
+
+################ PRINT STATUS #################
+# \brief: Function that prints the state of the sessions at regular intervals.
+# \parameters:
+#   @param <writers>: list of SessionWriter
+#   @param <interval>: seconds between two prints
+###############################################
+async def print_status(writers, interval):
+    while True:
+        await asyncio.sleep(interval)
+        for writer in writers:
+            state = writer.tracker.state()
+            print("%s: %d rows, CO2 %.0f ppm, baseline %.0f ppm, delta %.0f ppm (%.1f%%), "
+                  "peak %.0f ppm after %.0f s" % (writer.name, writer.rows, state.value,
+                                                  state.baseline, state.delta,
+                                                  state.percent, state.peak_delta,
+                                                  state.time_to_peak))
+
+
+################ READ MARKS #################
+# \brief: Function that reads the rebreathing marks from the standard input.
+# \parameters:
+#   @param <writers>: dictionary {source name: SessionWriter}
+#############################################
+async def read_marks(writers):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    while True:
+        line = await reader.readline()
+        if(not line):
+            break
+        fields = line.decode(errors="replace").split()
+        if(len(fields) == 2 and fields[0] in writers and fields[1] in ("R1", "R2")):
+            writers[fields[0]].mark(fields[1])
+        elif(len(fields) > 0):
+            print("Mark not valid: %s (sources: %s)" % (line.decode(errors="replace").strip(),
+                                                        ", ".join(writers)))
+
+
+################ INGEST SOURCES #################
+# \brief: Function that ingests many sources at the same time.
+# \parameters:
+#   @param <sources>: list of sources ([name=]kind:path)
+#   @param <output_dir>: directory of the session files
+#   @param <baudrate>: baudrate of the serial ports
+#   @param <replay_interval>: seconds between two lines of a replayed file
+#   @param <status_interval>: seconds between two prints of the state of the sessions
+#           (0 for no print)
+#   @param <marks>: if True the rebreathing marks are read from the standard input
+# \return dictionary {session name: number of CO2 rows}
+#################################################
+async def ingest_sources(sources, output_dir=".", baudrate=BAUDRATE, replay_interval=0,
+                         status_interval=0, marks=False):
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    tasks = {}
+    writers = {}
+    for spec in sources:
+        name, kind, path = parse_source(spec)
+        reader = await open_source(kind, path, baudrate, replay_interval)
+        writer = SessionWriter(output_dir, "%s_%s" % (name, stamp))
+        writers[name] = writer
+        tasks[writer.name] = asyncio.ensure_future(ingest(reader, writer))
+    services = []
+    if(status_interval > 0):
+        services.append(asyncio.ensure_future(
+            print_status(list(writers.values()), status_interval)))
+    if(marks):
+        services.append(asyncio.ensure_future(read_marks(writers)))
+    try:
+        rows = await asyncio.gather(*tasks.values())
+    finally:
+        for service in services:
+            service.cancel()
+    return dict(zip(tasks, rows))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Live ingestion of the serial output of the devices")
+    parser.add_argument("sources", nargs="+",
+                        help="sources as [name=]kind:path, kind in serial, pty, replay")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE,
+                        help="baudrate of the serial ports (default: 115200)")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory where the session files are written")
+    parser.add_argument("--replay-interval", type=float, default=0,
+                        help="seconds between two lines of a replayed file (default: 0)")
+    parser.add_argument("--status-interval", type=float, default=0,
+                        help="seconds between two prints of the state (default: 0)")
+    parser.add_argument("--marks", action="store_true",
+                        help="read the rebreathing marks (<source name> R1/R2) from stdin")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    try:
+        sessions = asyncio.run(ingest_sources(args.sources, args.output_dir,
+                                              args.baudrate, args.replay_interval,
+                                              args.status_interval, args.marks))
+    except KeyboardInterrupt:
+        sessions = {}
+    for name, rows in sessions.items():
+        print("%s: %d rows" % (name, rows))
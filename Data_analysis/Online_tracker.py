@@ -0,0 +1,196 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR ONLINE REBREATHING TRACKING
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the RebreathingTracker class, which computes while the samples are
+received the quantities computed by the <Aggregated_data_analysis> scripts at the end of
+a session:
+    - baseline: value before the start of the rebreathing (baseline_arr_PCB, i.e. the
+      row before START), or a running average of the values before the start, or a
+      fixed value (e.g. ppm_Ambientali_medio of the firmware)
+    - delta and percentage change with respect to the baseline
+    - running peak of the delta from the start of the rebreathing (as
+      max(support_PCB[start:-1])) and time to peak
+
+The state has a fixed size (no samples are stored), so a tracker can be kept for every
+monitored device. Samples are given one at a time with update() or in blocks with
+update_batch(), which computes the same values with array operations.
+------------------------------------------------------------------------------------------
+'''
+
+from collections import namedtuple
+import numpy as np
+
+TrackerState = namedtuple("TrackerState", ("samples", "started", "value", "baseline",
+                                           "delta", "percent", "peak_delta",
+                                           "peak_percent", "time_to_peak"))
+
+
+class RebreathingTracker:
+
+    ################ INIT #################
+    # \brief: Constructor of the tracker.
+    # \parameters:
+    #   @param <baseline>: fixed baseline. If None the baseline is computed from the
+    #           values received before the start of the rebreathing
+    #   @param <smoothing>: if None the baseline is the last value before the start (as in
+    #           the scripts), otherwise the weight (0-1) of each new value in an
+    #           exponential moving average of the values before the start
+    #   @param <sample_period>: seconds between two samples (e.g. 10 or 30 for the
+    #           windowed values), used for the time to peak
+    #   @param <decimals>: rounding of the baseline (2 in the scripts). If None no
+    #           rounding is applied
+    #######################################
+    def __init__(self, baseline=None, smoothing=None, sample_period=1.0, decimals=None):
+        if(smoothing is not None and not 0 < smoothing <= 1):
+            raise ValueError("smoothing must be between 0 and 1")
+        self.smoothing = smoothing
+        self.sample_period = float(sample_period)
+        self.decimals = decimals
+        self._fixed = baseline is not None
+        self._baseline = np.nan if baseline is None else float(baseline)
+        self.reset()
+
+    ################ RESET #################
+    # \brief: Function that resets the tracker for a new session.
+    ########################################
+    def reset(self):
+        self.samples = 0
+        self.started = False
+        self._start_sample = None
+        self._value = np.nan
+        self._peak = np.nan
+        self._peak_sample = None
+        if(not self._fixed):
+            self._baseline = np.nan
+
+    ################ BASELINE #################
+    # \brief: Current baseline (NaN until a value is received).
+    ###########################################
+    @property
+    def baseline(self):
+        if(self.decimals is not None and not np.isnan(self._baseline)):
+            return round(self._baseline, self.decimals)
+        return self._baseline
+
+    ################ START #################
+    # \brief: Function that marks the start of the rebreathing (R1): the baseline is
+    #   frozen and the peak is tracked from the last value before the start (delta 0).
+    ########################################
+    def start(self):
+        if(self.started):
+            return
+        self.started = True
+        self._start_sample = self.samples
+        self._peak = 0.0 if not np.isnan(self._baseline) else np.nan
+        self._peak_sample = self.samples
+
+    ################ UPDATE #################
+    # \brief: Function that adds a sample.
+    # \parameters:
+    #   @param <value>: CO2 value (NaN values are ignored)
+    # \return TrackerState after the sample
+    #########################################
+    def update(self, value):
+        value = float(value)
+        if(np.isnan(value)):
+            return self.state()
+        self.samples += 1
+        self._value = value
+        if(not self.started):
+            if(not self._fixed):
+                if(self.smoothing is None or np.isnan(self._baseline)):
+                    self._baseline = value
+                else:
+                    self._baseline += self.smoothing*(value - self._baseline)
+        else:
+            if(np.isnan(self._baseline)):
+                # Start marked before any value: the first value is the baseline
+                self._baseline = value
+            delta = value - self.baseline
+            if(np.isnan(self._peak) or delta > self._peak):
+                self._peak = delta
+                self._peak_sample = self.samples
+        return self.state()
+
+    ################ UPDATE BATCH #################
+    # \brief: Function that adds a block of samples.
+    # \parameters:
+    #   @param <values>: 1-D array of CO2 values (NaN values are ignored)
+    #   @param <start>: position in the block of the first sample after the start of the
+    #           rebreathing (R1). If None the start is not in the block
+    # \return dictionary with 1-D arrays, one value per valid sample: "delta" and
+    #   "percent" (with respect to the baseline after the block) and "peak_delta"
+    #   (running peak, NaN before the start)
+    ###############################################
+    def update_batch(self, values, start=None):
+        values = np.asarray(values, dtype=float)
+        if(self.started):
+            pre, post = values[:0], values
+        elif(start is None):
+            pre, post = values, values[:0]
+        else:
+            pre, post = values[:int(start)], values[int(start):]
+        pre = pre[~np.isnan(pre)]
+        post = post[~np.isnan(post)]
+
+        if(len(pre) > 0):
+            self.samples += len(pre)
+            self._value = pre[-1]
+            self._update_baseline(pre)
+        if(start is not None):
+            self.start()
+
+        running = np.full(len(pre), np.nan)
+        if(len(post) > 0):
+            first = self.samples + 1
+            self.samples += len(post)
+            self._value = post[-1]
+            if(np.isnan(self._baseline)):
+                self._baseline = float(post[0])
+            delta = post - self.baseline
+            running = np.concatenate((running, np.fmax.accumulate(
+                np.concatenate(([self._peak], delta)))[1:]))
+            position = int(np.argmax(delta))
+            if(np.isnan(self._peak) or delta[position] > self._peak):
+                self._peak = float(delta[position])
+                self._peak_sample = first + position
+
+        baseline = self.baseline
+        delta = np.concatenate((pre, post)) - baseline
+        return {"delta": delta, "percent": delta/baseline*100, "peak_delta": running}
+
+    ################ UPDATE BASELINE #################
+    # \brief: Function that updates the baseline with a block of values received before
+    #   the start of the rebreathing.
+    ##################################################
+    def _update_baseline(self, values):
+        if(self._fixed):
+            return
+        if(self.smoothing is None):
+            self._baseline = float(values[-1])
+            return
+        # Exponential moving average of the block: closed form of the recursion
+        if(np.isnan(self._baseline)):
+            self._baseline = float(values[0])
+            values = values[1:]
+        weights = (1 - self.smoothing)**np.arange(len(values) - 1, -1, -1)
+        self._baseline = float((1 - self.smoothing)**len(values)*self._baseline +
+                               self.smoothing*np.dot(weights, values))
+
+    ################ STATE #################
+    # \brief: Function that returns the current state of the tracker.
+    # \return TrackerState (time to peak in seconds from the start of the rebreathing)
+    ########################################
+    def state(self):
+        baseline = self.baseline
+        delta = self._value - baseline
+        time_to_peak = np.nan
+        if(self.started and self._peak_sample is not None and not np.isnan(self._peak)):
+            time_to_peak = (self._peak_sample - self._start_sample)*self.sample_period
+        return TrackerState(self.samples, self.started, self._value, baseline, delta,
+                            delta/baseline*100 if baseline else np.nan, self._peak,
+                            self._peak/baseline*100 if baseline else np.nan,
+                            time_to_peak)
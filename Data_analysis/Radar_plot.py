@@ -5,12 +5,18 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import statistics as stat
+from Figure_rendering import use_headless_backend, show_figures
 
 # Importing dataframe
 print("-------------------------------------------------------------------------")
 print("------------------------------- New run ---------------------------------")
 print("-------------------------------------------------------------------------")
 
+flag_headless = 0  # 1 to save the figures without displaying them
+
+if(flag_headless):
+    use_headless_backend()
+
 
 '''
 ---------------------------------------------------------------------------------
@@ -111,4 +117,4 @@ plt.title('Questonnaire response')
 lines, labels = plt.thetagrids(np.degrees(label_loc), labels=categories)
 plt.legend(loc='best')
 
-plt.show()
+show_figures(flag_headless, 'Figures', 'Radar_plot')
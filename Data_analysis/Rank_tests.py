@@ -0,0 +1,159 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR RANK-BASED TESTS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains vectorized versions of the non parametric tests performed in
+<Statistical_analysis>:
+    - Kruskal Wallis test between groups of subjects (e.g. lobe and forearm), for all
+      the timepoints at once: each group is a 2-D array (subjects, timepoints) and the
+      ranks are computed along the subjects axis.
+    - Wilcoxon matched pairs test for many pairs of paired series at once (e.g. lobe
+      and forearm data of each subject over time): the signed ranks are computed along
+      the last axis.
+
+The results are the same of scipy.stats.kruskal and scipy.stats.wilcoxon (default
+arguments: zero_method='wilcox', correction=False, two-sided alternative, exact
+distribution for series up to 50 values without zero differences, normal approximation
+otherwise), computed separately for every timepoint or pair of series.
+------------------------------------------------------------------------------------------
+'''
+
+import numpy as np
+from scipy import stats
+
+# Largest series for which the exact distribution of the Wilcoxon statistic is used
+WILCOXON_EXACT_MAX = 50
+
+
+################ RANK COLUMNS #################
+# \brief: Function that ranks the values of each column of a matrix (average ranks for
+#   ties, as scipy.stats.rankdata) and computes the tie correction term of each column.
+#   NaN values are ranked after all the other values and are not counted as ties.
+# \parameters:
+#   @param <data>: 2-D array, values are ranked along the first axis
+# \return (2-D array of ranks, 1-D array with the sum of t^3 - t over the ties of each
+#   column, t = number of values in a tie)
+###############################################
+def rank_columns(data):
+    data = np.asarray(data, dtype=float)
+    rows, columns = data.shape
+    order = np.argsort(data, axis=0, kind='mergesort')
+    sorted_data = np.take_along_axis(data, order, axis=0)
+
+    # Groups of equal values in each column
+    new_group = np.ones((rows, columns), dtype=bool)
+    new_group[1:] = sorted_data[1:] != sorted_data[:-1]
+    group = np.cumsum(new_group, axis=0) - 1
+    group_id = (group + np.arange(columns)*rows).ravel(order='F')
+    sizes = np.bincount(group_id, minlength=rows*columns)
+    # First position (0-based) of each group: average rank = first + (size+1)/2
+    first = np.cumsum(sizes) - sizes - np.repeat(np.arange(columns)*rows, rows)
+    average = first + (sizes + 1)/2
+    sorted_ranks = average[group_id].reshape((columns, rows)).T
+
+    ranks = np.empty_like(sorted_ranks)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=0)
+
+    valid_sizes = np.bincount(group_id, weights=~np.isnan(sorted_data).ravel(order='F'),
+                              minlength=rows*columns)
+    ties = (valid_sizes**3 - valid_sizes).reshape((columns, rows)).sum(axis=1)
+    return ranks, ties
+
+
+################ KRUSKAL COLUMNS #################
+# \brief: Function that performs the Kruskal Wallis test between groups for each column
+#   (timepoint) of the data.
+# \parameters:
+#   @param <groups>: 2-D arrays (subjects, timepoints), one for each group, with the
+#           same number of timepoints
+# \return dictionary {"statistic": H array, "pvalue": p-value array}; NaN where all the
+#   values of a timepoint are identical (scipy.stats.kruskal raises an error) or where
+#   a group has no subjects
+##################################################
+def kruskal_columns(*groups):
+    groups = [np.atleast_2d(np.asarray(group, dtype=float)) for group in groups]
+    if(len(groups) < 2):
+        raise ValueError("Need at least two groups in kruskal_columns()")
+    columns = groups[0].shape[1]
+    if(any(group.shape[1] != columns for group in groups)):
+        raise ValueError("All the groups must have the same number of timepoints")
+    if(any(group.shape[0] == 0 for group in groups)):
+        nan = np.full(columns, np.nan)
+        return {"statistic": nan, "pvalue": nan.copy()}
+
+    sizes = np.array([group.shape[0] for group in groups])
+    ranks, ties = rank_columns(np.concatenate(groups, axis=0))
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+    ssbn = sum(ranks[bounds[i]:bounds[i+1]].sum(axis=0)**2 / sizes[i]
+               for i in range(len(groups)))
+
+    total = float(sizes.sum())
+    correction = 1 - ties/(total**3 - total)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        h = (12.0/(total*(total + 1))*ssbn - 3*(total + 1)) / correction
+    h = np.where(correction > 0, h, np.nan)
+    return {"statistic": h, "pvalue": stats.chi2.sf(h, len(groups) - 1)}
+
+
+################ WILCOXON DISTRIBUTION #################
+# \brief: Function that computes the exact null distribution of the Wilcoxon signed rank
+#   statistic for n values (number of subsets of 1..n with each sum).
+# \parameters:
+#   @param <n>: number of non zero differences
+# \return 1-D array, probability of each value of the statistic (0 ... n(n+1)/2)
+########################################################
+def _wilcoxon_distribution(n):
+    counts = np.zeros(n*(n + 1)//2 + 1)
+    counts[0] = 1
+    for rank in range(1, n + 1):
+        counts[rank:] = counts[rank:] + counts[:-rank].copy()
+    return counts / 2.0**n
+
+
+################ WILCOXON ROWS #################
+# \brief: Function that performs the Wilcoxon matched pairs test for each row of two
+#   paired matrices (or on each row of a matrix of differences).
+# \parameters:
+#   @param <x>: 2-D array (pairs, samples) or 1-D array
+#   @param <y>: 2-D array with the same shape of x. If None x contains the differences
+# \return dictionary {"statistic": min(R+, R-) array, "pvalue": p-value array}
+################################################
+def wilcoxon_rows(x, y=None):
+    d = np.atleast_2d(np.asarray(x, dtype=float))
+    if(y is not None):
+        d = d - np.atleast_2d(np.asarray(y, dtype=float))
+    pairs, samples = d.shape
+
+    zeros = d == 0
+    has_zeros = zeros.any(axis=1)
+    nonzero = np.where(zeros, np.nan, d)
+    count = samples - np.isnan(nonzero).sum(axis=1)
+
+    ranks, ties = rank_columns(np.abs(nonzero).T)
+    ranks = ranks.T
+    r_plus = np.where(nonzero > 0, ranks, 0).sum(axis=1)
+    r_minus = np.where(nonzero < 0, ranks, 0).sum(axis=1)
+    statistic = np.minimum(r_plus, r_minus)
+
+    # Normal approximation (with tie correction)
+    mean = count*(count + 1)*0.25
+    se = np.sqrt((count*(count + 1)*(2*count + 1) - ties/2) / 24)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = -np.abs((r_plus - mean) / se)
+    pvalue = 2*stats.norm.cdf(z)
+
+    # Exact distribution for short series without zero differences
+    exact = (samples <= WILCOXON_EXACT_MAX) & ~has_zeros
+    for n in np.unique(count[exact]):
+        rows = exact & (count == n)
+        pmf = _wilcoxon_distribution(int(n))
+        cdf = np.cumsum(pmf)
+        sf = np.cumsum(pmf[::-1])[::-1]
+        k = r_plus[rows].astype(int)
+        pvalue[rows] = np.clip(2*np.minimum(sf[k], cdf[k]), 0, 1)
+
+    statistic = np.where(count > 0, statistic, np.nan)
+    pvalue = np.where(count > 0, pvalue, np.nan)
+    return {"statistic": statistic, "pvalue": pvalue}
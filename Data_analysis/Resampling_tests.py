@@ -0,0 +1,302 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR RESAMPLING TESTS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains resampling tests for the lobe - forearm comparison of
+<Statistical_analysis>, that do not need the normality of the data (see the normality
+test of the script) nor the asymptotic distributions of the rank tests. For every
+timepoint the differences lobe - forearm of the subjects (paired data) are used:
+    - permutation test (sign flip): under H0 the distribution of the differences is
+      symmetric about zero, so the sign of each difference can be flipped; the p-value
+      is the fraction of sign patterns with |mean difference| at least as large as the
+      observed one (two-sided).
+      With up to EXACT_MAX subjects all the 2^n sign patterns are enumerated (exact
+      p-value). Otherwise random sign patterns are drawn in batches and a timepoint is
+      stopped as soon as its p-value is resolved, i.e. the Clopper-Pearson interval of
+      the Monte Carlo p-value is all above or all below <alpha>.
+    - bootstrap: percentile confidence interval of the mean difference, resampling the
+      subjects.
+All the timepoints are tested at once: each batch is a matrix of resampled signs (or
+subject indices) multiplied by the matrix of the differences (subjects, timepoints).
+The batches are run in a process pool; batch k always uses the k-th independent stream
+of the seed (numpy SeedSequence), so the results do not depend on the number of workers.
+NaN differences (missing data) are left out of the mean of their timepoint.
+
+Output file (when run as a script): Resampling_<device>_<sample number>.csv, one row for
+each timepoint.
+
+\Parameters: (command line)
+    @param <--sample-number>: window size of the merged tables. Default value is 10.
+    @param <--resamples>: maximum number of random sign patterns. Default value is 100000.
+    @param <--bootstrap>: number of bootstrap resamples. Default value is 10000.
+    @param <--alpha>: significance level of the early stopping. Default value is 0.05.
+    @param <--seed>: seed of the random generators. Default value is 0.
+    @param <--workers>: number of worker processes. Default is the number of CPUs.
+    @param <--columnar-store>: read the merged tables from the columnar session store
+            (see the module <Session_store>).
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Largest number of subjects for which all the sign patterns are enumerated
+EXACT_MAX = 16
+# Relative tolerance of the comparison with the observed statistic (rounding errors)
+TOLERANCE = 1e-9
+RESAMPLING_COLUMNS = ("mean_difference", "pvalue", "resamples", "exact", "ci_low",
+                      "ci_high")
+
+
+################ STREAM #################
+# \brief: Function that returns the k-th independent stream of a seed.
+# \parameters:
+#   @param <seed>: numpy SeedSequence
+#   @param <k>: number of the stream (batch)
+# \return numpy Generator
+#########################################
+def _stream(seed, k):
+    return np.random.default_rng(
+        np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (k,)))
+
+
+################ RUN BATCHES #################
+# \brief: Function that runs a function on a list of arguments, in a process pool or in
+#   this process (executor None).
+##############################################
+def _run_batches(executor, function, arguments):
+    if(executor is None):
+        return [function(*argument) for argument in arguments]
+    return list(executor.map(function, *zip(*arguments)))
+
+
+################ EXCEEDANCES #################
+# \brief: Function that counts, for every timepoint, the sign patterns whose |sum| is at
+#   least the observed one.
+# \parameters:
+#   @param <signs>: 2-D array (patterns, subjects) of -1 and +1
+#   @param <differences>: 2-D array (subjects, timepoints), NaN replaced by 0
+#   @param <threshold>: 1-D array, observed |sum| of each timepoint minus the tolerance
+# \return 1-D array of counts
+##############################################
+def _exceedances(signs, differences, threshold):
+    return np.count_nonzero(np.abs(signs @ differences) >= threshold, axis=0)
+
+
+################ EXACT BATCH #################
+# \brief: Function that counts the exceedances of the sign patterns start...stop - 1 (bit
+#   i of the pattern number gives the sign of subject i).
+##############################################
+def _exact_batch(differences, threshold, start, stop):
+    patterns = np.arange(start, stop, dtype=np.int64)[:, None]
+    signs = ((patterns >> np.arange(differences.shape[0])) & 1)*2.0 - 1
+    return _exceedances(signs, differences, threshold)
+
+
+################ RANDOM BATCH #################
+# \brief: Function that counts the exceedances of <size> random sign patterns of the
+#   k-th stream of the seed.
+###############################################
+def _random_batch(differences, threshold, seed, k, size):
+    rng = _stream(seed, k)
+    signs = rng.integers(0, 2, (size, differences.shape[0]), dtype=np.int8)*2.0 - 1
+    return _exceedances(signs, differences, threshold)
+
+
+################ BOOTSTRAP BATCH #################
+# \brief: Function that computes the mean difference of <size> bootstrap samples of the
+#   subjects (k-th stream of the seed).
+# \return 2-D array (size, timepoints)
+##################################################
+def _bootstrap_batch(differences, valid, seed, k, size):
+    rng = _stream(seed, k)
+    index = rng.integers(0, differences.shape[0], (size, differences.shape[0]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return differences[index].sum(axis=1)/valid[index].sum(axis=1)
+
+
+################ PREPARE #################
+# \brief: Function that prepares the paired differences.
+# \return (differences with NaN replaced by 0, valid mask, mean difference)
+##########################################
+def _prepare(a, b):
+    differences = np.atleast_2d(np.asarray(a, dtype=float) - np.asarray(b, dtype=float))
+    valid = ~np.isnan(differences)
+    differences = np.where(valid, differences, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = differences.sum(axis=0)/valid.sum(axis=0)
+    return differences, valid, mean
+
+
+################ SIGN FLIP TEST #################
+# \brief: Function that performs the paired permutation test (sign flip) of all the
+#   columns at once.
+# \parameters:
+#   @param <a>, <b>: 2-D arrays (subjects, timepoints), paired data
+#   @param <resamples>: maximum number of random sign patterns of each timepoint
+#   @param <alpha>: significance level used to stop the timepoints early
+#   @param <confidence>: confidence of the Clopper-Pearson interval of the p-value
+#   @param <batch_size>: sign patterns of each batch
+#   @param <seed>: seed of the random generator (int or numpy SeedSequence)
+#   @param <exact_max>: largest number of subjects for the exact enumeration
+#   @param <executor>: process pool (None: batches run in this process)
+#   @param <batches>: batches run at the same time (e.g. number of workers)
+# \return dictionary {"statistic": mean difference, "pvalue", "resamples": sign
+#   patterns used, "exact": True if all the patterns were enumerated}
+#################################################
+def sign_flip_test(a, b, resamples=100000, alpha=0.05, confidence=0.999, batch_size=2000,
+                   seed=None, exact_max=EXACT_MAX, executor=None, batches=1):
+    differences, _, mean = _prepare(a, b)
+    subjects, timepoints = differences.shape
+    observed = np.abs(differences.sum(axis=0))
+    threshold = observed - TOLERANCE*np.maximum(np.abs(differences).sum(axis=0), 1e-300)
+
+    if(subjects <= exact_max):
+        total = 2**subjects
+        edges = np.linspace(0, total, min(batches, total) + 1).astype(np.int64)
+        edges = np.unique(np.concatenate([np.arange(0, total, 2**16), edges, [total]]))
+        counts = np.sum(_run_batches(executor, _exact_batch,
+                                     [(differences, threshold, start, stop)
+                                      for start, stop in zip(edges[:-1], edges[1:])]),
+                        axis=0)
+        return {"statistic": mean, "pvalue": counts/total,
+                "resamples": np.full(timepoints, total), "exact": np.ones(timepoints, bool)}
+
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    counts = np.zeros(timepoints, dtype=np.int64)
+    drawn = np.zeros(timepoints, dtype=np.int64)
+    active = np.ones(timepoints, dtype=bool)
+    batch = 0
+    tail = (1 - confidence)/2
+    while(active.any() and drawn[active].max() < resamples):
+        columns = np.flatnonzero(active)
+        sizes = [min(batch_size, resamples - int(drawn[columns[0]]) - i*batch_size)
+                 for i in range(batches)]
+        sizes = [size for size in sizes if size > 0]
+        results = _run_batches(executor, _random_batch,
+                               [(differences[:, columns], threshold[columns], seed,
+                                 batch + i, size) for i, size in enumerate(sizes)])
+        batch += len(sizes)
+        # Batches added in order, as if they were run one at a time
+        for size, result in zip(sizes, results):
+            live = active[columns]
+            if(not live.any()):
+                break
+            counts[columns[live]] += result[live]
+            drawn[columns[live]] += size
+
+            # Clopper-Pearson interval of the p-value of the active timepoints
+            k, n = counts[columns[live]], drawn[columns[live]]
+            lower = np.where(k > 0, stats.beta.ppf(tail, k, n - k + 1), 0.0)
+            upper = np.where(k < n, stats.beta.ppf(1 - tail, k + 1, n - k), 1.0)
+            active[columns[live]] = (lower <= alpha) & (upper >= alpha)
+
+    # The observed pattern is counted once (p-value never 0)
+    return {"statistic": mean, "pvalue": (counts + 1)/(drawn + 1), "resamples": drawn,
+            "exact": np.zeros(timepoints, bool)}
+
+
+################ BOOTSTRAP INTERVAL #################
+# \brief: Function that computes the percentile bootstrap confidence interval of the mean
+#   difference of all the columns at once.
+# \parameters:
+#   @param <a>, <b>: 2-D arrays (subjects, timepoints), paired data
+#   @param <resamples>: number of bootstrap samples
+#   @param <confidence>: confidence level
+#   @param <batch_size>: bootstrap samples of each batch
+#   @param <seed>: seed of the random generator (int or numpy SeedSequence)
+#   @param <executor>: process pool (None: batches run in this process)
+# \return (lower limit, upper limit): 1-D arrays
+#####################################################
+def bootstrap_interval(a, b, resamples=10000, confidence=0.95, batch_size=2000, seed=None,
+                       executor=None):
+    differences, valid, _ = _prepare(a, b)
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    means = np.concatenate(_run_batches(executor, _bootstrap_batch,
+                                        [(differences, valid, seed, k, size)
+                                         for k, size in enumerate(sizes)]))
+    tail = (1 - confidence)/2*100
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+    return low, high
+
+
+################ PAIRED RESAMPLING #################
+# \brief: Function that performs the sign flip test and the bootstrap interval of the
+#   differences a - b for every timepoint, sharing one process pool.
+# \parameters:
+#   @param <a>, <b>: 2-D arrays (subjects, timepoints), e.g. lobe and forearm deltas
+#   @param <resamples>: maximum number of random sign patterns
+#   @param <bootstrap>: number of bootstrap samples
+#   @param <alpha>: significance level of the early stopping
+#   @param <confidence>: confidence level of the bootstrap interval
+#   @param <seed>: seed of the random generators (int or numpy SeedSequence)
+#   @param <workers>: number of worker processes (None to use all the CPUs, 0 to run in
+#           this process)
+# \return pandas DataFrame (RESAMPLING_COLUMNS), one row for each timepoint
+####################################################
+def paired_resampling(a, b, resamples=100000, bootstrap=10000, alpha=0.05, confidence=0.95,
+                      seed=None, workers=None):
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    permutation_seed, bootstrap_seed = seed.spawn(2)
+    if(workers == 0):
+        test = sign_flip_test(a, b, resamples, alpha, seed=permutation_seed)
+        low, high = bootstrap_interval(a, b, bootstrap, confidence, seed=bootstrap_seed)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            test = sign_flip_test(a, b, resamples, alpha, seed=permutation_seed,
+                                  executor=executor, batches=workers or os.cpu_count())
+            low, high = bootstrap_interval(a, b, bootstrap, confidence, seed=bootstrap_seed,
+                                           executor=executor)
+    return pd.DataFrame({"mean_difference": test["statistic"], "pvalue": test["pvalue"],
+                         "resamples": test["resamples"], "exact": test["exact"],
+                         "ci_low": low, "ci_high": high})
+
+
+if __name__ == "__main__":
+    from Session_store import read_table, start_index
+    from Subject_matrix import SubjectMatrix
+
+    parser = argparse.ArgumentParser(
+        description="Permutation tests and bootstrap intervals lobe - forearm")
+    parser.add_argument("--sample-number", type=int, default=10,
+                        help="window size of the merged tables (default: 10)")
+    parser.add_argument("--resamples", type=int, default=100000,
+                        help="maximum number of random sign patterns (default: 100000)")
+    parser.add_argument("--bootstrap", type=int, default=10000,
+                        help="number of bootstrap resamples (default: 10000)")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="significance level of the early stopping (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random generators (default: 0)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--columnar-store", action="store_true",
+                        help="read the merged tables from the columnar session store")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    for device, seed in zip(("CO2", "Sentec"), np.random.SeedSequence(args.seed).spawn(2)):
+        name = '%s_df_%s_median_merged' % (device, args.sample_number)
+        if(args.columnar_store):
+            df = read_table(name)
+        else:
+            df = pd.read_csv(name + '.csv', sep=";")
+        matrix = SubjectMatrix.from_dataframe(df, start_index(df, df.columns[0]))
+        # Lobe and forearm data of the same subject in adjacent rows
+        delta = matrix.delta()
+        pairs = matrix.subjects // 2
+        results = paired_resampling(delta[0:2*pairs:2], delta[1:2*pairs:2],
+                                    args.resamples, args.bootstrap, args.alpha, seed=seed,
+                                    workers=args.workers)
+        print(device)
+        print(results)
+        results.to_csv('Resampling_%s_%s.csv' % (device, args.sample_number), sep=';',
+                       index=False)
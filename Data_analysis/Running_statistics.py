@@ -0,0 +1,323 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR RUNNING STATISTICS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the filters used to smooth the CO2 and Sentec traces (windowed
+medians of <Dataframe_Creation>, moving averages MA(50) and MA(4) of the MATLAB script)
+computed sample by sample, for live monitoring, or on whole arrays.
+
+RunningWindow keeps the samples of a window and updates mean and quantiles (median by
+default) when a sample is added (push) or removed (pop):
+    - the mean is updated with a running sum
+    - each quantile is kept by two heaps: a max-heap with the samples up to the quantile
+      position and a min-heap with the others. Removed samples are deleted lazily (when
+      they reach the top of a heap); when the deleted samples still in the heaps are
+      more than the samples of the window, the heaps are rebuilt with the live samples
+      only. The heaps never hold more than about 2w entries, and each update costs
+      O(log w) (amortized).
+Two modes are available:
+    - sliding: the oldest sample is removed when the window is full, and the statistics
+      are returned after each sample
+    - tumbling: the statistics are returned every <window> samples and the window is
+      emptied (windows of <Dataframe_Creation>)
+
+rolling_statistics() computes the same values on a whole array: with the "vectorized"
+method a 2-D view of the windows is reduced by NumPy, in blocks of rows of at most
+CHUNK_VALUES values (np.median and np.quantile copy the windows they reduce, so the memory
+does not grow with the length of the array), with the "heap" method the samples are pushed in a RunningWindow (better for very long windows,
+chosen by the default "auto" method when the window is longer than HEAP_WINDOW samples).
+Quantiles use the linear interpolation of np.quantile.
+------------------------------------------------------------------------------------------
+'''
+
+from collections import deque
+import heapq
+import itertools
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MODES = ("sliding", "tumbling")
+METHODS = ("auto", "vectorized", "heap")
+# Window size above which the "auto" method uses the heaps
+HEAP_WINDOW = 500
+# Maximum number of values of the windows reduced at once by the "vectorized" method
+CHUNK_VALUES = 1 << 20
+
+
+class _QuantileHeaps:
+
+    ################ INIT #################
+    # \brief: Constructor of the two heaps of a quantile. Samples are (value, sequence
+    #   number) pairs, so that equal values are removed exactly.
+    # \parameters:
+    #   @param <q>: quantile, between 0 and 1
+    #######################################
+    def __init__(self, q):
+        self.q = q
+        self.clear()
+
+    def clear(self):
+        self._low = []   # max-heap: (-value, -sequence)
+        self._high = []  # min-heap: (value, sequence)
+        self._low_size = 0
+        self._high_size = 0
+        self._removed = set()
+
+    ################ PRUNE #################
+    # \brief: Function that removes from the top of the heaps the samples deleted lazily.
+    ########################################
+    def _prune(self):
+        while(len(self._low) > 0 and -self._low[0][1] in self._removed):
+            self._removed.discard(-heapq.heappop(self._low)[1])
+        while(len(self._high) > 0 and self._high[0][1] in self._removed):
+            self._removed.discard(heapq.heappop(self._high)[1])
+
+    ################ COMPACT #################
+    # \brief: Function that rebuilds the heaps without the samples deleted lazily, when
+    #   they are more than the live samples (the heaps stay O(w) on trending data, where
+    #   the deleted samples do not reach the top of the heaps).
+    ##########################################
+    def _compact(self):
+        if(len(self._removed) <= self._low_size + self._high_size):
+            return
+        self._low = [item for item in self._low if -item[1] not in self._removed]
+        self._high = [item for item in self._high if item[1] not in self._removed]
+        heapq.heapify(self._low)
+        heapq.heapify(self._high)
+        self._removed.clear()
+
+    ################ BALANCE #################
+    # \brief: Function that moves samples between the heaps, so that the max-heap
+    #   contains floor(q*(n-1))+1 samples.
+    ##########################################
+    def _balance(self):
+        n = self._low_size + self._high_size
+        target = int(math.floor(self.q*(n - 1))) + 1 if n > 0 else 0
+        while(self._low_size > target):
+            value, sequence = heapq.heappop(self._low)
+            heapq.heappush(self._high, (-value, -sequence))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune()
+        while(self._low_size < target):
+            value, sequence = heapq.heappop(self._high)
+            heapq.heappush(self._low, (-value, -sequence))
+            self._low_size += 1
+            self._high_size -= 1
+            self._prune()
+
+    def add(self, value, sequence):
+        if(self._low_size > 0 and (value, sequence) > (-self._low[0][0], -self._low[0][1])):
+            heapq.heappush(self._high, (value, sequence))
+            self._high_size += 1
+        else:
+            heapq.heappush(self._low, (-value, -sequence))
+            self._low_size += 1
+        self._balance()
+
+    def remove(self, value, sequence):
+        self._removed.add(sequence)
+        if(self._low_size > 0 and (value, sequence) <= (-self._low[0][0], -self._low[0][1])):
+            self._low_size -= 1
+        else:
+            self._high_size -= 1
+        self._prune()
+        self._compact()
+        self._balance()
+
+    ################ VALUE #################
+    # \brief: Quantile of the samples (linear interpolation), NaN if empty.
+    ########################################
+    def value(self):
+        n = self._low_size + self._high_size
+        if(n == 0):
+            return np.nan
+        position = self.q*(n - 1)
+        low = -self._low[0][0]
+        fraction = position - math.floor(position)
+        if(fraction == 0 or self._high_size == 0):
+            return low
+        return low + (self._high[0][0] - low)*fraction
+
+
+class RunningWindow:
+
+    ################ INIT #################
+    # \brief: Constructor of the running window.
+    # \parameters:
+    #   @param <window>: number of samples in the window
+    #   @param <mode>: "sliding" or "tumbling"
+    #   @param <quantiles>: quantiles (0-1) kept up to date, 0.5 is the median
+    #   @param <min_samples>: sliding mode, number of samples needed before the
+    #           statistics are returned. Default is <window>
+    #######################################
+    def __init__(self, window, mode="sliding", quantiles=(0.5,), min_samples=None):
+        if(int(window) <= 0):
+            raise ValueError("window must be a positive integer")
+        if(mode not in MODES):
+            raise ValueError("Unknown mode: %s" % mode)
+        for q in quantiles:
+            if(q < 0 or q > 1):
+                raise ValueError("Quantiles must be between 0 and 1")
+        self.window = int(window)
+        self.mode = mode
+        self.min_samples = self.window if min_samples is None else int(min_samples)
+        self._heaps = {q: _QuantileHeaps(q) for q in quantiles}
+        self._samples = deque()
+        self._sequence = itertools.count()
+        self._sum = 0.0
+        self._updates = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    ################ PUSH #################
+    # \brief: Function that adds a sample (in sliding mode the oldest sample is removed
+    #   when the window is full).
+    # \parameters:
+    #   @param <value>: new sample
+    # \return dictionary of statistics (see statistics()) when available, otherwise None
+    #######################################
+    def push(self, value):
+        value = float(value)
+        sequence = next(self._sequence)
+        self._samples.append((value, sequence))
+        self._sum += value
+        for heaps in self._heaps.values():
+            heaps.add(value, sequence)
+        self._recompute_sum()
+
+        if(self.mode == "tumbling"):
+            if(len(self._samples) < self.window):
+                return None
+            results = self.statistics()
+            self.clear()
+            return results
+        if(len(self._samples) > self.window):
+            self.pop()
+        if(len(self._samples) < self.min_samples):
+            return None
+        return self.statistics()
+
+    ################ POP #################
+    # \brief: Function that removes the oldest sample.
+    # \return removed value
+    ######################################
+    def pop(self):
+        value, sequence = self._samples.popleft()
+        self._sum -= value
+        for heaps in self._heaps.values():
+            heaps.remove(value, sequence)
+        return value
+
+    ################ RECOMPUTE SUM #################
+    # \brief: Function that recomputes the running sum once every <window> updates, so
+    #   that rounding errors do not accumulate on long recordings.
+    ################################################
+    def _recompute_sum(self):
+        self._updates += 1
+        if(self._updates >= self.window):
+            self._updates = 0
+            self._sum = math.fsum(value for value, sequence in self._samples)
+
+    def clear(self):
+        self._samples.clear()
+        self._sum = 0.0
+        self._updates = 0
+        for heaps in self._heaps.values():
+            heaps.clear()
+
+    @property
+    def mean(self):
+        return self._sum/len(self._samples) if len(self._samples) > 0 else np.nan
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    ################ QUANTILE #################
+    # \brief: Function that returns a quantile of the window (it has to be given to the
+    #   constructor).
+    ###########################################
+    def quantile(self, q):
+        if(q not in self._heaps):
+            raise ValueError("Quantile %g is not kept by this window" % q)
+        return self._heaps[q].value()
+
+    ################ STATISTICS #################
+    # \brief: Function that returns the statistics of the window.
+    # \return dictionary {"mean": value, "median": value (if kept), "q<q>": value for
+    #   each quantile}
+    #############################################
+    def statistics(self):
+        results = {"mean": self.mean}
+        for q, heaps in self._heaps.items():
+            results["median" if q == 0.5 else "q%g" % q] = heaps.value()
+        return results
+
+
+################ ROLLING STATISTICS #################
+# \brief: Function that computes the running statistics of a whole array.
+# \parameters:
+#   @param <data>: 1-D array
+#   @param <window>: number of samples in the window
+#   @param <quantiles>: quantiles (0-1), 0.5 is returned as "median"
+#   @param <mode>: "sliding" (one value for each complete window, i.e. len(data)-window+1
+#           values) or "tumbling" (one value every <window> samples)
+#   @param <method>: "auto", "vectorized" or "heap"
+# \return dictionary {"mean": array, "median": array, "q<q>": array}
+#####################################################
+def rolling_statistics(data, window, quantiles=(0.5,), mode="sliding", method="auto"):
+    data = np.asarray(data, dtype=float)
+    window = int(window)
+    if(mode not in MODES):
+        raise ValueError("Unknown mode: %s" % mode)
+    if(method not in METHODS):
+        raise ValueError("Unknown method: %s" % method)
+    names = ["median" if q == 0.5 else "q%g" % q for q in quantiles]
+    if(method == "auto"):
+        method = "heap" if mode == "sliding" and window > HEAP_WINDOW else "vectorized"
+
+    if(method == "heap"):
+        running = RunningWindow(window, mode, quantiles)
+        rows = [result for result in map(running.push, data) if result is not None]
+        return {name: np.array([row[name] for row in rows]) for name in ["mean"] + names}
+
+    if(mode == "sliding"):
+        if(len(data) < window):
+            return {name: np.empty(0) for name in ["mean"] + names}
+        windows = sliding_window_view(data, window)
+        cumulative = np.concatenate(([0.0], np.cumsum(data)))
+        results = {"mean": (cumulative[window:] - cumulative[:-window])/window}
+    else:
+        windows = data[:len(data)//window*window].reshape(-1, window)
+        results = {"mean": windows.mean(axis=1)}
+    rows = max(CHUNK_VALUES//window, 1)
+    for q, name in zip(quantiles, names):
+        results[name] = np.empty(len(windows))
+        for first in range(0, len(windows), rows):
+            block = windows[first:first + rows]
+            if(q == 0.5):
+                results[name][first:first + rows] = np.median(block, axis=1)
+            else:
+                results[name][first:first + rows] = np.quantile(block, q, axis=1)
+    return results
+
+
+################ MOVING AVERAGE #################
+# \brief: Function that applies the causal moving average filter of the MATLAB script
+#   (filter(ones(1,w)/w, 1, data)): the first w-1 outputs average the available samples
+#   with zeros before the start of the recording.
+# \parameters:
+#   @param <data>: 1-D array
+#   @param <window>: number of samples (e.g. 50 for the device data, 4 for Sentec)
+# \return 1-D array with the same length of data
+#################################################
+def moving_average(data, window):
+    data = np.asarray(data, dtype=float)
+    cumulative = np.cumsum(data)
+    cumulative[window:] = cumulative[window:] - cumulative[:-window]
+    return cumulative/window
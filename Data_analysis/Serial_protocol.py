@@ -0,0 +1,234 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR THE DEVICE SERIAL PROTOCOL
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module parses the output written by the firmware (4_Codice_per_PCB_Interrupt) on
+the USB serial port (115200 baud). Each line can contain:
+    - MegunoLink TimePlot frames, sent by SendData(), e.g.
+          {TIMEPLOT:CO2 Sangue|D|CO2Sangue:k-2n|T|1250.00}
+      i.e. channel name (name given to the TimePlot object, optional), series name,
+      series properties (colour, line style, line width, marker) and value. The time
+      field "T" (time of the PC) is optional.
+    - the CO2 value printed in text, "Valore Co2 ppm: <n>"
+    - text messages of the state machine (e.g. "Stop riscaldamento")
+
+Each element is returned as a Record (kind, channel, series, color, value, text) by
+parse_line().
+
+Whole captures (e.g. a day of serial output) are decoded in bulk by decode_frames(): the
+frames are matched with a compiled bytes pattern directly on the buffer (bytes, bytearray,
+memoryview or mmap, without decoding the text line by line) and the values are converted
+to one NumPy array per series. Lines that are not frames are skipped, so frames
+interleaved with text messages or corrupted by noise do not stop the decoding; a frame
+truncated at the end of the buffer is left to the next call (see FrameDecoder).
+
+\Parameters: (command line)
+    @param <capture>: text file with a serial capture. The frames are saved to
+            <capture>_frames.npz (values and byte offsets of each series).
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+from collections import namedtuple
+import mmap
+import os
+import re
+import numpy as np
+
+BAUDRATE = 115200
+
+# Series names of the firmware
+CO2_SERIES = "CO2Sangue"
+DELTA_SERIES = "DeltaCO2"
+
+# Colours of the MegunoLink TimePlot series (first character of the series properties)
+COLORS = {"r": "Red", "g": "Green", "b": "Blue", "y": "Yellow", "k": "Black",
+          "m": "Magenta", "c": "Cyan", "w": "White"}
+
+FRAME_PATTERN = re.compile(
+    r"\{TIMEPLOT(?::([^|{}]*))?\|D\|([^|:{}]*)(?::([^|{}]*))?\|(?:T\|)?([^|{}]*)\}")
+FRAME_BYTES_PATTERN = re.compile(FRAME_PATTERN.pattern.encode())
+# Frame not terminated at the end of a buffer (frames do not span more lines)
+TRUNCATED_PATTERN = re.compile(rb"\{[^{}\r\n]*\Z")
+# Longest truncated frame kept between two buffers
+MAX_FRAME = 256
+CO2_PATTERN = re.compile(r"Valore Co2 ppm:\s*(-?\d+(?:\.\d*)?)")
+
+# kind: "frame", "co2" or "message"
+Record = namedtuple("Record", ("kind", "channel", "series", "color", "value", "text"))
+# values: float array, offsets: byte offsets of the frames in the decoded buffer
+Series = namedtuple("Series", ("channel", "series", "color", "values", "offsets"))
+
+
+################ SERIES COLOR #################
+# \brief: Function that returns the colour name of the series properties of a frame.
+# \parameters:
+#   @param <properties>: series properties (e.g. "k-2n"), None if not sent
+# \return colour name, None if not given
+###############################################
+def series_color(properties):
+    if(not properties):
+        return None
+    return COLORS.get(properties[0], None)
+
+
+################ TO FLOAT #################
+# \brief: Function that converts a value of the serial output, NaN if not valid.
+###########################################
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+################ PARSE LINE #################
+# \brief: Function that parses a line of the serial output.
+# \parameters:
+#   @param <line>: decoded line (str), with or without the line terminator
+# \return list of Record, in the order in which they appear in the line
+#############################################
+def parse_line(line):
+    records = []
+    rest = []
+    position = 0
+    for match in FRAME_PATTERN.finditer(line):
+        rest.append(line[position:match.start()])
+        position = match.end()
+        channel, series, properties, value = match.groups()
+        records.append(Record("frame", channel, series.strip(), series_color(properties),
+                              _to_float(value), None))
+    rest.append(line[position:])
+    text = "".join(rest).strip()
+    if(len(text) == 0):
+        return records
+
+    match = CO2_PATTERN.search(text)
+    if(match is not None):
+        records.append(Record("co2", None, CO2_SERIES, None,
+                       float(match.group(1)), None))
+    else:
+        records.append(Record("message", None, None, None, float("nan"), text))
+    return records
+
+
+################ TO FLOAT ARRAY #################
+# \brief: Function that converts the values of the frames, NaN where not valid.
+# \parameters:
+#   @param <values>: list of bytes
+# \return float array
+#################################################
+def _to_float_array(values):
+    try:
+        return np.array(values, dtype=bytes).astype(np.float64)
+    except ValueError:
+        return np.array([_to_float(value) for value in values], dtype=np.float64)
+
+
+################ DECODE FRAMES #################
+# \brief: Function that decodes all the TimePlot frames of a buffer.
+# \parameters:
+#   @param <buffer>: bytes, bytearray, memoryview or mmap with the serial output
+#   @param <base_offset>: offset added to the byte offsets of the frames
+# \return (dictionary {series name: Series}, number of bytes decoded: the bytes after it
+#   are a truncated frame to be decoded with the next data)
+################################################
+def decode_frames(buffer, base_offset=0):
+    view = memoryview(buffer)
+    matches = [(match.start(), match.end()) + match.groups()
+               for match in FRAME_BYTES_PATTERN.finditer(view)]
+    end = matches[-1][1] if len(matches) > 0 else 0
+    truncated = TRUNCATED_PATTERN.search(view, end)
+    consumed = len(view)
+    if(truncated is not None and len(view) - truncated.start() <= MAX_FRAME):
+        consumed = truncated.start()
+    if(len(matches) == 0):
+        return {}, consumed
+
+    starts, ends, channels, series, properties, values = zip(*matches)
+    names, first, inverse = np.unique(np.array(series, dtype=bytes), return_index=True,
+                                      return_inverse=True)
+    values = _to_float_array(values)
+    offsets = np.array(starts, dtype=np.int64) + base_offset
+    # Frames grouped by series, in order of arrival
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(names)))[:-1]
+
+    decoded = {}
+    for name, i, group in zip(names, first, np.split(order, bounds)):
+        name = name.decode("utf-8", errors="replace").strip()
+        channel = channels[i].decode("utf-8", errors="replace") if channels[i] is not None else None
+        decoded[name] = Series(channel, name, series_color(
+            (properties[i] or b"").decode("ascii", errors="replace")), values[group],
+            offsets[group])
+    return decoded, consumed
+
+
+class FrameDecoder:
+
+    ################ INIT #################
+    # \brief: Constructor of the incremental frame decoder: data are given in chunks
+    #   (e.g. read from a serial port) and frames split between two chunks are kept.
+    #######################################
+    def __init__(self):
+        self._carry = b""
+        self._offset = 0
+        self._parts = {}
+
+    ################ FEED #################
+    # \brief: Function that decodes a chunk of data.
+    # \parameters:
+    #   @param <data>: bytes-like object
+    # \return dictionary {series name: Series} with the frames of the chunk
+    #######################################
+    def feed(self, data):
+        buffer = self._carry + bytes(data) if len(self._carry) > 0 else data
+        decoded, consumed = decode_frames(buffer, self._offset)
+        self._carry = bytes(memoryview(buffer)[consumed:])
+        self._offset += consumed
+        for name, series in decoded.items():
+            self._parts.setdefault(name, []).append(series)
+        return decoded
+
+    ################ RESULT #################
+    # \brief: Function that returns all the frames decoded so far.
+    # \return dictionary {series name: Series}
+    #########################################
+    def result(self):
+        return {name: Series(parts[0].channel, name, parts[0].color,
+                             np.concatenate([part.values for part in parts]),
+                             np.concatenate([part.offsets for part in parts]))
+                for name, parts in self._parts.items()}
+
+
+################ DECODE CAPTURE #################
+# \brief: Function that decodes the frames of a serial capture file (memory mapped).
+# \parameters:
+#   @param <path>: capture file
+# \return dictionary {series name: Series}
+#################################################
+def decode_capture(path):
+    if(os.path.getsize(path) == 0):
+        return {}
+    with open(path, "rb") as capture:
+        with mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return decode_frames(buffer)[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Decoding of the TimePlot frames of a serial capture")
+    parser.add_argument("capture", help="text file with a serial capture")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    decoded = decode_capture(args.capture)
+    arrays = {}
+    for name, series in decoded.items():
+        print("%s (%s, %s): %d values" % (name, series.channel, series.color,
+                                          len(series.values)))
+        arrays[name + "_values"] = series.values
+        arrays[name + "_offsets"] = series.offsets
+    np.savez(os.path.splitext(args.capture)[0] + "_frames.npz", **arrays)
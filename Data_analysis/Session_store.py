@@ -0,0 +1,186 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR THE COLUMNAR SESSION STORE
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module is an optional alternative to the semicolon CSV files used to pass the
+intermediate tables between the scripts (CO2_df_exp_mean.csv, PCB_df_delta.csv,
+PCB_df_normalized.csv, Normality.csv, WCX_Device_10.csv, merged tables, ...).
+
+Tables are stored in Feather (Arrow IPC, default) or Parquet format with typed float64
+columns. The "START" row that marks the start of the rebreathing maneuver in the CSV
+files is not stored as a row: its index is saved in the table metadata and, when the
+table is read, it is restored in df.attrs["start_rebreathing"]. Row labels are the same
+the table would have when read from the CSV file (the label of the START row is
+skipped), so that indexes and offsets computed by the analysis scripts do not change.
+
+Feather files are memory mapped, so float columns are read without copies. A CSV file
+with the usual layout is still written next to the binary one for compatibility.
+
+The module requires pyarrow (pip install pyarrow).
+------------------------------------------------------------------------------------------
+'''
+
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+
+FORMATS = {"feather": ".feather", "parquet": ".parquet"}
+START_KEY = b"start_rebreathing"
+
+
+def _check_pyarrow():
+    if(pa is None):
+        raise ImportError(
+            "The columnar session store requires pyarrow (pip install pyarrow)")
+
+
+################ SPLIT START MARKER #################
+# \brief: Function that removes the "START" row from a table and converts the columns
+#   to float where possible.
+# \parameters:
+#   @param <df>: pandas DataFrame, with or without the "START" row
+# \return (DataFrame without the START row, index of the START row or None)
+#####################################################
+def split_start_marker(df):
+    start_rebreathing = df.attrs.get("start_rebreathing")
+    if(start_rebreathing is None):
+        is_start = (df.astype(str) == "START").any(axis=1).values
+        if(is_start.any()):
+            start_rebreathing = int(np.flatnonzero(is_start)[0])
+            df = df.iloc[np.flatnonzero(~is_start)]
+
+    columns = {}
+    for column in df.columns:
+        try:
+            columns[str(column)] = df[column].to_numpy(dtype=np.float64)
+        except (ValueError, TypeError):
+            columns[str(column)] = df[column].astype(str).to_numpy()
+    return pd.DataFrame(columns), start_rebreathing
+
+
+################ WRITE TABLE #################
+# \brief: Function that writes a table in the columnar store (and in CSV format).
+# \parameters:
+#   @param <df>: pandas DataFrame, with or without the "START" row
+#   @param <name>: file name without extension
+#   @param <fmt>: "feather" or "parquet"
+#   @param <csv>: if True the CSV file <name>.csv is written as well
+#   @param <index>: if True the index is written in the CSV file (as to_csv does)
+# \return path of the binary file
+##############################################
+def write_table(df, name, fmt="feather", csv=True, index=False):
+    _check_pyarrow()
+    if(fmt not in FORMATS):
+        raise ValueError("Unknown format: %s" % fmt)
+    if(csv):
+        df.to_csv(name + ".csv", sep=';', index=index)
+
+    values, start_rebreathing = split_start_marker(df)
+    arrays = []
+    for column in values.columns:
+        if(values[column].dtype == np.float64):
+            # NaN are kept as NaN (not as null values) to allow zero-copy reads
+            arrays.append(pa.array(values[column].to_numpy(), from_pandas=False))
+        else:
+            arrays.append(pa.array(values[column].to_numpy(), type=pa.string()))
+    metadata = {}
+    if(start_rebreathing is not None):
+        metadata[START_KEY] = str(int(start_rebreathing)).encode()
+    table = pa.Table.from_arrays(
+        arrays, names=list(values.columns), metadata=metadata)
+
+    path = name + FORMATS[fmt]
+    if(fmt == "feather"):
+        feather.write_feather(table, path, compression="uncompressed")
+    else:
+        parquet.write_table(table, path)
+    return path
+
+
+################ READ TABLE #################
+# \brief: Function that reads a table from the columnar store.
+# \parameters:
+#   @param <name>: file name without extension
+#   @param <fmt>: "feather" or "parquet". If None the existing file is used
+# \return pandas DataFrame with float columns; the START index is in
+#   df.attrs["start_rebreathing"] (None if the table has no START row)
+#############################################
+def read_table(name, fmt=None):
+    _check_pyarrow()
+    if(fmt is None):
+        for fmt in FORMATS:
+            if(os.path.exists(name + FORMATS[fmt])):
+                break
+        else:
+            raise FileNotFoundError(
+                "No columnar table found for %s" % name)
+    path = name + FORMATS[fmt]
+    if(fmt == "feather"):
+        table = feather.read_table(path, memory_map=True)
+    else:
+        table = parquet.read_table(path, memory_map=True)
+
+    df = table.to_pandas(split_blocks=True)
+    metadata = table.schema.metadata or {}
+    start_rebreathing = None
+    if(START_KEY in metadata):
+        start_rebreathing = int(metadata[START_KEY])
+        # Row labels as in the CSV file, where the START row is present
+        df.index = np.delete(np.arange(len(df) + 1), start_rebreathing)
+    df.attrs["start_rebreathing"] = start_rebreathing
+    return df
+
+
+################ START INDEX #################
+# \brief: Function that returns the index of the START row, from the table metadata
+#   (columnar store) or by looking for the "START" string in a column (CSV files).
+# \parameters:
+#   @param <df>: pandas DataFrame
+#   @param <column>: column where the "START" string is searched
+# \return array with the index of the START row (as df[...].index.values)
+##############################################
+def start_index(df, column):
+    if(df.attrs.get("start_rebreathing") is not None):
+        return np.array([df.attrs["start_rebreathing"]])
+    return df[df[column] == "START"].index.values
+
+
+################ MARKED FRAME #################
+# \brief: Function that rebuilds the CSV layout of a table read from the store, putting
+#   back the "START" row.
+# \parameters:
+#   @param <df>: pandas DataFrame returned by read_table()
+# \return pandas DataFrame with the START row
+###############################################
+def marked_frame(df):
+    start_rebreathing = df.attrs.get("start_rebreathing")
+    if(start_rebreathing is None):
+        return df.reset_index(drop=True)
+    marked = df.astype(object)
+    marked.loc[start_rebreathing] = "START"
+    marked = marked.sort_index().reset_index(drop=True)
+    marked.attrs = {}
+    return marked
+
+
+################ EXPORT CSV #################
+# \brief: Function that exports a table of the store to a semicolon CSV file.
+# \parameters:
+#   @param <name>: file name without extension
+#   @param <fmt>: "feather" or "parquet". If None the existing file is used
+#   @param <index>: if True the index is written in the CSV file
+# \return path of the CSV file
+#############################################
+def export_csv(name, fmt=None, index=False):
+    marked_frame(read_table(name, fmt)).to_csv(
+        name + ".csv", sep=';', index=index)
+    return name + ".csv"
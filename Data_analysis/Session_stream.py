@@ -0,0 +1,174 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR STREAMED SESSION PROCESSING
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module reads a raw session CSV (same layout read by <Dataframe_Creation>) in chunks
+of bounded size, locates the R1/R2 rebreathing marks on the fly and emits the windowed
+statistics incrementally, so that very long (e.g. overnight) recordings can be processed
+without loading the whole file.
+
+Only the CO2, Sentec and Rebreathing_mark columns are parsed. Samples before the R1 mark
+(baseline) are kept until the mark is found, since the PRE windows are anchored at R1 and
+walk backward; after the mark, only the samples of the last incomplete window are kept
+between two chunks. Memory usage therefore depends on the baseline length and on the
+chunk size, not on the length of the recording.
+------------------------------------------------------------------------------------------
+'''
+
+from functools import reduce
+import math
+import numpy as np
+import pandas as pd
+from Window_statistics import multi_resolution_statistics
+
+# Positions of the CO2, Sentec and Rebreathing_mark columns in the raw session CSV
+CO2_COLUMN = 1
+SENTEC_COLUMN = 4
+MARK_COLUMN = 5
+
+
+################ ITER SESSION CHUNKS #################
+# \brief: Generator that reads a raw session CSV in chunks.
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+#   @param <chunksize>: number of rows in each chunk
+# \return yields (index of the first row, CO2 array, Sentec array, R1 positions,
+#   R2 positions), positions are relative to the chunk
+######################################################
+def iter_session_chunks(filename, chunksize=100000):
+    reader = pd.read_csv(filename, sep=";", chunksize=chunksize,
+                         usecols=[CO2_COLUMN, SENTEC_COLUMN, MARK_COLUMN])
+    first_row = 0
+    for chunk in reader:
+        marks = chunk.iloc[:, 2].values
+        yield (first_row, chunk.iloc[:, 0].values.astype(float),
+               chunk.iloc[:, 1].values.astype(float),
+               np.flatnonzero(marks == "R1"), np.flatnonzero(marks == "R2"))
+        first_row += len(chunk)
+
+
+################ STREAM WINDOW STATISTICS #################
+# \brief: Generator that computes the windowed statistics of a raw session while it is
+#   read in chunks. Windows are the same of window_statistics() in <Window_statistics>.
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+#   @param <sample_numbers>: list of window sizes
+#   @param <statistics>: iterable with the names of the statistics
+#   @param <chunksize>: number of rows read at each step
+# \return yields tuples (event, data):
+#   - ("pre", {n: {statistic: (device array, sentec array)}}) once, when R1 is found
+#   - ("post", {n: {statistic: (device array, sentec array)}}) for each block of
+#     complete POST windows
+#   - ("end", {"start": R1 index, "end": R2 index or None, "rows": number of rows})
+###########################################################
+def stream_window_statistics(filename, sample_numbers, statistics=("mean", "median"), chunksize=100000):
+    sample_numbers = sorted(set(int(n) for n in sample_numbers))
+    # POST blocks are cut at multiples of every window size
+    block = reduce(lambda a, b: a*b // math.gcd(a, b), sample_numbers)
+
+    start_rebreathing = None
+    end_rebreathing = None
+    rows = 0
+    pre_device = []
+    pre_sentec = []
+    carry_device = np.empty(0)
+    carry_sentec = np.empty(0)
+
+    for first_row, CO2_data, Sentec_data, marks_start, marks_end in iter_session_chunks(filename, chunksize):
+        rows = first_row + len(CO2_data)
+        if(end_rebreathing is None and len(marks_end) > 0):
+            end_rebreathing = first_row + int(marks_end[0])
+
+        if(start_rebreathing is None):
+            if(len(marks_start) == 0):
+                pre_device.append(CO2_data)
+                pre_sentec.append(Sentec_data)
+                continue
+            # R1 found: PRE windows can be computed
+            position = int(marks_start[0])
+            start_rebreathing = first_row + position
+            pre_device.append(CO2_data[:position+1])
+            pre_sentec.append(Sentec_data[:position+1])
+            yield "pre", _segment_statistics(np.concatenate(pre_device), np.concatenate(pre_sentec),
+                                             start_rebreathing, sample_numbers, statistics, 0)
+            pre_device = []
+            pre_sentec = []
+            CO2_data = CO2_data[position+1:]
+            Sentec_data = Sentec_data[position+1:]
+
+        carry_device = np.concatenate((carry_device, CO2_data))
+        carry_sentec = np.concatenate((carry_sentec, Sentec_data))
+        complete = len(carry_device) // block * block
+        if(complete > 0):
+            yield "post", _segment_statistics(carry_device[:complete], carry_sentec[:complete],
+                                              -1, sample_numbers, statistics, 1)
+            carry_device = carry_device[complete:]
+            carry_sentec = carry_sentec[complete:]
+
+    if(start_rebreathing is None):
+        raise ValueError("%s: R1 rebreathing mark not found" % filename)
+
+    # Last incomplete block: only complete windows of each size are considered
+    if(len(carry_device) > 0):
+        yield "post", _segment_statistics(carry_device, carry_sentec, -1,
+                                          sample_numbers, statistics, 1)
+    yield "end", {"start": start_rebreathing, "end": end_rebreathing, "rows": rows}
+
+
+################ SEGMENT STATISTICS #################
+# \brief: Function that computes the statistics of a PRE or POST segment for both the
+#   devices.
+# \parameters:
+#   @param <device>: CO2 samples of the segment
+#   @param <sentec>: Sentec samples of the segment
+#   @param <start_rebreathing>: index of the R1 mark in the segment (-1 for POST blocks)
+#   @param <sample_numbers>: list of window sizes
+#   @param <statistics>: iterable with the names of the statistics
+#   @param <part>: 0 to return the PRE windows, 1 to return the POST windows
+# \return dictionary {n: {statistic: (device array, sentec array)}}
+#####################################################
+def _segment_statistics(device, sentec, start_rebreathing, sample_numbers, statistics, part):
+    results_device = multi_resolution_statistics(
+        device, start_rebreathing, sample_numbers, statistics)
+    results_sentec = multi_resolution_statistics(
+        sentec, start_rebreathing, sample_numbers, statistics)
+    return {n: {name: (results_device[n][name][part], results_sentec[n][name][part])
+                for name in statistics}
+            for n in sample_numbers}
+
+
+################ COLLECT WINDOW STATISTICS #################
+# \brief: Function that consumes stream_window_statistics() and links the PRE and POST
+#   arrays (same results of multi_resolution_statistics() on the whole recording).
+# \parameters:
+#   @param <filename>: path of the raw session CSV
+#   @param <sample_numbers>: list of window sizes
+#   @param <statistics>: iterable with the names of the statistics
+#   @param <chunksize>: number of rows read at each step
+# \return (device results, sentec results, start rebreathing index, end rebreathing
+#   index), results are dictionaries {n: {statistic: (pre array, post array)}}
+############################################################
+def collect_window_statistics(filename, sample_numbers, statistics=("mean", "median"), chunksize=100000):
+    pre = None
+    post = []
+    for event, data in stream_window_statistics(filename, sample_numbers, statistics, chunksize):
+        if(event == "pre"):
+            pre = data
+        elif(event == "post"):
+            post.append(data)
+        else:
+            info = data
+
+    results_device = {}
+    results_sentec = {}
+    for n in pre:
+        results_device[n] = {}
+        results_sentec[n] = {}
+        for name in statistics:
+            results_device[n][name] = (pre[n][name][0], np.concatenate(
+                [np.empty(0)] + [block[n][name][0] for block in post]))
+            results_sentec[n][name] = (pre[n][name][1], np.concatenate(
+                [np.empty(0)] + [block[n][name][1] for block in post]))
+    return results_device, results_sentec, info["start"], info["end"]
@@ -0,0 +1,219 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR THE STATE TIMELINE
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module rebuilds the states of the firmware (4_Codice_per_PCB_Interrupt) from a
+serial capture, so that the analyses can select the MISURA phase (or drop the segments
+with warnings) without the manual R1/R2 marks and without reading the text again.
+
+The capture is scanned once (memory mapped) for the events that tell the state:
+    - "Entering calibration process" and Ambiente frames         -> CALIBRAZIONE
+    - Tfilo frames                                               -> RISCALDAMENTO
+    - "Stop riscaldamento" (heating stopped with the button)     -> START
+    - "Start of C02 measuring process" and CO2Sangue frames      -> MISURA
+    - "The wire is too hot!65%"                                  -> OVERHEAT warning
+Ambiente, Tfilo and CO2Sangue frames are sent once per second, so the number of these
+frames before an event gives the second of the session.
+
+The index has two structured arrays (see INTERVAL_DTYPE), saved to
+<capture>_timeline.npz and read again while the capture is not modified:
+    - intervals: state, start and end as byte offsets in the capture and as seconds
+    - warnings: warnings of consecutive seconds merged in a single segment
+select() returns the mask of samples (byte offsets, e.g. Series.offsets of
+decode_capture() in <Serial_protocol>, or seconds) in the chosen states.
+
+\Parameters: (command line)
+    @param <captures>: text files with serial captures. The timeline is printed and
+            saved to <capture>_timeline.npz.
+    @param <--rebuild>: scan the captures even if the index is up to date.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import mmap
+import os
+import re
+import numpy as np
+from Telemetry_binary import START, CALIBRAZIONE, RISCALDAMENTO, MISURA, STATES
+
+OVERHEAT = 0
+WARNINGS = {OVERHEAT: "OVERHEAT"}
+
+# One group for each event, in the order of EVENT_STATES
+EVENT_PATTERN = re.compile(
+    rb"(Entering calibration process)|(Stop riscaldamento)|(The wire is too hot!65%)|"
+    rb"(Start of C02 measuring process)|"
+    rb"\{TIMEPLOT[^{}|]*\|D\|\s*(?:(Ambiente ppm)|(Tfilo\[C\])|(CO2Sangue))\s*[:|]")
+# State given by each group (-1: warning)
+EVENT_STATES = np.array([-1, CALIBRAZIONE, START, -1, MISURA, CALIBRAZIONE,
+                         RISCALDAMENTO, MISURA])
+WARNING_EVENTS = {3: OVERHEAT}
+# Frames sent once per second
+TICK_EVENTS = (5, 6, 7)
+
+INTERVAL_DTYPE = np.dtype([("state", "u1"), ("start", "i8"), ("end", "i8"),
+                           ("start_second", "i8"), ("end_second", "i8")])
+WARNING_DTYPE = np.dtype([("kind", "u1"), ("start", "i8"), ("end", "i8"),
+                          ("start_second", "i8"), ("end_second", "i8")])
+
+
+################ SCAN EVENTS #################
+# \brief: Function that finds the events of a capture.
+# \parameters:
+#   @param <buffer>: bytes-like object with the serial output
+# \return (byte offsets, event numbers: group of EVENT_PATTERN)
+##############################################
+def scan_events(buffer):
+    events = [(match.start(), match.lastindex) for match in EVENT_PATTERN.finditer(buffer)]
+    if(len(events) == 0):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    offsets, codes = np.array(events, dtype=np.int64).T
+    return offsets, codes
+
+
+################ BUILD TIMELINE #################
+# \brief: Function that builds the intervals of the states and the warning segments.
+# \parameters:
+#   @param <offsets>: byte offsets of the events
+#   @param <codes>: event numbers
+#   @param <size>: size of the capture in bytes (end of the last interval)
+# \return (intervals, warnings): structured arrays with INTERVAL_DTYPE and WARNING_DTYPE
+#################################################
+def build_timeline(offsets, codes, size):
+    ticks = np.isin(codes, TICK_EVENTS)
+    # Second of each event: frames sent before it
+    seconds = np.cumsum(ticks) - ticks
+    total = int(np.count_nonzero(ticks))
+
+    states = EVENT_STATES[codes]
+    has_state = states >= 0
+    state_offsets = offsets[has_state]
+    state_seconds = seconds[has_state]
+    states = states[has_state]
+    change = np.ones(len(states), dtype=bool)
+    change[1:] = states[1:] != states[:-1]
+    first = np.flatnonzero(change)
+    intervals = np.empty(len(first), dtype=INTERVAL_DTYPE)
+    intervals["state"] = states[first]
+    intervals["start"] = state_offsets[first]
+    intervals["end"] = np.append(state_offsets[first[1:]], size)
+    intervals["start_second"] = state_seconds[first]
+    intervals["end_second"] = np.append(state_seconds[first[1:]], total)
+
+    # Warning after the frame of its second: segment from that frame to the next one
+    tick_offsets = np.append(offsets[ticks], size)
+    parts = []
+    for code, kind in WARNING_EVENTS.items():
+        second = seconds[codes == code] - 1
+        if(len(second) == 0):
+            continue
+        second = np.maximum(second, 0)
+        new = np.flatnonzero(np.concatenate(([True], np.diff(second) > 1)))
+        part = np.empty(len(new), dtype=WARNING_DTYPE)
+        part["kind"] = kind
+        part["start_second"] = second[new]
+        part["end_second"] = np.append(second[new[1:] - 1], second[-1]) + 1
+        part["start"] = tick_offsets[np.minimum(part["start_second"], total)]
+        part["end"] = tick_offsets[np.minimum(part["end_second"], total)]
+        parts.append(part)
+    warnings = np.concatenate(parts) if len(parts) > 0 else np.empty(0, dtype=WARNING_DTYPE)
+    return intervals, np.sort(warnings, order="start")
+
+
+################ TIMELINE PATH #################
+# \brief: Function that returns the path of the index of a capture.
+################################################
+def timeline_path(capture):
+    return os.path.splitext(capture)[0] + "_timeline.npz"
+
+
+################ INDEX CAPTURE #################
+# \brief: Function that returns the timeline of a capture: the index saved next to the
+#   capture is used if it is more recent than the capture, otherwise the capture is
+#   scanned and the index is saved.
+# \parameters:
+#   @param <capture>: text file with a serial capture
+#   @param <rebuild>: if True the capture is scanned in any case
+# \return (intervals, warnings)
+################################################
+def index_capture(capture, rebuild=False):
+    path = timeline_path(capture)
+    if(not rebuild and os.path.exists(path) and
+       os.path.getmtime(path) >= os.path.getmtime(capture)):
+        return load_timeline(path)
+
+    size = os.path.getsize(capture)
+    if(size == 0):
+        offsets, codes = scan_events(b"")
+    else:
+        with open(capture, "rb") as source:
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                offsets, codes = scan_events(buffer)
+    intervals, warnings = build_timeline(offsets, codes, size)
+    np.savez(path, intervals=intervals, warnings=warnings)
+    return intervals, warnings
+
+
+def load_timeline(path):
+    with np.load(path) as index:
+        return index["intervals"], index["warnings"]
+
+
+################ INSIDE #################
+# \brief: Function that tells which positions are inside a list of segments.
+# \parameters:
+#   @param <positions>: 1-D array of positions
+#   @param <starts>, <ends>: sorted, not overlapping segments [start, end)
+# \return (boolean mask, index of the segment of each position)
+#########################################
+def _inside(positions, starts, ends):
+    segment = np.searchsorted(starts, positions, side="right") - 1
+    valid = segment >= 0
+    valid[valid] = positions[valid] < ends[segment[valid]]
+    return valid, segment
+
+
+################ SELECT #################
+# \brief: Function that selects the samples in some states.
+# \parameters:
+#   @param <timeline>: (intervals, warnings) returned by index_capture()
+#   @param <positions>: byte offsets of the samples (e.g. Series.offsets) or seconds
+#   @param <states>: states to be kept. Default is MISURA
+#   @param <drop_warnings>: if True the samples in a warning segment are dropped
+#   @param <by>: "offset" or "second", unit of <positions>
+# \return boolean mask
+#########################################
+def select(timeline, positions, states=(MISURA,), drop_warnings=True, by="offset"):
+    if(by not in ("offset", "second")):
+        raise ValueError("Unknown unit: %s" % by)
+    intervals, warnings = timeline
+    start, end = ("start", "end") if by == "offset" else ("start_second", "end_second")
+    positions = np.asarray(positions)
+    keep, segment = _inside(positions, intervals[start], intervals[end])
+    keep[keep] = np.isin(intervals["state"][segment[keep]], states)
+    if(drop_warnings and len(warnings) > 0):
+        keep &= ~_inside(positions, warnings[start], warnings[end])[0]
+    return keep
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Timeline of the states of the device")
+    parser.add_argument("captures", nargs="+", help="text files with serial captures")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="scan the captures even if the index is up to date")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    for capture in args.captures:
+        intervals, warnings = index_capture(capture, args.rebuild)
+        print(capture)
+        for interval in intervals:
+            print("    %-13s %6d - %6d s  (bytes %d - %d)" % (
+                STATES[interval["state"]], interval["start_second"],
+                interval["end_second"], interval["start"], interval["end"]))
+        for warning in warnings:
+            print("    %-13s %6d - %6d s  (bytes %d - %d)" % (
+                WARNINGS[warning["kind"]], warning["start_second"],
+                warning["end_second"], warning["start"], warning["end"]))
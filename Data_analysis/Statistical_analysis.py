@@ -12,6 +12,13 @@ This script is used to perform statistical analysis on data retrieved from scrip
     @param <filename.csv>: at the beginning of the script change the file name to
             associate the running of the script with the desired CSV file. It includes
             processing both for PCB device data and Sentec device data
+    @param <flag_columnar_store>: if 1 the tables are read from (and written to) the
+            columnar session store (see the module <Session_store>) instead of the CSV
+            files. CSV files are still written for compatibility.
+    @param <flag_headless>: if 1 the figures are not displayed: they are written to the
+            directory Figures (see the module <Figure_rendering>), for unattended runs.
+    @param <resampling_workers>: worker processes of the permutation tests and bootstrap
+            intervals (see the module <Resampling_tests>). 0 to run them in this process.
 
 
 In the following section dataframe is imported and statistical analysis are performed:
@@ -21,6 +28,8 @@ In the following section dataframe is imported and statistical analysis are perf
 instant comparing all subjects lobe data and forearm data)
 - Wilcoxon matched pairs test for non parametric distribution (between lobe and forearm
 data from the same subject)
+- Permutation test and bootstrap confidence interval of the lobe - forearm difference (at
+a specific time instant, paired data of all subjects)
 
 ANOVA, PAIRED T-TEST, INDEPENDENT T-TEST CANNOT BE DONE BECAUSE DISTRIBUTION IS NOT NORMAL 
 (see p-value resulting from the normality test)
@@ -38,12 +47,24 @@ import matplotlib.pyplot as plt
 import statistics as stat
 from sklearn import preprocessing
 from scipy import stats
+from Session_store import read_table, write_table, start_index
+from Cohort_statistics import cohort_mean, cohort_sum
+from Rank_tests import kruskal_columns, wilcoxon_rows
+from Resampling_tests import paired_resampling
+from Figure_rendering import use_headless_backend, show_figures
 
 # Importing dataframe
 print("-------------------------------------------------------------------------")
 print("------------------------------- New run ---------------------------------")
 print("-------------------------------------------------------------------------")
 
+flag_columnar_store = 0  # 1 to use the columnar session store
+flag_headless = 0  # 1 to save the figures without displaying them
+resampling_workers = 0  # worker processes of the resampling tests (0: this process)
+
+if(flag_headless):
+    use_headless_backend()
+
 
 '''
 ---------------------------------------------------------------------------------
@@ -52,13 +73,17 @@ DATAFRAME IMPORT
 In the following section dataframes are imported and prepared for data analysis.
 ---------------------------------------------------------------------------------
 '''
-df_pcb = pd.read_csv('CO2_df_10_median_merged.csv', sep=";")
-df_sentec = pd.read_csv('Sentec_df_10_median_merged.csv', sep=";")
+if(flag_columnar_store):
+    df_pcb = read_table('CO2_df_10_median_merged')
+    df_sentec = read_table('Sentec_df_10_median_merged')
+else:
+    df_pcb = pd.read_csv('CO2_df_10_median_merged.csv', sep=";")
+    df_sentec = pd.read_csv('Sentec_df_10_median_merged.csv', sep=";")
 print("\n\nDataframe PCB with START:")
 print(df_pcb)
 
 # Rebreathing index identification
-index_start_rebreathing = df_pcb[df_pcb["28_01L"] == "START"].index.values
+index_start_rebreathing = start_index(df_pcb, "28_01L")
 print("\nIndex start rebreathing: ")
 print(index_start_rebreathing)
 
@@ -77,9 +102,9 @@ print("\n\nBaseline array Sentec: ")
 print(baseline_arr_sentec)
 
 # START row removal
-df_pcb = df_pcb.drop(index_start_rebreathing, axis=0)
+df_pcb = df_pcb.drop(index_start_rebreathing, axis=0, errors='ignore')
 df_pcb = df_pcb.reset_index()
-df_sentec = df_sentec.drop(index_start_rebreathing, axis=0)
+df_sentec = df_sentec.drop(index_start_rebreathing, axis=0, errors='ignore')
 df_sentec = df_sentec.reset_index()
 print("\n\nDataframe PCB without START row:")
 print(df_pcb)
@@ -191,45 +216,14 @@ print(delta_sentec)
 print("------------------------------------------------------------------------------------")
 '''
 
-# Generation of a unique array for aggregated analysis
-arr_sum_device = []
-arr_sum_sentec = []
-arr_sum_device_delta = []
-arr_sum_sentec_delta = []
-arr_sum_device_normalized = []
-arr_sum_sentec_normalized = []
-partial_total_device = 0
-partial_total_sentec = 0
-partial_total_device_delta = 0
-partial_total_sentec_delta = 0
-partial_total_device_normalized = 0
-partial_total_sentec_normalized = 0
-
-for j in range(0, rows, 1):
-    for i in range(0, columns, 1):
-        partial_total_device += round(float(Data_matrix[i][j]), 2)
-        partial_total_sentec += round(float(Data_matrix_sentec[i][j]), 2)
-        partial_total_device_delta += round(float(delta_matrix_pcb[i][j]), 2)
-        partial_total_sentec_delta += round(
-            float(delta_matrix_sentec[i][j]), 2)
-        partial_total_device_normalized += round(
-            float(delta_matrix_pcb_normalized[i][j]), 2)
-        partial_total_sentec_normalized += round(
-            float(delta_matrix_sentec_normalized[i][j]), 2)
-
-    # print(Data_matrix[i][j])
-    arr_sum_device.append(round(partial_total_device/columns, 2))
-    arr_sum_sentec.append(round(partial_total_sentec/columns, 2))
-    arr_sum_device_delta.append(round(partial_total_device_delta/columns, 2))
-    arr_sum_sentec_delta.append(round(partial_total_sentec_delta/columns, 2))
-    arr_sum_device_normalized.append(round(partial_total_device_normalized, 2))
-    arr_sum_sentec_normalized.append(round(partial_total_sentec_normalized, 2))
-    partial_total_device = 0
-    partial_total_sentec = 0
-    partial_total_device_delta = 0
-    partial_total_sentec_delta = 0
-    partial_total_device_normalized = 0
-    partial_total_sentec_normalized = 0
+# Generation of a unique array for aggregated analysis (per-timepoint cohort
+# statistics, see the module <Cohort_statistics>)
+arr_sum_device = cohort_mean(Data_matrix)
+arr_sum_sentec = cohort_mean(Data_matrix_sentec)
+arr_sum_device_delta = cohort_mean(delta_matrix_pcb)
+arr_sum_sentec_delta = cohort_mean(delta_matrix_sentec)
+arr_sum_device_normalized = cohort_sum(delta_matrix_pcb_normalized)
+arr_sum_sentec_normalized = cohort_sum(delta_matrix_sentec_normalized)
 
 '''
 print("\n\nArray of the sum:")
@@ -280,7 +274,10 @@ for i in range(0, len(delta_matrix_pcb), 1):
 print("\n\nP-values for normality: ")
 normality_pvalue_pcb = pd.DataFrame(pvalues_normality)
 print(normality_pvalue_pcb)
-normality_pvalue_pcb.to_csv('Normality.csv', sep=';', index=False)
+if(flag_columnar_store):
+    write_table(normality_pvalue_pcb, 'Normality')
+else:
+    normality_pvalue_pcb.to_csv('Normality.csv', sep=';', index=False)
 
 # Since pvalue for normality D'Agostino test is << 0.05, data are not normally distributed
 
@@ -298,54 +295,23 @@ for all the time instants of the experimental trial.
 
 ---------------------------------------------------------------------------------
 '''
-complete_row_pcb = []
-complete_row_sentec = []
-lobe_row_pcb = []
-lobe_row_sentec = []
-forearm_row_pcb = []
-forearm_row_sentec = []
-
-KruWal_pcb = []
-KruWal_sentec = []
-result_KW_pcb = 0
-result_KW_sentec = 0
+# Subjects by timepoints matrices: lobe data in even rows, forearm data in odd rows
+data_pcb = np.asarray(delta_matrix_pcb, dtype=float)
+data_sentec = np.asarray(delta_matrix_sentec, dtype=float)
 
-check_baseline_count = 0
-
-# Extraction of complete rows and columns associated to lobe and forearm data
-for j in range(0, rows, 1):
+# Check if the baseline array [0, 0, ..., 0] is met. In this case no KW test is performed
+check_baseline = np.all(data_pcb[0::2] == 0, axis=0)
 
-    lobe_row_pcb = []
-    lobe_row_sentec = []
-    forearm_row_pcb = []
-    forearm_row_sentec = []
-    check_baseline_count = 0
-
-    for i in range(0, columns, 1):
-        complete_row_pcb.append(delta_matrix_pcb[i][j])
-        complete_row_sentec.append(delta_matrix_sentec[i][j])
-        if(i % 2 == 0 or i == 0):
-            lobe_row_pcb.append(delta_matrix_pcb[i][j])
-            lobe_row_sentec.append(delta_matrix_sentec[i][j])
-        else:
-            forearm_row_pcb.append(delta_matrix_pcb[i][j])
-            forearm_row_sentec.append(delta_matrix_sentec[i][j])
-
-    # Check if the baseline array [0, 0, ..., 0] is met. In this case no KW test is performed
-    for k in range(0, len(lobe_row_pcb), 1):
-        if(lobe_row_pcb[k] == 0):
-            check_baseline_count += 1
-
-    if(check_baseline_count < len(lobe_row_pcb)):
-        result_KW_pcb = stats.kruskal(lobe_row_pcb, forearm_row_pcb)
-        result_KW_sentec = stats.kruskal(lobe_row_sentec, forearm_row_sentec)
-        KruWal_pcb.append(result_KW_pcb)
-        KruWal_sentec.append(result_KW_sentec)
+# Kruskal Wallis test for all the time instants at once (see the module <Rank_tests>)
+KruWal_pcb = kruskal_columns(data_pcb[0::2, ~check_baseline],
+                             data_pcb[1::2, ~check_baseline])
+KruWal_sentec = kruskal_columns(data_sentec[0::2, ~check_baseline],
+                                data_sentec[1::2, ~check_baseline])
 
 #print("\n\nKruskal Wallis results DEVICE:")
 # print(KruWal_pcb)
 print("\n\nLength Kruskal Wallis results DEVICE:")
-print(len(KruWal_pcb))
+print(len(KruWal_pcb["pvalue"]))
 #print("\n\nKruskal Wallis results SENTEC:")
 # print(KruWal_sentec)
 
@@ -355,7 +321,7 @@ print(KW_df_pcb)
 
 plt.figure(0)
 y1 = KW_df_pcb['pvalue']
-x1 = range(0, len(KruWal_pcb), 1)
+x1 = range(0, len(KruWal_pcb["pvalue"]), 1)
 plt.title("Kruskal Wallis P-value - PCB device")
 plt.plot(x1, y1, 'x-', color="orange", linewidth='2',)
 plt.xlabel('Sample Number')
@@ -368,7 +334,7 @@ plt.legend(['pvalues', 'Start rebreathing',
 
 plt.figure(1)
 y1 = KW_df_sentec['pvalue']
-x1 = range(0, len(KruWal_pcb), 1)
+x1 = range(0, len(KruWal_pcb["pvalue"]), 1)
 plt.title("Kruskal Wallis P-value - Sentec device")
 plt.plot(x1, y1, 'x-', color="blueviolet", linewidth='2',)
 plt.xlabel('Sample Number')
@@ -382,7 +348,7 @@ plt.legend(['pvalues', 'Start rebreathing',
 plt.figure(2)
 y1 = KW_df_pcb['pvalue']
 y2 = KW_df_sentec['pvalue']
-x1 = range(0, len(KruWal_pcb), 1)
+x1 = range(0, len(KruWal_pcb["pvalue"]), 1)
 plt.title("Kruskal Wallis P-value - Comparison")
 plt.plot(x1, y1, 'x-', color="orange", linewidth='2',)
 plt.plot(x1, y2, 'o-', color="blueviolet", linewidth='2',)
@@ -421,45 +387,24 @@ Hypotesis:
 If Pvalue < 0.05, H0 has to be rejected and H1 accepted.
 ---------------------------------------------------------------------------------
 '''
-lobe_pcb = []
-lobe_sentec = []
-forearm_pcb = []
-forearm_sentec = []
-
-Wilcx_pcb = []
-Wilcx_sentec = []
-result_Wcx_pcb = 0
-result_Wcx_sentec = 0
-
-check_baseline_count = 0
-
-# Extraction of complete rows and columns associated to lobe and forearm data
-for j in range(0, columns, 2):
-    lobe_pcb = []
-    lobe_sentec = []
-    forearm_pcb = []
-    forearm_sentec = []
-
-    check_baseline_count = 0
-
-    for i in range(0, rows, 1):
-        if(i != index_start_rebreathing-offset-1):  # baseline not considered
-            lobe_pcb.append(delta_matrix_pcb[j][i])
-            forearm_pcb.append(delta_matrix_pcb[j+1][i])
-            lobe_sentec.append(delta_matrix_sentec[j][i])
-            forearm_sentec.append(delta_matrix_sentec[j+1][i])
-
-    print(lobe_pcb)
-    print(forearm_pcb)
-    result_Wcx_pcb = stats.wilcoxon(lobe_pcb, forearm_pcb)
-    result_Wcx_sentec = stats.wilcoxon(lobe_sentec, forearm_sentec)
-    Wilcx_pcb.append(result_Wcx_pcb)
-    Wilcx_sentec.append(result_Wcx_sentec)
+# Lobe and forearm data of the same subject are in adjacent columns (j, j+1)
+pairs = columns // 2
+baseline_mask = np.arange(rows) != index_start_rebreathing-offset-1  # baseline not considered
+lobe_pcb = data_pcb[0:2*pairs:2, baseline_mask]
+forearm_pcb = data_pcb[1:2*pairs:2, baseline_mask]
+lobe_sentec = data_sentec[0:2*pairs:2, baseline_mask]
+forearm_sentec = data_sentec[1:2*pairs:2, baseline_mask]
+
+print(lobe_pcb)
+print(forearm_pcb)
+# Wilcoxon test for all the subjects at once (see the module <Rank_tests>)
+Wilcx_pcb = wilcoxon_rows(lobe_pcb, forearm_pcb)
+Wilcx_sentec = wilcoxon_rows(lobe_sentec, forearm_sentec)
 
 #print("\n\nKruskal Wallis results DEVICE:")
 # print(KruWal_pcb)
 print("\n\nLength Wilcoxon results DEVICE:")
-print(len(Wilcx_pcb))
+print(len(Wilcx_pcb["pvalue"]))
 
 # Always greater than 0.05, so the H0 hypothesis has to be accepted
 #print("\n\nKruskal Wallis results SENTEC:")
@@ -468,11 +413,60 @@ print(len(Wilcx_pcb))
 Wcx_df_pcb = pd.DataFrame(Wilcx_pcb)
 Wcx_df_sentec = pd.DataFrame(Wilcx_sentec)
 print(Wcx_df_pcb)
-Wcx_df_pcb.to_csv("WCX_Device_10.csv", sep=';', index=False)
+if(flag_columnar_store):
+    write_table(Wcx_df_pcb, 'WCX_Device_10')
+else:
+    Wcx_df_pcb.to_csv("WCX_Device_10.csv", sep=';', index=False)
 
 print("\n\nLength Wilcoxon results SENTEC:")
 print(Wcx_df_sentec)
-Wcx_df_sentec.to_csv("WCX_sentec_10.csv", sep=';', index=False)
+if(flag_columnar_store):
+    write_table(Wcx_df_sentec, 'WCX_sentec_10')
+else:
+    Wcx_df_sentec.to_csv("WCX_sentec_10.csv", sep=';', index=False)
+
+
+'''
+---------------------------------------------------------------------------------
+PERMUTATION TEST AND BOOTSTRAP
+
+Considering a specific time instant, the differences between LOBE and FOREARM data
+of the same subject are used (paired data of all the subjects).
+
+Permutation test (sign flip) of the mean difference, exact for small cohorts, and
+bootstrap confidence interval of the mean difference, for all the time instants at
+once (see the module <Resampling_tests>). No distribution is assumed.
+
+If Pvalue < 0.05, H0 (no difference between lobe and forearm) has to be rejected.
+---------------------------------------------------------------------------------
+'''
+Resampling_pcb = paired_resampling(data_pcb[0:2*pairs:2], data_pcb[1:2*pairs:2],
+                                   seed=0, workers=resampling_workers)
+Resampling_sentec = paired_resampling(data_sentec[0:2*pairs:2], data_sentec[1:2*pairs:2],
+                                      seed=1, workers=resampling_workers)
+print("\n\nPermutation test and bootstrap DEVICE:")
+print(Resampling_pcb)
+print("\n\nPermutation test and bootstrap SENTEC:")
+print(Resampling_sentec)
+if(flag_columnar_store):
+    write_table(Resampling_pcb, 'Resampling_Device_10')
+    write_table(Resampling_sentec, 'Resampling_sentec_10')
+else:
+    Resampling_pcb.to_csv("Resampling_Device_10.csv", sep=';', index=False)
+    Resampling_sentec.to_csv("Resampling_sentec_10.csv", sep=';', index=False)
+
+plt.figure(3)
+x1 = range(0, len(Resampling_pcb), 1)
+plt.title("Permutation test P-value - Comparison")
+plt.plot(x1, Resampling_pcb['pvalue'], 'x-', color="orange", linewidth='2',)
+plt.plot(x1, Resampling_sentec['pvalue'], 'o-', color="blueviolet", linewidth='2',)
+plt.xlabel('Sample Number')
+plt.ylabel('pvalue')
+plt.grid(axis='y')
+plt.axvline(x=index_start_rebreathing-offset-1, color='gold')
+plt.axvline(x=index_start_rebreathing-offset+3, color='coral')
+plt.legend(['PCB device', 'Sentec device',
+           'Start rebreathing', 'End rebreathing'], loc="upper left")
 
 
 '''
@@ -566,4 +560,4 @@ FR_df_sentec = pd.DataFrame(Friedman_sentec)
 print(FR_df_pcb)
 '''
 
-plt.show()
+show_figures(flag_headless, 'Figures', 'Statistical_analysis')
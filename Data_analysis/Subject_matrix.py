@@ -0,0 +1,191 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR THE SUBJECT MATRIX
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the SubjectMatrix class, used by the <Aggregated_data_analysis>
+scripts to hold the merged data of a device (PCB or Sentec) as a 2-D float matrix with
+one row per subject and one column per timepoint (window).
+
+The matrix is built from a merged table (one column per session, "START" row between the
+PRE and POST windows, see <Batch_ingestion>): the baseline of each subject is the value
+before the START row, the START row and the rows with missing values are removed and the
+label of the first remaining row is kept as offset, as done in the analysis scripts. The
+subject labels and the index of the START row are attached to the matrix, so that
+baseline subtraction, normalization, per-timepoint statistics (see <Cohort_statistics>)
+and boxplot inputs are computed with single array operations.
+------------------------------------------------------------------------------------------
+'''
+
+import numpy as np
+import pandas as pd
+from Cohort_statistics import cohort_statistics
+
+
+class SubjectMatrix:
+
+    ################ INIT #################
+    # \brief: Constructor of the subject matrix.
+    # \parameters:
+    #   @param <values>: 2-D array (subjects, timepoints)
+    #   @param <labels>: list of subject labels (e.g. "28_01L")
+    #   @param <start_rebreathing>: index of the START row in the merged table
+    #   @param <offset>: label of the first row of the merged table kept in the matrix
+    #   @param <baseline>: 1-D array with the baseline of each subject
+    #######################################
+    def __init__(self, values, labels, start_rebreathing, offset, baseline):
+        self.values = np.asarray(values)
+        if(self.values.ndim != 2):
+            raise ValueError("values must be a 2-D array (subjects, timepoints)")
+        if(len(labels) != self.values.shape[0] or len(baseline) != self.values.shape[0]):
+            raise ValueError("one label and one baseline value are needed for each subject")
+        self.labels = [str(label) for label in labels]
+        self.start_rebreathing = int(start_rebreathing)
+        self.offset = int(offset)
+        self.baseline = np.asarray(baseline, dtype=self.values.dtype)
+
+    ################ FROM DATAFRAME #################
+    # \brief: Function that builds the subject matrix from a merged table.
+    # \parameters:
+    #   @param <df>: pandas DataFrame, one column per subject, with the "START" row (CSV
+    #           files) or with the START index in df.attrs (columnar store)
+    #   @param <start_rebreathing>: index of the START row (int or the array returned
+    #           by start_index() in <Session_store>)
+    #   @param <dtype>: np.float64 (default) or np.float32
+    # \return SubjectMatrix
+    #################################################
+    @classmethod
+    def from_dataframe(cls, df, start_rebreathing, dtype=np.float64):
+        start_rebreathing = int(np.ravel(start_rebreathing)[0])
+        baseline = [round(float(value), 2)
+                    for value in df.iloc[start_rebreathing-1].values]
+
+        # START row and rows with NaN removal
+        df = df.drop(start_rebreathing, axis=0, errors='ignore').dropna()
+        if(len(df.index) == 0):
+            raise ValueError("no complete rows after the START row removal")
+        offset = int(df.index[0])
+        values = np.ascontiguousarray(df.to_numpy(dtype=dtype).T)
+        return cls(values, list(df.columns), start_rebreathing, offset, baseline)
+
+    @property
+    def subjects(self):
+        return self.values.shape[0]
+
+    @property
+    def samples(self):
+        return self.values.shape[1]
+
+    ################ BASELINE POSITION #################
+    # \brief: Position of the baseline window in the matrix columns (last window before
+    #   the START row, index_start_rebreathing-offset-1 in the analysis scripts).
+    ####################################################
+    @property
+    def baseline_position(self):
+        return self.start_rebreathing - self.offset - 1
+
+    ################ DELTA #################
+    # \brief: Function that subtracts the baseline of each subject.
+    # \parameters:
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    # \return 2-D array (subjects, timepoints)
+    ########################################
+    def delta(self, decimals=None):
+        delta = self.values - self.baseline[:, None]
+        if(decimals is not None):
+            delta = np.round(delta, decimals)
+        return delta
+
+    ################ NORMALIZED #################
+    # \brief: Function that computes the delta values as percentage of the baseline.
+    # \parameters:
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    #   @param <delta_decimals>: rounding of the delta values before the normalization
+    # \return 2-D array (subjects, timepoints)
+    #############################################
+    def normalized(self, decimals=None, delta_decimals=None):
+        normalized = self.delta(delta_decimals) / self.baseline[:, None] * 100
+        if(decimals is not None):
+            normalized = np.round(normalized, decimals)
+        return normalized
+
+    ################ PEAK DELTA #################
+    # \brief: Function that returns the maximal delta value of each subject, from the
+    #   baseline window to the second to last window.
+    # \parameters:
+    #   @param <decimals>: rounding of the results
+    #   @param <delta_decimals>: rounding of the delta values before the maximum
+    # \return 1-D array with one value per subject
+    #############################################
+    def peak_delta(self, decimals=2, delta_decimals=None):
+        delta = self.delta(delta_decimals)[:, self.baseline_position:-1]
+        return np.round(delta.max(axis=1), decimals)
+
+    ################ COHORT #################
+    # \brief: Function that computes the statistics across subjects for each timepoint
+    #   (see cohort_statistics() in the module <Cohort_statistics>).
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    #   @param <statistics>: iterable with the names of the statistics
+    #   @param <percentiles>: iterable with further percentiles (0-100)
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    # \return dictionary {statistic: 1-D array with one value per timepoint}
+    #########################################
+    def cohort(self, data=None, statistics=("mean", "std"), percentiles=(), decimals=2):
+        data = self.values if data is None else data
+        return cohort_statistics(data, statistics, percentiles, decimals)
+
+    ################ MEAN #################
+    # \brief: Function that computes the mean across subjects for each timepoint.
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    # \return 1-D array with one value per timepoint
+    #######################################
+    def mean(self, data=None, decimals=2):
+        return self.cohort(data, ("mean",), decimals=decimals)["mean"]
+
+    ################ TOTAL #################
+    # \brief: Function that computes the sum across subjects for each timepoint.
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    # \return 1-D array with one value per timepoint
+    ########################################
+    def total(self, data=None, decimals=2):
+        return self.cohort(data, ("sum",), decimals=decimals)["sum"]
+
+    ################ STD #################
+    # \brief: Function that computes the sample standard deviation across subjects for
+    #   each timepoint (same definition of statistics.stdev).
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    #   @param <decimals>: rounding of the results. If None no rounding is applied
+    # \return 1-D array with one value per timepoint
+    ######################################
+    def std(self, data=None, decimals=2):
+        return self.cohort(data, ("std",), decimals=decimals)["std"]
+
+    ################ BOXPLOT DATA #################
+    # \brief: Function that returns the data to be passed to plt.boxplot(): a 2-D array
+    #   is drawn as one box for each column, i.e. for each timepoint.
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    #   @param <decimals>: rounding of the data
+    # \return 2-D array (subjects, timepoints)
+    ###############################################
+    def boxplot_data(self, data=None, decimals=2):
+        data = self.values if data is None else np.asarray(data)
+        return np.round(data, decimals)
+
+    ################ TO DATAFRAME #################
+    # \brief: Function that returns a table with one column per subject (same layout of
+    #   the exported CSV files).
+    # \parameters:
+    #   @param <data>: 2-D array (subjects, timepoints). If None the matrix values
+    # \return pandas DataFrame (timepoints, subjects)
+    ###############################################
+    def to_dataframe(self, data=None):
+        data = self.values if data is None else np.asarray(data)
+        return pd.DataFrame(data.T, columns=self.labels)
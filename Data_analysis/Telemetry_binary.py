@@ -0,0 +1,193 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR BINARY TELEMETRY
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module decodes the binary frames sent by the firmware (4_Codice_per_PCB_Interrupt)
+when TELEMETRIA_BINARIA is 1, instead of the MegunoLink text frames:
+
+    0xA5 0x5A | length (21) | payload | Fletcher-16 (sum1, sum2)
+
+The checksum is computed on the length byte and on the payload. The payload is little
+endian (see RECORD_DTYPE): milliseconds from the power on, CO2 (ambient value during the
+calibration, value of the sensor during the measurement, 0 during the heating), delta,
+wire and skin temperatures and state of the state machine (see STATES). A frame is 26
+bytes instead of about 150 bytes of text for a sample.
+
+decode_frames() finds all the frames of a buffer with array operations (sync bytes,
+length and checksum are checked on all the candidates at once) and maps the payloads to
+a NumPy structured array. Bytes that are not part of valid frames (text messages of the
+firmware, noise) are skipped; a frame truncated at the end of the buffer is left to the
+next call (see TelemetryDecoder).
+
+\Parameters: (command line)
+    @param <capture>: binary capture of the serial port. The CO2 samples of the MISURA
+            state are written to <capture>.csv, in the session layout read by
+            <Dataframe_Creation>.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from Batch_ingestion import SESSION_COLUMNS
+
+SYNC = b"\xa5\x5a"
+RECORD_DTYPE = np.dtype([("millis", "<u4"), ("co2", "<i4"), ("delta", "<f4"),
+                         ("tfilo", "<f4"), ("tpelle", "<f4"), ("state", "u1")])
+PAYLOAD_LENGTH = RECORD_DTYPE.itemsize
+# sync (2) + length (1) + payload + checksum (2)
+FRAME_LENGTH = PAYLOAD_LENGTH + 5
+
+# States of the firmware (DEFINE STATI)
+START = 0
+CALIBRAZIONE = 1
+RISCALDAMENTO = 2
+MISURA = 3
+IDLE_S = 4
+STATES = {START: "START", CALIBRAZIONE: "CALIBRAZIONE", RISCALDAMENTO: "RISCALDAMENTO",
+          MISURA: "MISURA", IDLE_S: "IDLE_S"}
+
+
+################ FLETCHER16 #################
+# \brief: Function that computes the Fletcher-16 checksum of many blocks at once. Since
+#   all the sums are taken mod 255, for the bytes b_0 ... b_(n-1) of a block
+#   sum1 = sum(b_i) and sum2 = sum((n - i)*b_i).
+# \parameters:
+#   @param <blocks>: 2-D uint8 array, one block (length byte and payload) per row
+# \return (sum1 array, sum2 array)
+#############################################
+def fletcher16(blocks):
+    blocks = np.asarray(blocks, dtype=np.int64)
+    weights = np.arange(blocks.shape[1], 0, -1)
+    return blocks.sum(axis=1) % 255, (blocks @ weights) % 255
+
+
+################ ENCODE RECORDS #################
+# \brief: Function that builds the frames of the records (as InviaTelemetria()).
+# \parameters:
+#   @param <records>: structured array with RECORD_DTYPE
+# \return bytes
+#################################################
+def encode_records(records):
+    records = np.ascontiguousarray(records, dtype=RECORD_DTYPE)
+    n = len(records)
+    frames = np.empty((n, FRAME_LENGTH), dtype=np.uint8)
+    frames[:, 0:2] = np.frombuffer(SYNC, dtype=np.uint8)
+    frames[:, 2] = PAYLOAD_LENGTH
+    frames[:, 3:3+PAYLOAD_LENGTH] = records.view(np.uint8).reshape(n, PAYLOAD_LENGTH)
+    sum1, sum2 = fletcher16(frames[:, 2:3+PAYLOAD_LENGTH])
+    frames[:, -2] = sum1
+    frames[:, -1] = sum2
+    return frames.tobytes()
+
+
+################ DECODE FRAMES #################
+# \brief: Function that decodes all the frames of a buffer.
+# \parameters:
+#   @param <buffer>: bytes-like object (bytes, bytearray, memoryview, mmap)
+# \return (structured array with RECORD_DTYPE, number of bytes decoded: the bytes after
+#   it may be the beginning of a frame, to be decoded with the next data)
+################################################
+def decode_frames(buffer):
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    n = len(data)
+    if(n < 2):
+        return np.empty(0, dtype=RECORD_DTYPE), 0 if n == 1 and data[0] == SYNC[0] else n
+
+    candidates = np.flatnonzero((data[:-1] == SYNC[0]) & (data[1:] == SYNC[1]))
+    starts = candidates[candidates + FRAME_LENGTH <= n]
+    starts = starts[data[starts + 2] == PAYLOAD_LENGTH]
+    frames = data[starts[:, None] + np.arange(FRAME_LENGTH)]
+    sum1, sum2 = fletcher16(frames[:, 2:3+PAYLOAD_LENGTH])
+    valid = (sum1 == frames[:, -2]) & (sum2 == frames[:, -1])
+    starts = starts[valid]
+    frames = frames[valid]
+
+    # Frames overlapping a previous valid frame (sync bytes inside a payload)
+    if(np.any(np.diff(starts) < FRAME_LENGTH)):
+        keep = np.ones(len(starts), dtype=bool)
+        end = -1
+        for i, start in enumerate(starts):
+            keep[i] = start >= end
+            if(keep[i]):
+                end = start + FRAME_LENGTH
+        frames = frames[keep]
+        starts = starts[keep]
+
+    # A frame not yet complete after the last valid frame is left to the next call
+    last_end = starts[-1] + FRAME_LENGTH if len(starts) > 0 else 0
+    pending = candidates[(candidates >= last_end) & (candidates + FRAME_LENGTH > n)]
+    if(len(pending) > 0):
+        consumed = int(pending[0])
+    else:
+        consumed = n - 1 if data[-1] == SYNC[0] else n
+
+    payload = np.ascontiguousarray(frames[:, 3:3+PAYLOAD_LENGTH])
+    return payload.view(RECORD_DTYPE).reshape(-1), consumed
+
+
+class TelemetryDecoder:
+
+    ################ INIT #################
+    # \brief: Constructor of the incremental decoder: data are given in chunks (e.g. read
+    #   from a serial port) and frames split between two chunks are kept.
+    #######################################
+    def __init__(self):
+        self._carry = b""
+        self._parts = []
+
+    ################ FEED #################
+    # \brief: Function that decodes a chunk of data.
+    # \parameters:
+    #   @param <data>: bytes-like object
+    # \return structured array with the records of the chunk
+    #######################################
+    def feed(self, data):
+        buffer = self._carry + bytes(data) if len(self._carry) > 0 else data
+        records, consumed = decode_frames(buffer)
+        self._carry = bytes(memoryview(buffer)[consumed:])
+        self._parts.append(records)
+        return records
+
+    ################ RESULT #################
+    # \brief: Function that returns all the records decoded so far.
+    #########################################
+    def result(self):
+        if(len(self._parts) == 0):
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(self._parts)
+
+
+################ TO SESSION #################
+# \brief: Function that converts the records of the MISURA state to a session table
+#   (layout read by <Dataframe_Creation>, timestamps in milliseconds).
+# \parameters:
+#   @param <records>: structured array with RECORD_DTYPE
+# \return pandas DataFrame
+#############################################
+def to_session(records):
+    measure = records[records["state"] == MISURA]
+    return pd.DataFrame({SESSION_COLUMNS[0]: measure["millis"],
+                         SESSION_COLUMNS[1]: measure["co2"],
+                         SESSION_COLUMNS[2]: measure["millis"],
+                         SESSION_COLUMNS[3]: np.round(measure["delta"].astype(float), 2),
+                         SESSION_COLUMNS[4]: np.nan,
+                         SESSION_COLUMNS[5]: ""})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decoding of a binary telemetry capture")
+    parser.add_argument("capture", help="binary capture of the serial port")
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    with open(args.capture, "rb") as capture:
+        records, consumed = decode_frames(capture.read())
+    for state, name in STATES.items():
+        print("%s: %d records" % (name, np.count_nonzero(records["state"] == state)))
+    output = os.path.splitext(args.capture)[0] + ".csv"
+    to_session(records).to_csv(output, sep=";", index=False)
+    print("Written: %s" % output)
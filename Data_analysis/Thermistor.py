@@ -0,0 +1,164 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE/SCRIPT FOR THERMISTOR CONVERSION
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module converts the raw ADC counts of the NTC thermistors (FILO_PIN and PELLE_PIN of
+the firmware) to degrees Celsius, with the Beta equation of CalcoloTemp():
+
+    VR = VCC/ADC_MAX*raw            voltage on the divider resistance R
+    RT = (VCC - VR)/(VR/R)          resistance of the thermistor (upper side)
+    T  = 1/(ln(RT/RT0)/B + 1/T0)    T0 = 25 degC, in Kelvin
+
+on whole arrays at once. Parameters (B, RT0, R, VCC, ADC full scale) can be changed to
+convert historic data with a new calibration, and fit_beta() estimates B from reference
+temperatures. For 10 bit and 12 bit ADCs the conversion can be done with a lookup table
+of all the codes (lookup_table() and convert_lut()), i.e. with a single indexing.
+Codes at the ends of the scale (0 and full scale: open or shorted divider) give NaN.
+
+\Parameters: (command line)
+    @param <filename>: CSV file (separator ";") with the raw ADC counts.
+    @param <--columns>: columns to be converted. Default is all the columns.
+    @param <--bits>: resolution of the ADC (10 or 12), used for the full scale and for
+            the lookup table. Default value is 10.
+    @param <--beta>, <--r0>, <--r-series>: thermistor parameters. Default values are the
+            ones of the firmware.
+------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Parameters of the firmware (DEFINE TERMICO)
+RT0 = 100000     # Ohm, thermistor resistance at T0
+BETA = 4250      # K
+VCC = 3.3        # V, supply voltage
+R = 100000       # Ohm, divider resistance
+T0 = 25 + 273.15  # K
+ADC_MAX = 1023   # divisor used by CalcoloTemp() (10 bit ADC)
+KELVIN = 273.15
+
+
+################ FULL SCALE #################
+# \brief: Function that returns the full scale code of an ADC.
+# \parameters:
+#   @param <bits>: resolution of the ADC
+# \return full scale code (1023 for 10 bit, 4095 for 12 bit)
+#############################################
+def full_scale(bits):
+    return 2**int(bits) - 1
+
+
+################ ADC TO RESISTANCE #################
+# \brief: Function that computes the resistance of the thermistor from the raw counts.
+# \parameters:
+#   @param <raw>: array of raw ADC counts
+#   @param <r_series>: divider resistance
+#   @param <vcc>: supply voltage
+#   @param <adc_max>: full scale code
+# \return array of resistances (NaN for codes <= 0 or >= full scale)
+####################################################
+def adc_to_resistance(raw, r_series=R, vcc=VCC, adc_max=ADC_MAX):
+    raw = np.asarray(raw, dtype=np.float64)
+    valid = (raw > 0) & (raw < adc_max)
+    vr = vcc/adc_max*np.where(valid, raw, 1)
+    return np.where(valid, (vcc - vr)/(vr/r_series), np.nan)
+
+
+################ ADC TO CELSIUS #################
+# \brief: Function that converts raw ADC counts to degrees Celsius (CalcoloTemp()).
+# \parameters:
+#   @param <raw>: array of raw ADC counts
+#   @param <beta>: Beta coefficient of the thermistor
+#   @param <r0>: thermistor resistance at t0
+#   @param <t0>: reference temperature in Kelvin
+#   @param <r_series>: divider resistance
+#   @param <vcc>: supply voltage
+#   @param <adc_max>: full scale code
+# \return array of temperatures in degrees Celsius
+#################################################
+def adc_to_celsius(raw, beta=BETA, r0=RT0, t0=T0, r_series=R, vcc=VCC, adc_max=ADC_MAX):
+    rt = adc_to_resistance(raw, r_series, vcc, adc_max)
+    return 1/(np.log(rt/r0)/beta + 1/t0) - KELVIN
+
+
+################ CELSIUS TO ADC #################
+# \brief: Function that computes the (not rounded) ADC counts of a temperature, inverse
+#   of adc_to_celsius().
+# \parameters: see adc_to_celsius()
+# \return array of ADC counts
+#################################################
+def celsius_to_adc(celsius, beta=BETA, r0=RT0, t0=T0, r_series=R, adc_max=ADC_MAX):
+    kelvin = np.asarray(celsius, dtype=np.float64) + KELVIN
+    rt = r0*np.exp(beta*(1/kelvin - 1/t0))
+    return adc_max*r_series/(rt + r_series)
+
+
+################ LOOKUP TABLE #################
+# \brief: Function that computes the temperature of every code of an ADC.
+# \parameters:
+#   @param <bits>: resolution of the ADC (e.g. 10 or 12)
+#   @param <dtype>: type of the table (np.float32 halves the memory)
+#   @param <parameters>: parameters of adc_to_celsius() (beta, r0, t0, r_series, vcc)
+# \return 1-D array with 2**bits temperatures
+###############################################
+def lookup_table(bits=10, dtype=np.float64, **parameters):
+    codes = np.arange(2**int(bits))
+    return adc_to_celsius(codes, adc_max=full_scale(bits), **parameters).astype(dtype)
+
+
+################ CONVERT LUT #################
+# \brief: Function that converts raw ADC counts with a lookup table.
+# \parameters:
+#   @param <raw>: integer array of raw ADC counts
+#   @param <table>: lookup table returned by lookup_table()
+# \return array of temperatures (NaN for codes out of the table)
+##############################################
+def convert_lut(raw, table):
+    raw = np.asarray(raw)
+    if(raw.dtype.kind not in "iu"):
+        raw = np.where(np.isnan(raw), -1, raw).astype(np.int64)
+    valid = (raw >= 0) & (raw < len(table))
+    return np.where(valid, table[np.where(valid, raw, 0)], np.nan)
+
+
+################ FIT BETA #################
+# \brief: Function that estimates the Beta coefficient from raw counts measured at known
+#   temperatures (least squares on 1/T - 1/T0 = ln(RT/RT0)/B).
+# \parameters:
+#   @param <raw>: array of raw ADC counts
+#   @param <celsius>: array of reference temperatures
+#   @param <r0>, <t0>, <r_series>, <vcc>, <adc_max>: see adc_to_celsius()
+# \return Beta coefficient
+###########################################
+def fit_beta(raw, celsius, r0=RT0, t0=T0, r_series=R, vcc=VCC, adc_max=ADC_MAX):
+    x = np.log(adc_to_resistance(raw, r_series, vcc, adc_max)/r0)
+    y = 1/(np.asarray(celsius, dtype=np.float64) + KELVIN) - 1/t0
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    return float(np.dot(x[valid], x[valid])/np.dot(x[valid], y[valid]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Conversion of raw thermistor ADC counts to degrees Celsius")
+    parser.add_argument("filename", help="CSV file with the raw ADC counts")
+    parser.add_argument("--columns", nargs="+", default=None,
+                        help="columns to be converted (default: all)")
+    parser.add_argument("--bits", type=int, default=10,
+                        help="resolution of the ADC (default: 10)")
+    parser.add_argument("--beta", type=float, default=BETA)
+    parser.add_argument("--r0", type=float, default=RT0)
+    parser.add_argument("--r-series", type=float, default=R)
+    args = parser.parse_args()
+
+    print("------------------------------- New run ---------------------------------")
+    df = pd.read_csv(args.filename, sep=";")
+    table = lookup_table(args.bits, beta=args.beta, r0=args.r0, r_series=args.r_series)
+    for column in (args.columns or list(df.columns)):
+        df[column] = np.round(convert_lut(df[column].values, table), 2)
+    output = os.path.splitext(args.filename)[0] + "_celsius.csv"
+    df.to_csv(output, sep=";", index=False)
+    print("Written: %s" % output)
@@ -0,0 +1,305 @@
+'''
+------------------------------------------------------------------------------------------
+                        PYTHON MODULE FOR WINDOWED STATISTICS
+
+Author: Luca Colombo, MSc Student in Biomedical Engineering - Technologies for Electronics
+
+This module contains the windowing engine used by <Dataframe_Creation> to extract the
+averaged and median values of a recording. The recording is split in two segments at the
+start rebreathing index (R1 mark):
+    - PRE segment: samples from the R1 index down to index 1, grouped in windows of
+      <sample_number> samples walking backward from R1 (index 0 is never considered,
+      as in the original loops).
+    - POST segment: samples from R1+1 to the end of the recording, grouped in windows
+      of <sample_number> samples walking forward.
+Incomplete windows at the two ends of the recording are discarded.
+
+Each segment is reshaped into a 2-D NumPy view (one row per window, in chronological
+order) and all the statistics are computed on the rows with a single vectorized call.
+Roundings are the ones of Python round() (see round_decimals()) and the sums of the
+averages are done in the order of the original loops (backward in the PRE segment), so
+that the results are the same of the original script also for non integer data.
+
+When several window sizes are needed (e.g. 10 s, 30 s and 60 s medians), the function
+multi_resolution_statistics() computes all of them from the same array: the recording is
+split in base windows (greatest common divisor of the sizes) and the longer windows are
+built by merging base windows for min, max and std, while mean (sums in the order of the
+original loops) and median are computed on the raw samples of each window.
+------------------------------------------------------------------------------------------
+'''
+
+from functools import reduce
+import math
+import numpy as np
+
+# Statistics available in window_statistics(); std is the sample standard deviation
+# (same definition of statistics.stdev used in the analysis scripts)
+STATISTICS = ("mean", "median", "min", "max", "std")
+
+
+################ WINDOW MATRIX #################
+# \brief: Function that reshapes the PRE and POST segments of a recording into 2-D
+#   views, one row per window. Rows are in chronological order, so that the PRE
+#   matrix does not need to be reversed before being merged with the POST one.
+# \parameters:
+#   @param <data>: 1-D array with the recorded samples
+#   @param <start_rebreathing>: index of the R1 mark. If -1 all the samples are
+#           considered as POST samples (used to process a recording in blocks)
+#   @param <sample_number>: number of samples in each window
+# \return (pre, post) 2-D arrays of shape (windows, sample_number)
+################################################
+def window_matrix(data, start_rebreathing, sample_number):
+    data = np.asarray(data, dtype=float)
+    start_rebreathing = int(start_rebreathing)
+    sample_number = int(sample_number)
+    if(sample_number <= 0):
+        raise ValueError("sample_number must be a positive integer")
+
+    # PRE: indexes 1 ... start_rebreathing, windows anchored at start_rebreathing
+    windows_pre = max(start_rebreathing, 0) // sample_number
+    first_pre = start_rebreathing - windows_pre*sample_number + 1
+    pre = data[first_pre:start_rebreathing+1].reshape(
+        windows_pre, sample_number)
+
+    # POST: indexes start_rebreathing+1 ... end, windows anchored at start_rebreathing+1
+    windows_post = max(len(data) - start_rebreathing - 1, 0) // sample_number
+    last_post = start_rebreathing + 1 + windows_post*sample_number
+    post = data[start_rebreathing+1:last_post].reshape(
+        windows_post, sample_number)
+
+    return pre, post
+
+
+################ ROUND DECIMALS #################
+# \brief: Function that rounds an array as Python round(float(x), decimals), i.e. to the
+#   decimal number nearest to the exact binary value, ties to even. np.round() scales
+#   by 10**decimals and can round the other way (np.round(400.135, 2) = 400.14, while
+#   round(400.135, 2) = 400.13): the rounding error of the scaling is computed exactly
+#   (Dekker product) and used to correct the result.
+# \parameters:
+#   @param <values>: array
+#   @param <decimals>: number of decimals (non negative)
+# \return array of floats
+#################################################
+def round_decimals(values, decimals):
+    values = np.asarray(values, dtype=float)
+    scale = 10.0**int(decimals)
+    magnitude = np.abs(values)
+    scaled = magnitude*scale
+    with np.errstate(invalid="ignore", over="ignore"):
+        # Exact error of magnitude*scale: magnitude*scale = scaled + error
+        high, low = _split(magnitude)
+        scale_high, scale_low = _split(scale)
+        error = (((high*scale_high - scaled) + high*scale_low) + low*scale_high) + low*scale_low
+        whole = np.floor(scaled)
+        # Distance from the half (exact when it can decide the rounding)
+        half = (scaled - whole) - 0.5
+        up = (error > -half) | ((error == -half) & (np.fmod(whole, 2) == 1))
+        rounded = np.copysign((whole + up)/scale, values)
+    # Values with no decimals left (or not finite) are returned unchanged
+    return np.where(np.isfinite(scaled) & (scaled < 2.0**52), rounded, values)
+
+
+################ SPLIT #################
+# \brief: Function that splits floats in two halves of 26 bits (Veltkamp), so that the
+#   products of the halves are exact.
+########################################
+def _split(values):
+    scaled = values*134217729.0  # 2**27 + 1
+    high = scaled - (scaled - values)
+    return high, values - high
+
+
+################ WINDOW SUMS #################
+# \brief: Function that sums the samples of each row one at a time, in the order of the
+#   original loops (same rounding errors of the loop sums).
+# \parameters:
+#   @param <windows>: 2-D array returned by window_matrix()
+#   @param <backward>: if True the samples are summed from the last one
+# \return 1-D array with one sum per window
+##############################################
+def _window_sums(windows, backward=False):
+    total = np.zeros(windows.shape[0])
+    for column in (range(windows.shape[1]-1, -1, -1) if backward else range(windows.shape[1])):
+        total = total + windows[:, column]
+    return total
+
+
+################ REDUCE WINDOWS #################
+# \brief: Function that computes the requested statistics on each row of a window
+#   matrix. Averages are computed on the raw samples, medians on the samples rounded
+#   to 2 decimals; all results are rounded to 2 decimals as in the original script.
+# \parameters:
+#   @param <windows>: 2-D array returned by window_matrix()
+#   @param <statistics>: iterable with the names of the statistics (see STATISTICS)
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+#   @param <backward>: if True the samples of the averages are summed from the last one
+#           (PRE segment)
+# \return dictionary {statistic: 1-D array with one value per window}
+#################################################
+def reduce_windows(windows, statistics=STATISTICS, decimals=2, backward=False):
+    results = {}
+    for name in statistics:
+        if(windows.shape[0] == 0):
+            results[name] = np.empty(0)
+            continue
+        if(name == "mean"):
+            value = _window_sums(windows, backward) / windows.shape[1]
+        elif(name == "median"):
+            if(decimals is None):
+                value = np.median(windows, axis=1)
+            else:
+                value = np.median(round_decimals(windows, decimals), axis=1)
+        elif(name == "min"):
+            value = windows.min(axis=1)
+        elif(name == "max"):
+            value = windows.max(axis=1)
+        elif(name == "std"):
+            if(windows.shape[1] < 2):
+                value = np.full(windows.shape[0], np.nan)
+            else:
+                value = windows.std(axis=1, ddof=1)
+        else:
+            raise ValueError("Unknown statistic: %s" % name)
+
+        if(decimals is not None):
+            value = round_decimals(value, decimals)
+        results[name] = value
+    return results
+
+
+################ WINDOW STATISTICS #################
+# \brief: Function that computes the windowed statistics of a recording, both before
+#   and after the start of the rebreathing maneuver.
+# \parameters:
+#   @param <data>: 1-D array with the recorded samples
+#   @param <start_rebreathing>: index of the R1 mark
+#   @param <sample_number>: number of samples in each window
+#   @param <statistics>: iterable with the names of the statistics (see STATISTICS)
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return dictionary {statistic: (pre array, post array)}
+####################################################
+def window_statistics(data, start_rebreathing, sample_number, statistics=STATISTICS, decimals=2):
+    pre, post = window_matrix(data, start_rebreathing, sample_number)
+    results_pre = reduce_windows(pre, statistics, decimals, backward=True)
+    results_post = reduce_windows(post, statistics, decimals)
+    return {name: (results_pre[name], results_post[name]) for name in statistics}
+
+
+################ MARK START #################
+# \brief: Function that links PRE and POST arrays, putting the "START" string in
+#   between to mark the start of the rebreathing maneuver (same layout of the CSV
+#   files exported by <Dataframe_Creation>).
+# \parameters:
+#   @param <pre>: array of PRE values
+#   @param <post>: array of POST values
+# \return array with the PRE values, "START" and the POST values
+##############################################
+def mark_start(pre, post):
+    return np.concatenate((list(pre) + ["START"], post))
+
+
+################ BASE MOMENTS #################
+# \brief: Function that computes the moments of each base window (sum, min, max and
+#   sum of squared deviations from the window mean) used to build longer windows.
+# \parameters:
+#   @param <windows>: 2-D array of base windows returned by window_matrix()
+# \return dictionary {moment: 1-D array with one value per base window}
+###############################################
+def _base_moments(windows):
+    sums = windows.sum(axis=1)
+    means = sums / max(windows.shape[1], 1)
+    return {"size": windows.shape[1],
+            "sum": sums,
+            "min": windows.min(axis=1, initial=np.inf),
+            "max": windows.max(axis=1, initial=-np.inf),
+            "m2": ((windows - means[:, None])**2).sum(axis=1)}
+
+
+################ MERGE WINDOWS #################
+# \brief: Function that merges groups of <groups> consecutive base windows into longer
+#   windows, combining sums, minima, maxima and sums of squared deviations (parallel
+#   variance formula). For the PRE segment the groups are anchored at the last base
+#   window (the one next to the R1 mark), for the POST segment at the first one.
+# \parameters:
+#   @param <moments>: dictionary returned by _base_moments()
+#   @param <groups>: number of base windows in each merged window
+#   @param <pre>: True for the PRE segment, False for the POST segment
+# \return dictionary with sum, min, max and m2 of the merged windows
+################################################
+def _merge_windows(moments, groups, pre):
+    base = moments["size"]
+    windows = len(moments["sum"])
+    merged = windows // groups
+    if(pre):
+        selection = slice(windows - merged*groups, windows)
+    else:
+        selection = slice(0, merged*groups)
+
+    sums = moments["sum"][selection].reshape(merged, groups)
+    total = sums.sum(axis=1)
+    means = sums / base
+    mean = total / (base*groups)
+    m2 = moments["m2"][selection].reshape(merged, groups)
+    return {"sum": total,
+            "min": moments["min"][selection].reshape(merged, groups).min(axis=1, initial=np.inf),
+            "max": moments["max"][selection].reshape(merged, groups).max(axis=1, initial=-np.inf),
+            "m2": m2.sum(axis=1) + base*((means - mean[:, None])**2).sum(axis=1)}
+
+
+################ MULTI-RESOLUTION STATISTICS #################
+# \brief: Function that computes the windowed statistics of a recording for several
+#   window sizes in a single pass on the same array. Min, max and std of the longer
+#   windows are built from the base windows, means and medians are computed on the
+#   reshaped raw samples (no copy of the recording is needed).
+# \parameters:
+#   @param <data>: 1-D array with the recorded samples
+#   @param <start_rebreathing>: index of the R1 mark
+#   @param <sample_numbers>: iterable with the window sizes (e.g. [10, 30, 60])
+#   @param <statistics>: iterable with the names of the statistics (see STATISTICS)
+#   @param <decimals>: rounding of the results. If None no rounding is applied
+# \return dictionary {sample_number: {statistic: (pre array, post array)}}
+##############################################################
+def multi_resolution_statistics(data, start_rebreathing, sample_numbers, statistics=STATISTICS, decimals=2):
+    data = np.asarray(data, dtype=float)
+    sample_numbers = sorted(set(int(n) for n in sample_numbers))
+    if(len(sample_numbers) == 0 or sample_numbers[0] <= 0):
+        raise ValueError("sample_numbers must contain positive integers")
+    for name in statistics:
+        if(name not in STATISTICS):
+            raise ValueError("Unknown statistic: %s" % name)
+
+    base = reduce(math.gcd, sample_numbers)
+    base_pre, base_post = window_matrix(data, start_rebreathing, base)
+    moments_pre = _base_moments(base_pre)
+    moments_post = _base_moments(base_post)
+
+    results = {}
+    for sample_number in sample_numbers:
+        groups = sample_number // base
+        merged_pre = _merge_windows(moments_pre, groups, True)
+        merged_post = _merge_windows(moments_post, groups, False)
+        raw_pre, raw_post = window_matrix(
+            data, start_rebreathing, sample_number)
+
+        results[sample_number] = {}
+        for name in statistics:
+            segments = []
+            for merged, raw in ((merged_pre, raw_pre), (merged_post, raw_post)):
+                if(name == "mean"):
+                    # Sums in the order of the original loops
+                    value = reduce_windows(raw, ("mean",), None, merged is merged_pre)["mean"]
+                elif(name == "median"):
+                    value = reduce_windows(raw, ("median",), decimals)["median"]
+                elif(name == "min" or name == "max"):
+                    value = merged[name]
+                else:
+                    if(sample_number < 2):
+                        value = np.full(len(merged["m2"]), np.nan)
+                    else:
+                        value = np.sqrt(merged["m2"] / (sample_number - 1))
+                if(decimals is not None):
+                    value = round_decimals(value, decimals)
+                segments.append(value)
+            results[sample_number][name] = tuple(segments)
+    return results
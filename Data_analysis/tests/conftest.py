@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of Data_analysis are imported as in the scripts (from Module import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
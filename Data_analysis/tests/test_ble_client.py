@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from Ble_client import FakeGatt, NotificationBatcher, capture_sessions, encode_value
+
+
+def test_notifications_sent_in_batches():
+    async def run():
+        queue = asyncio.Queue()
+        batcher = NotificationBatcher("A", queue, batch_size=4, batch_interval=10)
+        flusher = asyncio.ensure_future(batcher.run())
+        for value in range(10):
+            batcher.notify(encode_value(value))
+            await asyncio.sleep(0.001)
+        batcher.close()
+        await flusher
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    chunks = asyncio.run(run())
+    assert [len(chunk.values) for chunk in chunks] == [4, 4, 2]
+    assert np.concatenate([chunk.values for chunk in chunks]).tolist() == list(range(10))
+    assert all(chunk.device == "A" and chunk.dropped == 0 for chunk in chunks)
+
+
+def test_full_queue_drops_oldest_values():
+    async def run():
+        queue = asyncio.Queue(1)
+        queue.put_nowait(None)
+        batcher = NotificationBatcher("A", queue, batch_size=1, batch_interval=10,
+                                      max_pending=5)
+        flusher = asyncio.ensure_future(batcher.run())
+        batcher.notify(encode_value(0))
+        await asyncio.sleep(0.01)
+        # The first chunk waits for the queue: the following values are buffered
+        for value in range(1, 11):
+            batcher.notify(encode_value(value))
+        assert queue.get_nowait() is None
+        batcher.close()
+        chunks = []
+        while not flusher.done() or not queue.empty():
+            chunks.append(await queue.get())
+        return batcher, chunks
+
+    batcher, chunks = asyncio.run(run())
+    assert batcher.received == 11 and batcher.dropped == 5
+    assert [chunk.values.tolist() for chunk in chunks] == [[0], [6, 7, 8, 9, 10]]
+    assert [chunk.dropped for chunk in chunks] == [0, 5]
+
+
+def test_unreachable_device_does_not_stop_the_others(tmp_path):
+    transport = FakeGatt()
+    transport.add_device("A", range(400, 450), interval=0)
+    transport.add_device("C", range(500, 530), interval=0)
+    sessions = asyncio.run(capture_sessions(transport, ["A", "X", "C"], str(tmp_path),
+                                            batch_size=8, batch_interval=0.01))
+    results = {name.split("_")[0]: result for name, result in sessions.items()}
+    assert results["A"] == (50, 0, None) and results["C"] == (30, 0, None)
+    assert results["X"][0] == 0 and "X" in results["X"][2]
+    for name, values in (("A", range(400, 450)), ("C", range(500, 530))):
+        path, = tmp_path.glob(name + "_*[0-9].csv")
+        assert pd.read_csv(path, sep=";")["CO2Sange"].tolist() == list(values)
+
+
+def test_values_before_disconnection_written(tmp_path):
+    async def run():
+        transport = FakeGatt()
+        transport.add_device("A", range(100), interval=0.01)
+        capture = asyncio.ensure_future(capture_sessions(transport, ["A"], str(tmp_path),
+                                                         batch_size=4,
+                                                         batch_interval=0.01))
+        await asyncio.sleep(0.2)
+        # Link lost: the device drops the connection
+        connection, = transport._peripherals["A"].connections
+        await transport.disconnect(connection)
+        return await capture
+
+    (rows, dropped, error), = asyncio.run(run()).values()
+    assert error is None and 0 < rows < 100
+    path, = tmp_path.glob("A_*[0-9].csv")
+    assert pd.read_csv(path, sep=";")["CO2Sange"].tolist() == list(range(rows))
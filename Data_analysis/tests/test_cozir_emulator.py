@@ -0,0 +1,22 @@
+import numpy as np
+from Cozir_emulator import DeviceEmulator, parse_cozir_reply, synthetic_session
+
+
+def emulated_output(requests):
+    rng = np.random.default_rng(3)
+    ambient, co2 = synthetic_session(rng, pre=20, rebreathing=10, post=40)
+    emulator = DeviceEmulator(ambient, co2, rng)
+    port = emulator.sensor_copy()
+    output = []
+    for second in emulator.seconds():
+        output.append(second)
+        for _ in range(requests):
+            port.request(b"Z\r\n")
+    return output, co2, port
+
+
+def test_sensor_port_does_not_take_device_values():
+    output, co2, port = emulated_output(0)
+    assert emulated_output(2)[0] == output
+    values = [parse_cozir_reply(port.request(b"Z\r\n")) for _ in range(len(co2))]
+    assert values == co2.astype(int).tolist()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from Cpet import CpetTable, cohort_alignment
+from Subject_matrix import SubjectMatrix
+
+
+def test_rows_without_rebreathing_breaths_do_not_corrupt_others():
+    df = pd.DataFrame([["S01", 30, "START", 32, 34, 36, 38, "END", 37],
+                       ["S02", 31, "START", "END", 33, 35, None, None, None],
+                       ["S03", 29, 30, "START", 31, 33, "END", 34, None]])
+    cpet = CpetTable.from_dataframe(df)
+    times = cpet.breath_times()
+    assert np.all(np.isnan(times[1]))
+    assert np.all(np.isfinite(times[[0, 2]][~np.isnan(cpet.values[[0, 2]])]))
+
+    grid = np.arange(-60, 181, 30.0)
+    resampled = cpet.resample(grid)
+    assert np.all(np.isnan(resampled[1]))
+    for row in (0, 2):
+        valid = ~np.isnan(cpet.values[row])
+        expected = np.interp(grid, times[row, valid], cpet.values[row, valid])
+        inside = (grid >= times[row, valid][0]) & (grid <= times[row, valid][-1])
+        np.testing.assert_allclose(resampled[row, inside], expected[inside])
+        assert np.all(np.isnan(resampled[row, ~inside]))
+
+
+def test_missing_markers_and_different_subjects_reported(capsys):
+    df = pd.DataFrame([["S01", 30, "START", 32, 34, 36, 38, "END", 37],
+                       ["S02", 31, 33, 35, 36, None, None, None, None],
+                       ["S03", 29, 30, "START", 31, 33, "END", 34, None]])
+    cpet = CpetTable.from_dataframe(df)
+    assert "S02" in capsys.readouterr().out
+    assert np.all(np.isnan(cpet.breath_times()[1]))
+
+    values = np.arange(20.0).reshape(2, 10)
+    pcb = SubjectMatrix(values, ["A", "B"], 5, 1, values[:, 3])
+    sentec = SubjectMatrix(values + 1, ["A", "B"], 5, 1, values[:, 3] + 1)
+    alignment = cohort_alignment(cpet, pcb, sentec, 30)
+    assert "only the first 2" in capsys.readouterr().out
+    assert list(alignment["cpet"].unique()) == ["S01", "S02"]
+    assert len(alignment) == 2*pcb.samples
+    assert alignment.loc[alignment["cpet"] == "S02", "etco2"].isna().all()
+    assert alignment.loc[alignment["cpet"] == "S01", "etco2"].notna().any()
@@ -0,0 +1,15 @@
+import numpy as np
+from Delay_estimation import stimulus_delays
+
+
+def test_known_onsets_recovered():
+    rng = np.random.default_rng(0)
+    t = np.arange(90)
+    for tau, tolerance in ((1, 0.5), (3, 0.5), (6, 0.5), (10, 1.0)):
+        onsets = rng.integers(13, 31, 100).astype(float)
+        rise = 8*(1 - np.exp(-(t - onsets[:, None])/tau))
+        responses = 40 + np.where(t >= onsets[:, None], rise, 0)
+        responses += rng.normal(0, 0.05, responses.shape)
+        delays, correlation = stimulus_delays(responses)
+        assert np.max(np.abs(delays - onsets)) < tolerance
+        assert np.all(correlation > 0.5)
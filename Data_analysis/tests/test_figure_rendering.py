@@ -0,0 +1,26 @@
+import os
+import Figure_rendering
+from Figure_rendering import use_headless_backend, show_figures, render_figures
+import matplotlib.pyplot as plt
+
+
+def _no_pool(*args, **kwargs):
+    raise AssertionError("worker processes started by default")
+
+
+def test_figures_written_in_calling_process(tmp_path, monkeypatch):
+    use_headless_backend()
+    monkeypatch.setattr(Figure_rendering, "ProcessPoolExecutor", _no_pool)
+    for number in (1, 2):
+        plt.figure(number)
+        plt.plot([0, 1], [number, 0])
+    written = show_figures(1, str(tmp_path), "test")
+    assert len(written) == 2 and all(os.path.isfile(path) for path in written)
+    assert plt.get_fignums() == []
+
+    arguments = dict(x=[0, 1], y=[1, 0], title="", xlabel="", ylabel="", legend=["a"],
+                     legend_location="best", style=None, color="black", linewidth=1,
+                     gridx=None, ygrid=False, start_rebr=0, end_rebr=1)
+    jobs = {"a": dict(arguments, figure_id=3), "b": dict(arguments, figure_id=4)}
+    written = render_figures(jobs, str(tmp_path))
+    assert len(written) == 2 and all(os.path.isfile(path) for path in written)
@@ -0,0 +1,43 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import Running_statistics
+from Running_statistics import RunningWindow, rolling_statistics
+
+
+def heap_entries(running_window):
+    return max(len(heaps._low) + len(heaps._high) for heaps in running_window._heaps.values())
+
+
+def test_heaps_bounded_on_trending_data():
+    rng = np.random.default_rng(0)
+    window = 50
+    ramp = np.arange(20000.0)
+    noisy_rise = 1400 + 0.05*np.arange(20000) + rng.normal(0, 2, 20000)
+    for data in (ramp, -ramp, noisy_rise):
+        running_window = RunningWindow(window, quantiles=(0.25, 0.5, 0.9))
+        largest = 0
+        for value in data:
+            running_window.push(value)
+            largest = max(largest, heap_entries(running_window))
+        assert largest <= 2*window + 2
+
+
+def test_quantiles_as_numpy():
+    rng = np.random.default_rng(1)
+    data = np.round(1400 + np.cumsum(rng.normal(0, 1, 3000)))  # with repeated values
+    running_window = RunningWindow(40, quantiles=(0.25, 0.5, 0.9))
+    results = [running_window.push(value) for value in data][39:]
+    expected = np.quantile(sliding_window_view(data, 40), [0.25, 0.5, 0.9], axis=1)
+    for row, key in zip(expected, ("q0.25", "median", "q0.9")):
+        np.testing.assert_allclose([result[key] for result in results], row)
+
+
+def test_vectorized_blocks_as_whole_view(monkeypatch):
+    rng = np.random.default_rng(2)
+    data = rng.normal(1400, 5, 2000)
+    windows = sliding_window_view(data, 30)
+    monkeypatch.setattr(Running_statistics, "CHUNK_VALUES", 30*7)
+    for mode, whole in (("sliding", windows), ("tumbling", data[:1980].reshape(-1, 30))):
+        results = rolling_statistics(data, 30, (0.1, 0.5), mode, "vectorized")
+        np.testing.assert_array_equal(results["median"], np.median(whole, axis=1))
+        np.testing.assert_array_equal(results["q0.1"], np.quantile(whole, 0.1, axis=1))
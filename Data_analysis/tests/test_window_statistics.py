@@ -0,0 +1,54 @@
+import statistics as stat
+import numpy as np
+from Window_statistics import round_decimals, window_statistics, multi_resolution_statistics
+
+
+################ ORIGINAL LOOPS #################
+# \brief: Mean and median loops of the original <Dataframe_Creation> script.
+#################################################
+def original_loops(data, start_rebreathing, sample_number):
+    means_pre, medians_pre, samples, total = [], [], [], 0
+    for i in range(start_rebreathing, 0, -1):
+        total += data[i]
+        samples.append(round(float(data[i]), 2))
+        if((start_rebreathing-i+1) % sample_number == 0):
+            means_pre.append(round(float(total/sample_number), 2))
+            medians_pre.append(round(float(stat.median(samples)), 2))
+            samples, total = [], 0
+    means_post, medians_post, samples, total = [], [], [], 0
+    for i in range(start_rebreathing+1, len(data), 1):
+        total += data[i]
+        samples.append(round(float(data[i]), 2))
+        if((i-(start_rebreathing+1)+1) % sample_number == 0):
+            means_post.append(round(float(total/sample_number), 2))
+            medians_post.append(round(float(stat.median(samples)), 2))
+            samples, total = [], 0
+    return {"mean": (means_pre[::-1], means_post), "median": (medians_pre[::-1], medians_post)}
+
+
+def test_round_decimals_as_python_round():
+    rng = np.random.default_rng(0)
+    values = np.concatenate((rng.uniform(-2000, 2000, 20000),
+                             np.round(rng.uniform(0, 1000, 20000), 3),
+                             [400.135, 2.675, 0.125, 0.005, -0.005, -0.0, 1e17]))
+    for decimals in (0, 2, 3):
+        expected = [round(float(value), decimals) for value in values]
+        assert round_decimals(values, decimals).tolist() == expected
+    assert np.isnan(round_decimals(np.nan, 2))
+
+
+def test_float_sessions_as_original_loops():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        data = np.round(1400 + np.cumsum(rng.normal(0, 1, 1000)), 3)
+        start_rebreathing = int(rng.integers(100, 500))
+        multi = multi_resolution_statistics(data, start_rebreathing, [10, 30, 60],
+                                            ("mean", "median"))
+        for sample_number in (10, 30, 60):
+            expected = original_loops(data, start_rebreathing, sample_number)
+            single = window_statistics(data, start_rebreathing, sample_number,
+                                       ("mean", "median"))
+            for name in ("mean", "median"):
+                for part in (0, 1):
+                    assert single[name][part].tolist() == expected[name][part]
+                    assert multi[sample_number][name][part].tolist() == expected[name][part]
@@ -49,6 +49,12 @@ NRF52_MBED_ISRTimer ISR_Timer;
 #define VCC 3.3    // Supply voltage
 #define R 100000   // R=100KΩ
 
+//-------------DEFINE TELEMETRIA-------------
+// 1: i dati sono inviati in frame binari (vedi Telemetry_binary.py) invece che con MegunoLink
+#define TELEMETRIA_BINARIA 0
+#define SYNC_1 0xA5
+#define SYNC_2 0x5A
+
 //----------------PIN-----------------
 const int BUTTON_PIN = 3;       // PUSH_BUTTON
 const int RISCALDATORE_PIN = 5; // RISCALDAMENTO
@@ -121,6 +127,21 @@ void Misura(void);
 void TimerHandler(void);           // Gestisce inizio e fine del timer
 void InterruptTimerFunction(void); // ISR collegata al timer ogni secondo
 
+//-------------TELEMETRIA BINARIA-----------------
+/* Frame: SYNC_1 SYNC_2 | lunghezza (21) | payload | Fletcher-16 (sum1, sum2) calcolato su lunghezza e payload.
+ * Payload little endian: millis (uint32), co2 (int32), delta (float), Tfilo (float), Tpelle (float), stato (uint8)
+ */
+struct __attribute__((packed)) Telemetria
+{
+  uint32_t tempo;
+  int32_t co2;
+  float delta;
+  float tfilo;
+  float tpelle;
+  uint8_t stato;
+};
+void InviaTelemetria(int32_t co2);
+
 //-------------MEGUNOLINK FUNCTIONS-----------------
 TimePlot Variabile1("Ambiente"), Variabile2("Tfilo[°C]"), Variabile3("Tpelle[°C]"), Variabile4("CO2 Sangue"), Variabile5("Delta CO2");
 
@@ -191,7 +212,11 @@ void loop()
         {
           j++; // j non dovrebbe essere inizializzato a -1 e non -2 ??? 
           ppm_ambientali = Calibra();
+#if TELEMETRIA_BINARIA
+          InviaTelemetria(ppm_ambientali);
+#else
           Variabile1.SendData("Ambiente ppm", ppm_ambientali, TimePlot::Green); // Sends data to MegunoLink
+#endif
           CO2Ambientale[j] = ppm_ambientali;
   
           if (j == 9)
@@ -280,7 +305,11 @@ void loop()
       {
         flag_temperature = 0;
         Tfilo = CalcoloTemp(analogRead(FILO_PIN)); // Pin analogico A4
+#if TELEMETRIA_BINARIA
+        InviaTelemetria(0);
+#else
         Variabile2.SendData("Tfilo[C]", Tfilo, TimePlot::Red);
+#endif
   
         //      Tpelle=CalcoloTemp(analogRead(PELLE_PIN));
         //      Variabile3.SendData("Tpelle[C]",Tpelle,TimePlot::Blue);
@@ -595,13 +624,17 @@ void Misura()
         digitalCo2 = atoi(buffer);
         // Serial.print(F("\nValore Co2 ppm: ")); Serial.println(digitalCo2);
         // Serial.print(F("\nValore Co2 mmHg: ")); Serial.println(digitalCo2 * 0.077521636);
-        Variabile4.SendData("CO2Sangue", digitalCo2, TimePlot::Black);
         Delta = digitalCo2 - ppm_Ambientali_medio;
+#if TELEMETRIA_BINARIA
+        InviaTelemetria(digitalCo2);
+#else
+        Variabile4.SendData("CO2Sangue", digitalCo2, TimePlot::Black);
         Variabile5.SendData("DeltaCO2", Delta, TimePlot::Blue);
 
         // Invio continuo
         Serial.print(F("\nValore Co2 ppm: "));
         Serial.println(digitalCo2);
+#endif
         // Serial.print(F("\nValore Co2 mmHg: "));Serial.println(digitalCo2*0.077521636);
 
         foundValues = true;
@@ -615,6 +648,28 @@ void Misura()
   }
 }
 
+/* Invio di un frame binario con i valori correnti */
+void InviaTelemetria(int32_t co2)
+{
+  Telemetria record = {millis(), co2, Delta, Tfilo, Tpelle, (uint8_t)stato};
+  const uint8_t *payload = (const uint8_t *)&record;
+  uint8_t lunghezza = sizeof(record);
+  uint16_t sum1 = lunghezza % 255;
+  uint16_t sum2 = sum1;
+
+  for (byte n = 0; n < lunghezza; n++)
+  {
+    sum1 = (sum1 + payload[n]) % 255;
+    sum2 = (sum2 + sum1) % 255;
+  }
+  Serial.write(SYNC_1);
+  Serial.write(SYNC_2);
+  Serial.write(lunghezza);
+  Serial.write(payload, lunghezza);
+  Serial.write((uint8_t)sum1);
+  Serial.write((uint8_t)sum2);
+}
+
 /* Timer settings */
 void TimerHandler()
 {